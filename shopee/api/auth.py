@@ -1,6 +1,8 @@
 import frappe
+from frappe import _
 from shopee.controllers.authorization import generate_auth_link
 from shopee.controllers.authorization import shopee_auth_callback
+from shopee.controllers.company_hierarchy import get_hierarchy, get_hierarchy_nodes
 
 @frappe.whitelist(allow_guest=True)
 def get_authorization_link():
@@ -16,26 +18,12 @@ def handle_auth_callback(auth_code, account_id):
     return shopee_auth_callback(auth_code, account_id)
 
 @frappe.whitelist(allow_guest=True)
-def get_company_hierarchy():
-    # Fetch companies that are authorized
-    companies = frappe.get_all('Company', filters={'is_authorized': 1}, fields=['name', 'parent_company', 'entity_name'])
-    
-    if not companies:
+def get_company_hierarchy(company=None, start=0, page_length=0):
+    """
+    Return the authorized merchant -> shop hierarchy from the cached materialized paths.
+    Pass `company` for a single subtree, or `start`/`page_length` to page top-level companies.
+    """
+    if not get_hierarchy_nodes():
         return {"message": _("No authorized companies found."), "data": []}
 
-    # Build a dictionary for easy lookup
-    company_map = {company['name']: company for company in companies}
-
-    # Create a hierarchical structure from the flat company list
-    hierarchy = []
-    for company in companies:
-        if company['parent_company'] and company['parent_company'] in company_map:
-            parent = company_map[company['parent_company']]
-            if 'children' not in parent:
-                parent['children'] = []
-            parent['children'].append(company)
-        elif not company['parent_company']:  # This is a top-level company
-            hierarchy.append(company)
-
-    # Optionally convert to a more friendly format or add more data manipulation here
-    return hierarchy
\ No newline at end of file
+    return get_hierarchy(company, start, page_length)
@@ -0,0 +1,70 @@
+import json
+import time
+import hashlib
+import threading
+import frappe
+from collections import OrderedDict
+from frappe.utils import cint
+from redis.exceptions import RedisError
+from shopee.controllers.metrics import incr
+
+DEDUP_PREFIX = "shopee:webhook:seen:"
+# Shopee 的重推在数小时内完成，一天的窗口足够
+DEFAULT_DEDUP_TTL = 24 * 3600
+LOCAL_LRU_SIZE = 10000
+
+# (site, digest) -> expiry; 进程内 LRU，挡在 Redis 前面
+_seen = OrderedDict()
+_seen_lock = threading.Lock()
+
+
+def event_digest(data):
+    """
+    Digest identifying one webhook delivery: (code, shop_id/merchant_id, timestamp, payload).
+    """
+    identity = [
+        data.get('code'),
+        data.get('shop_id') or data.get('merchant_id'),
+        data.get('timestamp'),
+        data.get('data')
+    ]
+    return hashlib.sha256(json.dumps(identity, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def is_duplicate(data):
+    """
+    Return True if this event was already accepted within the dedup TTL, otherwise mark it as seen.
+
+    Checks the in-process LRU first, then claims the digest in Redis with SET NX EX.
+    Fails open (treats the event as new) if Redis is unavailable.
+    """
+    digest = event_digest(data)
+    local_key = (frappe.local.site, digest)
+    now = time.time()
+    ttl = cint(frappe.local.conf.get('shopee_webhook_dedup_ttl')) or DEFAULT_DEDUP_TTL
+
+    with _seen_lock:
+        expiry = _seen.get(local_key)
+        if expiry and expiry > now:
+            _seen.move_to_end(local_key)
+            incr('webhook_dedup_hit')
+            return True
+
+    try:
+        cache = frappe.cache()
+        first_seen = cache.set(cache.make_key(f"{DEDUP_PREFIX}{digest}"), 1, nx=True, ex=ttl)
+    except RedisError:
+        first_seen = True
+
+    with _seen_lock:
+        _seen[local_key] = now + ttl
+        _seen.move_to_end(local_key)
+        while len(_seen) > LOCAL_LRU_SIZE:
+            _seen.popitem(last=False)
+
+    if not first_seen:
+        incr('webhook_dedup_hit')
+        return True
+
+    incr('webhook_dedup_miss')
+    return False
@@ -0,0 +1,36 @@
+import frappe
+from frappe import _
+
+
+@frappe.whitelist()
+def print_shipping_labels(shop_id, order_sns, document_type=None):
+    """
+    Request shipping labels for `order_sns` (JSON list) of a shop in the background.
+    The PDFs are attached to the Sales Orders (shopee_shipping_document) once Shopee reports them ready.
+    """
+    frappe.only_for(('System Manager', 'Stock Manager', 'Stock User'))
+    if isinstance(order_sns, str):
+        order_sns = frappe.parse_json(order_sns)
+    if not order_sns:
+        frappe.throw(_('No orders given.'))
+
+    frappe.enqueue('shopee.controllers.shipping_document.prepare_shipping_documents', queue='short',
+                   shop_id=shop_id, order_sns=list(order_sns), document_type=document_type)
+    return {'queued': len(order_sns)}
+
+
+@frappe.whitelist()
+def mass_ship_orders(shop_ids=None, order_sns=None):
+    """
+    Arrange shipment for READY_TO_SHIP orders of `shop_ids` (JSON list; all shops if omitted)
+    or only `order_sns` in a background job. Progress is published to the caller.
+    """
+    frappe.only_for(('System Manager', 'Stock Manager', 'Stock User'))
+    if isinstance(shop_ids, str):
+        shop_ids = frappe.parse_json(shop_ids)
+    if isinstance(order_sns, str):
+        order_sns = frappe.parse_json(order_sns)
+
+    job = frappe.enqueue('shopee.controllers.mass_ship.arrange_shipment', queue='long', timeout=3600,
+                         shop_ids=shop_ids, order_sns=order_sns)
+    return {'job_id': job.id if job else None}
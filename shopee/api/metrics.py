@@ -0,0 +1,40 @@
+import frappe
+from werkzeug.wrappers import Response
+from redis.exceptions import RedisError
+from shopee.controllers.metrics import flush, get_metrics, render_prometheus, metric_field
+from .webhook_queue import get_lanes, lane_key
+from .order_event_batcher import ORDER_BUFFER_KEY
+
+PROMETHEUS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+@frappe.whitelist()
+def prometheus():
+    """
+    Shopee integration metrics in the Prometheus text format.
+
+    Scrape /api/method/shopee.api.metrics.prometheus with a System Manager's API key
+    (Authorization: token <api_key>:<api_secret>).
+    """
+    frappe.only_for('System Manager')
+    flush()
+    return Response(render_prometheus(get_metrics(), collect_gauges()), content_type=PROMETHEUS_CONTENT_TYPE)
+
+
+def collect_gauges():
+    """
+    Current backlog of every webhook lane and of the order event buffer.
+    """
+    cache = frappe.cache()
+    lanes = list(get_lanes())
+    try:
+        pipe = cache.pipeline()
+        for lane in lanes:
+            pipe.llen(cache.make_key(lane_key(lane)))
+        pipe.hlen(cache.make_key(ORDER_BUFFER_KEY))
+        *queue_lengths, buffered_orders = pipe.execute()
+    except RedisError:
+        return {}
+    gauges = {metric_field('webhook_queue_length', {'lane': lane}): length for lane, length in zip(lanes, queue_lengths)}
+    gauges['order_events_buffered_orders'] = buffered_orders
+    return gauges
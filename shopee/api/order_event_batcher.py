@@ -0,0 +1,94 @@
+import time
+import frappe
+from frappe.utils import flt
+from shopee.controllers.metrics import incr, timer
+from shopee.controllers.order_sync import sync_orders_by_sn
+
+# 订单状态（3）与物流单号（4）推送在一个短窗口内按 (shop_id, order_sn) 合并，只保留最新状态
+COALESCED_CODES = (3, 4)
+ORDER_BUFFER_KEY = "shopee:order_events:orders"
+TRACKING_BUFFER_KEY = "shopee:order_events:tracking"
+WINDOW_KEY = "shopee:order_events:window"
+FLUSH_JOB_ID = "shopee_order_events_flush"
+DEFAULT_WINDOW = 2  # 秒
+
+
+def buffer_order_events(events):
+    """
+    Add parsed code 3/4 events to the coalescing buffer and open a flush window if none is open.
+
+    Each (shop_id, order_sn) is kept once; for code 4 the latest pushed tracking number wins.
+    """
+    cache = frappe.cache()
+    pipe = cache.pipeline()
+    for data in events:
+        shop_id = data.get('shop_id')
+        order_sn = (data.get('data') or {}).get('ordersn')
+        if not (shop_id and order_sn):
+            continue
+        field = f"{shop_id}:{order_sn}"
+        pipe.hset(cache.make_key(ORDER_BUFFER_KEY), field, 1)
+        if data.get('code') == 4 and data['data'].get('tracking_no'):
+            pipe.hset(cache.make_key(TRACKING_BUFFER_KEY), field, data['data']['tracking_no'])
+    pipe.execute()
+    incr('order_events_buffered', len(events))
+
+    window = flt(frappe.local.conf.get('shopee_order_event_window')) or DEFAULT_WINDOW
+    if cache.set(cache.make_key(WINDOW_KEY), 1, nx=True, px=int(window * 1000)):
+        schedule_flush()
+
+
+def schedule_flush():
+    frappe.enqueue('shopee.api.order_event_batcher.flush_order_events', queue='short',
+                   job_id=FLUSH_JOB_ID, deduplicate=True)
+
+
+def take_buffer():
+    """
+    Atomically read and clear the buffered orders and tracking numbers (and close the window).
+    Returns ({shop_id: [order_sn, ...]}, {shop_id: {order_sn: tracking_no}}).
+    """
+    cache = frappe.cache()
+    pipe = cache.pipeline()
+    pipe.hkeys(cache.make_key(ORDER_BUFFER_KEY))
+    pipe.hgetall(cache.make_key(TRACKING_BUFFER_KEY))
+    pipe.delete(cache.make_key(ORDER_BUFFER_KEY), cache.make_key(TRACKING_BUFFER_KEY), cache.make_key(WINDOW_KEY))
+    fields, tracking, _ = pipe.execute()
+
+    orders_by_shop = {}
+    for field in fields:
+        shop_id, order_sn = frappe.safe_decode(field).split(':', 1)
+        orders_by_shop.setdefault(shop_id, []).append(order_sn)
+
+    tracking_by_shop = {}
+    for field, tracking_no in tracking.items():
+        shop_id, order_sn = frappe.safe_decode(field).split(':', 1)
+        tracking_by_shop.setdefault(shop_id, {})[order_sn] = frappe.safe_decode(tracking_no)
+
+    return orders_by_shop, tracking_by_shop
+
+
+def flush_order_events():
+    """
+    Background job: wait for the open window to close, then sync every buffered order with one
+    batched detail fetch and one bulk write per shop. Repeats while new events keep arriving.
+    Also scheduled periodically as a safety net.
+    """
+    cache = frappe.cache()
+    while True:
+        remaining = cache.pttl(cache.make_key(WINDOW_KEY))
+        if remaining and remaining > 0:
+            time.sleep(remaining / 1000)
+
+        orders_by_shop, tracking_by_shop = take_buffer()
+        if not orders_by_shop:
+            return
+
+        incr('order_events_flushed', sum(len(order_sns) for order_sns in orders_by_shop.values()))
+        for shop_id, order_sns in orders_by_shop.items():
+            try:
+                with timer('webhook_handler_seconds', {'code': 'order_batch'}):
+                    sync_orders_by_sn(shop_id, order_sns, tracking_by_shop.get(shop_id))
+            except Exception:
+                frappe.db.rollback()
+                frappe.log_error(f"{frappe.get_traceback()}\n\nShop {shop_id}: {order_sns}", 'Shopee Order Event Flush Error')
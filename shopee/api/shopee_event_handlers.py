@@ -1,4 +1,12 @@
 import frappe
+from shopee.controllers.order_sync import sync_orders_by_sn
+from shopee.controllers.item_sync import sync_items_by_id
+from shopee.controllers.stock_sync import handle_reserved_stock_push
+from shopee.controllers.shipping_document import handle_document_status_push
+from shopee.controllers.token_cache import invalidate_token
+from shopee.controllers.utils import normalize_id
+from shopee.controllers.audit import log_sync_event
+from shopee.controllers.company_hierarchy import invalidate_hierarchy_cache
 
 def handle_shop_authorization(data):
     # Logic for handling new shop authorization
@@ -7,96 +15,146 @@ def handle_shop_authorization(data):
 def handle_shop_authorization_canceled(data):
     """
     Handle the cancellation of shop and merchant authorizations by updating the authorization
-    status and expiry time in the Company DocType.
+    status and expiry time in the Company DocType and removing their tokens, set-based and in
+    a single transaction.
     """
     try:
         # Initialize lists to hold individual and multiple IDs
-        shop_ids = data.get('shop_id_list', [])
+        shop_ids = [normalize_id(shop_id) for shop_id in data.get('shop_id_list', [])]
         if 'shop_id' in data:
-            shop_ids.append(data['shop_id'])  # Append individual shop ID if present
+            shop_ids.append(normalize_id(data['shop_id']))  # Append individual shop ID if present
 
-        merchant_ids = data.get('merchant_id_list', [])
+        merchant_ids = [normalize_id(merchant_id) for merchant_id in data.get('merchant_id_list', [])]
         if 'merchant_id' in data:
-            merchant_ids.append(data['merchant_id'])  # Append individual merchant ID if present
+            merchant_ids.append(normalize_id(data['merchant_id']))  # Append individual merchant ID if present
 
         # Current datetime for authorization expiry
         current_time = frappe.utils.now_datetime()
 
-        # Process each shop ID
-        for shop_id in shop_ids:
-            update_company_authorization(shop_id, False, current_time)
-            delete_associated_tokens(shop_id, 'shop_id') 
+        update_company_authorization(shop_ids + merchant_ids, False, current_time)
+        deleted_tokens = delete_associated_tokens(shop_ids, merchant_ids)
+        frappe.db.commit()
 
-        # Process each merchant ID
+        for shop_id in shop_ids:
+            invalidate_token('shop_id', shop_id)
         for merchant_id in merchant_ids:
-            update_company_authorization(merchant_id, False, current_time)
-            delete_associated_tokens(merchant_id, 'merchant_id')
+            invalidate_token('merchant_id', merchant_id)
+        invalidate_hierarchy_cache()
+
+        # Record successful processing in the sync audit log
+        for identifier in shop_ids + merchant_ids:
+            log_sync_event('authorization_canceled', identifier)
+        log_sync_event('tokens_deleted', message=f"{deleted_tokens} tokens deleted for shops {shop_ids} "
+                                                 f"and merchants {merchant_ids}")
 
-        # Log successful processing
-        frappe.log_error(f"Deauthorization processed for shops {shop_ids} and merchants {merchant_ids}.", "Shop Authorization Canceled")
-        
     except Exception as e:
+        frappe.db.rollback()
         frappe.log_error(f"Error processing shop authorization canceled webhook: {str(e)}", "Shop Authorization Canceled Error")
 
-def update_company_authorization(identifier, is_authorized, expiry_time):
-    """
-    Update the authorization status and authorization expiry time of a company based on the identifier.
-    """
-    # Assuming identifier could be either shop_id or merchant_id
-    filter_conditions = {"shop_id": identifier} if any(frappe.get_all("Company", filters={"shop_id": identifier})) \
-        else {"merchant_id": identifier}
-    
-    # Get the name of the company using the identifier
-    company_name = frappe.db.get_value("Company", filter_conditions, "name")
-    
-    if company_name:
-        # Use db_set to update fields directly
-        frappe.db.set_value("Company", company_name, "is_authorized", is_authorized)
-        frappe.db.set_value("Company", company_name, "authorization_expiry_time", expiry_time)
-        frappe.db.commit()
-
-def delete_associated_tokens(identifier, identifier_type):
+def update_company_authorization(identifiers, is_authorized, expiry_time):
     """
-    Delete all token records associated with the given identifier (shop_id or merchant_id).
+    Update the authorization status and authorization expiry time of every company whose
+    entity_id (shop_id or merchant_id) is in `identifiers`: one lookup, one UPDATE, no commit.
+    Returns the names of the updated companies.
     """
-    # Delete tokens from the 'Token Management' DocType
-    tokens = frappe.get_all("Token Management", filters={identifier_type: identifier}, fields=["name"])
-    for token in tokens:
-        frappe.delete_doc("Token Management", token['name'], force=1)  # force=1 to delete permanently
-        frappe.db.commit()
-        frappe.log_error(f"Deleted token for {identifier_type}: {identifier}", "Token Deletion Log")
+    if not identifiers:
+        return []
+
+    company_names = frappe.get_all("Company", filters={"entity_id": ["in", identifiers]}, pluck="name")
+    if company_names:
+        frappe.db.set_value("Company", {"name": ["in", company_names]}, {
+            "is_authorized": is_authorized,
+            "authorization_expiry_time": expiry_time
+        })
+    return company_names
+
+def delete_associated_tokens(shop_ids, merchant_ids):
+    """
+    Delete all Shopee Token Management records (and their encrypted tokens) for the given
+    shop and merchant IDs in one statement each, without committing. Returns the number deleted.
+    """
+    if not shop_ids and not merchant_ids:
+        return 0
+
+    Token = frappe.qb.DocType("Shopee Token Management")
+    condition = None
+    if shop_ids:
+        condition = Token.shop_id.isin(shop_ids)
+    if merchant_ids:
+        merchant_condition = Token.merchant_id.isin(merchant_ids)
+        condition = merchant_condition if condition is None else condition | merchant_condition
+
+    token_names = frappe.qb.from_(Token).select(Token.name).where(condition).run(pluck=True)
+    if token_names:
+        frappe.qb.from_(Token).delete().where(Token.name.isin(token_names)).run()
+        Auth = frappe.qb.Table("__Auth")
+        frappe.qb.from_(Auth).delete().where(
+            (Auth.doctype == "Shopee Token Management") & Auth.name.isin(token_names)
+        ).run()
+    return len(token_names)
 
 def handle_order_status_update(data):
-    # Logic for handling updates to order status
-    pass
+    """
+    Order status push (code 3): re-fetch the order through the order sync engine.
+    Normally these events are coalesced by shopee.api.order_event_batcher instead.
+    """
+    order_sn = data.get('data', {}).get('ordersn')
+    if data.get('shop_id') and order_sn:
+        sync_orders_by_sn(data['shop_id'], [order_sn])
 
 def handle_order_tracking_number_update(data):
-    # Logic for handling updates to tracking numbers
-    pass
+    """
+    Tracking number push (code 4): re-fetch the order and store the pushed tracking number.
+    Normally these events are coalesced by shopee.api.order_event_batcher instead.
+    """
+    push = data.get('data', {})
+    order_sn = push.get('ordersn')
+    if data.get('shop_id') and order_sn:
+        sync_orders_by_sn(data['shop_id'], [order_sn], {order_sn: push.get('tracking_no')})
 
 def handle_shipping_document_status(data):
-    # Logic for handling shipping document status updates
-    pass
+    """
+    Shipping document status push (code 15): READY labels are buffered and downloaded in batches.
+    """
+    handle_document_status_push(data.get('shop_id'), data.get('data', {}))
 
 def handle_item_promotion(data):
-    # Logic for handling item promotion updates
-    pass
+    """
+    Item promotion push (code 7): prices may have changed, re-sync the affected items.
+    """
+    if data.get('shop_id'):
+        sync_items_by_id(data['shop_id'], pushed_item_ids(data.get('data', {})))
 
 def handle_promotion_update(data):
     # Logic for handling promotion activity updates
     pass
 
 def handle_reserved_stock_change(data):
-    # Logic for handling reserved stock changes
-    pass
+    """
+    Reserved stock push (code 8): reconcile the model's stock through the stock sync pipeline.
+    """
+    handle_reserved_stock_push(data.get('shop_id'), data.get('data', {}))
 
 def handle_video_upload(data):
     # Logic for handling video upload status
     pass
 
 def handle_banned_item(data):
-    # Logic for handling banned item notifications
-    pass
+    """
+    Banned item push (code 6): re-sync the item so its ERPNext Item is disabled.
+    """
+    if data.get('shop_id'):
+        sync_items_by_id(data['shop_id'], pushed_item_ids(data.get('data', {})))
+
+def pushed_item_ids(push):
+    """
+    Banned item (code 6) and item promotion (code 7) pushes each name one item in `data.item_id`.
+    """
+    item_id = push.get('item_id')
+    if not item_id:
+        frappe.log_error(f"Item push without item_id: {push}", "Shopee Webhook Error")
+        return []
+    return [item_id]
 
 def handle_brand_register_result(data):
     # Logic for handling brand registration results
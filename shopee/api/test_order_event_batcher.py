@@ -0,0 +1,62 @@
+from unittest.mock import patch
+import frappe
+from frappe.tests.utils import FrappeTestCase
+from shopee.api import order_event_batcher
+from shopee.api.order_event_batcher import buffer_order_events, take_buffer, flush_order_events
+
+
+def push(code, shop_id, order_sn, **data):
+    return {'code': code, 'shop_id': shop_id, 'data': dict(data, ordersn=order_sn)}
+
+
+class TestOrderEventBatcher(FrappeTestCase):
+    def setUp(self):
+        take_buffer()
+        schedule_flush = patch.object(order_event_batcher, 'schedule_flush')
+        self.schedule_flush = schedule_flush.start()
+        self.addCleanup(schedule_flush.stop)
+
+    def tearDown(self):
+        take_buffer()
+
+    def test_events_are_coalesced_per_order(self):
+        buffer_order_events([
+            push(3, 1001, 'A', status='READY_TO_SHIP'),
+            push(3, 1001, 'A', status='PROCESSED'),
+            push(4, 1001, 'A', tracking_no='T1'),
+            push(4, 1001, 'A', tracking_no='T2'),
+            push(3, 1001, 'B'),
+            push(3, 1002, 'A'),
+        ])
+
+        orders_by_shop, tracking_by_shop = take_buffer()
+        self.assertEqual(sorted(orders_by_shop['1001']), ['A', 'B'])
+        self.assertEqual(orders_by_shop['1002'], ['A'])
+        # the latest pushed tracking number wins
+        self.assertEqual(tracking_by_shop, {'1001': {'A': 'T2'}})
+        # take_buffer empties the buffer
+        self.assertEqual(take_buffer(), ({}, {}))
+
+    def test_events_without_shop_or_order_are_ignored(self):
+        buffer_order_events([{'code': 3, 'data': {'ordersn': 'A'}}, {'code': 3, 'shop_id': 1001, 'data': {}}])
+        self.assertEqual(take_buffer(), ({}, {}))
+
+    def test_one_flush_per_window(self):
+        buffer_order_events([push(3, 1001, 'A')])
+        buffer_order_events([push(3, 1001, 'B')])
+        self.schedule_flush.assert_called_once()
+
+        # the next event after the window was taken opens a new one
+        take_buffer()
+        buffer_order_events([push(3, 1001, 'C')])
+        self.assertEqual(self.schedule_flush.call_count, 2)
+
+    def test_flush_syncs_each_shop_once(self):
+        buffer_order_events([push(3, 1001, 'A'), push(4, 1001, 'B', tracking_no='T1'), push(3, 1002, 'C')])
+        frappe.cache().delete_value(order_event_batcher.WINDOW_KEY)
+
+        with patch.object(order_event_batcher, 'sync_orders_by_sn') as sync_orders_by_sn:
+            flush_order_events()
+
+        calls = {args[0]: (sorted(args[1]), args[2]) for args, _ in sync_orders_by_sn.call_args_list}
+        self.assertEqual(calls, {'1001': (['A', 'B'], {'B': 'T1'}), '1002': (['C'], None)})
@@ -0,0 +1,78 @@
+from unittest.mock import patch
+import frappe
+from frappe.tests.utils import FrappeTestCase
+from shopee.api import shopee_event_handlers
+from shopee.api.shopee_event_handlers import delete_associated_tokens, update_company_authorization, pushed_item_ids
+from shopee.controllers.token_management import bulk_upsert_tokens
+
+SHOP_ID = '990000001'
+OTHER_SHOP_ID = '990000002'
+MERCHANT_ID = '990000003'
+
+
+def token(identifier, is_merchant=False):
+    return {'identifier': identifier, 'is_merchant': is_merchant, 'access_token': 'access',
+            'refresh_token': 'refresh', 'expire_in': 14400}
+
+
+class TestDeauthorization(FrappeTestCase):
+    def setUp(self):
+        bulk_upsert_tokens([token(SHOP_ID), token(OTHER_SHOP_ID), token(MERCHANT_ID, is_merchant=True)], commit=False)
+
+    def tearDown(self):
+        frappe.db.rollback()
+
+    def token_names(self, id_type, id_value):
+        return frappe.get_all('Shopee Token Management', filters={id_type: id_value}, pluck='name')
+
+    def auth_rows(self, names):
+        Auth = frappe.qb.Table('__Auth')
+        return frappe.qb.from_(Auth).select(Auth.name).where(
+            (Auth.doctype == 'Shopee Token Management') & Auth.name.isin(names)).run(pluck=True)
+
+    def test_tokens_and_encrypted_values_are_deleted(self):
+        deleted = self.token_names('shop_id', SHOP_ID) + self.token_names('merchant_id', MERCHANT_ID)
+        kept = self.token_names('shop_id', OTHER_SHOP_ID)
+
+        self.assertEqual(delete_associated_tokens([SHOP_ID], [MERCHANT_ID]), 2)
+
+        self.assertEqual(self.token_names('shop_id', SHOP_ID), [])
+        self.assertEqual(self.token_names('merchant_id', MERCHANT_ID), [])
+        self.assertEqual(self.auth_rows(deleted), [])
+        self.assertEqual(self.token_names('shop_id', OTHER_SHOP_ID), kept)
+        self.assertTrue(self.auth_rows(kept))
+
+    def test_only_shops_or_nothing(self):
+        self.assertEqual(delete_associated_tokens([], []), 0)
+        self.assertEqual(delete_associated_tokens([OTHER_SHOP_ID], []), 1)
+        self.assertTrue(self.token_names('merchant_id', MERCHANT_ID))
+
+    def test_company_authorization_update(self):
+        self.assertEqual(update_company_authorization([], False, None), [])
+        with patch.object(frappe.db, 'set_value') as set_value, \
+                patch.object(frappe, 'get_all', return_value=['Shop Co', 'Merchant Co']) as get_all:
+            names = update_company_authorization([SHOP_ID, MERCHANT_ID], False, '2026-01-01 00:00:00')
+        self.assertEqual(names, ['Shop Co', 'Merchant Co'])
+        self.assertEqual(get_all.call_args.kwargs['filters'], {'entity_id': ['in', [SHOP_ID, MERCHANT_ID]]})
+        set_value.assert_called_once_with('Company', {'name': ['in', ['Shop Co', 'Merchant Co']]}, {
+            'is_authorized': False, 'authorization_expiry_time': '2026-01-01 00:00:00'})
+
+    def test_cancel_push_collects_single_and_listed_ids(self):
+        with patch.object(shopee_event_handlers, 'update_company_authorization') as update, \
+                patch.object(shopee_event_handlers, 'delete_associated_tokens', return_value=3) as delete, \
+                patch.object(shopee_event_handlers.frappe.db, 'commit'):
+            shopee_event_handlers.handle_shop_authorization_canceled({
+                'shop_id_list': [int(SHOP_ID)], 'shop_id': f"{OTHER_SHOP_ID}.0", 'merchant_id_list': [MERCHANT_ID]})
+
+        self.assertEqual(update.call_args.args[0], [SHOP_ID, OTHER_SHOP_ID, MERCHANT_ID])
+        delete.assert_called_once_with([SHOP_ID, OTHER_SHOP_ID], [MERCHANT_ID])
+
+
+class TestPushedItemIds(FrappeTestCase):
+    def test_item_id(self):
+        self.assertEqual(pushed_item_ids({'item_id': 123}), [123])
+
+    def test_missing_item_id_is_logged(self):
+        with patch.object(frappe, 'log_error') as log_error:
+            self.assertEqual(pushed_item_ids({}), [])
+        log_error.assert_called_once()
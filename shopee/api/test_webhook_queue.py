@@ -0,0 +1,50 @@
+from unittest.mock import patch
+import frappe
+from frappe.tests.utils import FrappeTestCase
+from shopee.api.webhook_queue import get_lanes, lane_for_code, DEFAULT_LANES, DEFAULT_LANE
+
+
+class TestWebhookLanes(FrappeTestCase):
+    def setUp(self):
+        conf = patch.dict(frappe.local.conf)
+        conf.start()
+        self.addCleanup(conf.stop)
+        frappe.local.conf.pop('shopee_webhook_lanes', None)
+        frappe.local.conf.pop('shopee_webhook_batch_size', None)
+
+    def test_default_lanes(self):
+        self.assertEqual(get_lanes(), DEFAULT_LANES)
+        self.assertEqual(lane_for_code(1), 'critical')
+        self.assertEqual(lane_for_code(3), 'orders')
+        self.assertEqual(lane_for_code(15), 'orders')
+        self.assertEqual(lane_for_code(11), 'bulk')
+        # unknown and missing codes go to the default lane
+        self.assertEqual(lane_for_code(99), DEFAULT_LANE)
+        self.assertEqual(lane_for_code(None), DEFAULT_LANE)
+
+    def test_overrides_do_not_leak_into_defaults(self):
+        frappe.local.conf.shopee_webhook_lanes = {'orders': {'concurrency': 5}}
+        self.assertEqual(get_lanes()['orders']['concurrency'], 5)
+        self.assertEqual(get_lanes()['orders']['codes'], [3, 4, 15])
+        self.assertEqual(DEFAULT_LANES['orders']['concurrency'], 2)
+
+    def test_moving_a_code_removes_it_from_its_old_lane(self):
+        frappe.local.conf.shopee_webhook_lanes = {'bulk': {'codes': [10, 11, 3]}}
+        lanes = get_lanes()
+        self.assertEqual(lanes['orders']['codes'], [4, 15])
+        self.assertEqual(lane_for_code(3, lanes), 'bulk')
+
+    def test_new_lane_inherits_default_settings(self):
+        frappe.local.conf.shopee_webhook_lanes = {'promotions': {'codes': [5], 'concurrency': 3}}
+        lanes = get_lanes()
+        self.assertEqual(lanes['promotions']['codes'], [5])
+        self.assertEqual(lanes['promotions']['concurrency'], 3)
+        self.assertEqual(lanes['promotions']['queue'], DEFAULT_LANES[DEFAULT_LANE]['queue'])
+        self.assertEqual(lanes['promotions']['batch_size'], DEFAULT_LANES[DEFAULT_LANE]['batch_size'])
+        self.assertEqual(lane_for_code(5, lanes), 'promotions')
+
+    def test_batch_size_setting_applies_to_the_default_lane(self):
+        frappe.local.conf.shopee_webhook_batch_size = 42
+        lanes = get_lanes()
+        self.assertEqual(lanes[DEFAULT_LANE]['batch_size'], 42)
+        self.assertEqual(lanes['bulk']['batch_size'], DEFAULT_LANES['bulk']['batch_size'])
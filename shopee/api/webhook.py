@@ -3,29 +3,39 @@ import hmac
 import hashlib
 import json
 from shopee.config import get_partner_key
-from .shopee_event_handlers import get_event_handler
+from .webhook_queue import push_event
+from .idempotency import is_duplicate
+from shopee.controllers.metrics import incr, timer
+
+# 接收端只做验签、去重和入队，应在毫秒级完成
+WEBHOOK_INGEST_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1)
 
 @frappe.whitelist(allow_guest=True)
 def shopee_webhook():
+    with timer('webhook_ingest_seconds', buckets=WEBHOOK_INGEST_BUCKETS):
+        return receive_webhook()
+
+def receive_webhook():
     # 获取请求数据和头部中的签名
     request_data = frappe.request.data.decode('utf-8')  # 确保解码
     header_signature = frappe.request.headers.get('Authorization')
 
     # 验证签名
     if not verify_shopee_signature(request_data, header_signature):
+        incr('webhook_invalid_signature')
         frappe.log_error("Invalid signature in Shopee webhook request", "Shopee Webhook Error")
         frappe.throw("Invalid signature", exc=frappe.PermissionError)  # 使用frappe.throw抛出权限错误
 
-    # 签名验证通过后，处理数据
+    # 重复推送（Shopee 重试或多次发送）在入队前直接丢弃
     data = json.loads(request_data)
-    event_type = data.get('code')
-    event_handler = get_event_handler(event_type)
-    if event_handler:
-        event_handler(data)
-    else:
-        frappe.log_error(f"No handler for event type {event_type}", "Shopee Webhook Error")
-
-    return "Webhook processed successfully", 200
+    incr('webhook_received', labels={'code': data.get('code')})
+    if is_duplicate(data):
+        return "Duplicate webhook ignored", 200
+
+    # 签名验证通过后，只入队并立即返回，由后台 worker 批量处理
+    push_event(request_data, data.get('code'))
+
+    return "Webhook received", 200
 
 @frappe.whitelist(allow_guest=True)
 def get_current_url():
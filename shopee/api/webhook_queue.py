@@ -0,0 +1,189 @@
+import json
+import math
+import time
+import frappe
+from frappe.utils import cint
+from frappe.utils.background_jobs import is_job_enqueued
+from .shopee_event_handlers import get_event_handler
+from .order_event_batcher import buffer_order_events, COALESCED_CODES
+from shopee.controllers.metrics import incr, timer
+
+# 已验签、待处理的原始推送（Redis list，按站点和通道区分："<QUEUE_KEY>:<lane>"）
+QUEUE_KEY = "shopee:webhook:events"
+DRAIN_JOB_ID = "shopee_webhook_drain"
+DRAIN_BATCH_SIZE = 100
+
+# 优先级通道：每个通道有独立的 Redis 队列、RQ 队列、并发数（drain 任务数）和批大小。
+# 可通过 site_config 的 shopee_webhook_lanes 覆盖或新增，例如
+#   {"bulk": {"codes": [10, 11, 5], "concurrency": 2}}
+# 未列出的推送代码进入 DEFAULT_LANE。priority 越小越先被定时兜底任务处理。
+DEFAULT_LANES = {
+    'critical': {'codes': [1, 2, 12], 'queue': 'short', 'concurrency': 2, 'batch_size': 20, 'priority': 0},
+    'orders': {'codes': [3, 4, 15], 'queue': 'short', 'concurrency': 2, 'batch_size': 200, 'priority': 1},
+    'default': {'codes': [], 'queue': 'default', 'concurrency': 1, 'batch_size': DRAIN_BATCH_SIZE, 'priority': 2},
+    'bulk': {'codes': [10, 11], 'queue': 'long', 'concurrency': 1, 'batch_size': 500, 'priority': 3},
+}
+DEFAULT_LANE = 'default'
+
+# 防饥饿：单个 drain 任务最多连续处理的秒数，超时后重新入队并让出 worker
+DRAIN_TIME_BUDGET = 20
+
+
+def get_lanes():
+    """
+    Lane settings merged with the site's shopee_webhook_lanes overrides.
+    """
+    lanes = {name: dict(settings) for name, settings in DEFAULT_LANES.items()}
+    if frappe.local.conf.get('shopee_webhook_batch_size'):
+        lanes[DEFAULT_LANE]['batch_size'] = cint(frappe.local.conf.get('shopee_webhook_batch_size'))
+    for name, overrides in (frappe.local.conf.get('shopee_webhook_lanes') or {}).items():
+        lanes.setdefault(name, dict(DEFAULT_LANES[DEFAULT_LANE], codes=[]))
+        lanes[name].update(overrides)
+        if 'codes' in overrides:
+            # 一个代码只属于一个通道
+            for other, settings in lanes.items():
+                if other != name:
+                    settings['codes'] = [code for code in settings['codes'] if code not in overrides['codes']]
+    return lanes
+
+
+def lane_for_code(code, lanes=None):
+    for name, settings in (lanes or get_lanes()).items():
+        if code in settings['codes']:
+            return name
+    return DEFAULT_LANE
+
+
+def lane_key(lane):
+    return f"{QUEUE_KEY}:{lane}"
+
+
+def push_event(payload, code=None):
+    """
+    Append a verified raw webhook payload to its lane's queue and make sure the lane is being drained.
+    """
+    if code is None:
+        code = json.loads(payload).get('code')
+    lane = lane_for_code(code)
+    cache = frappe.cache()
+    pipe = cache.pipeline()
+    pipe.rpush(cache.make_key(lane_key(lane)), payload)
+    backlog = pipe.execute()[0]
+    schedule_drain(lane, backlog)
+
+
+def drain_job_ids(lane, slot):
+    """
+    A slot alternates between two job ids so a drain job can hand over to its own continuation.
+    """
+    job_id = f"{DRAIN_JOB_ID}:{lane}:{slot}"
+    return job_id, f"{job_id}:next"
+
+
+def schedule_drain(lane, backlog=1):
+    """
+    Make sure enough drain jobs run for `lane`: one per batch of backlog, up to the lane's concurrency.
+    """
+    settings = get_lanes()[lane]
+    slots = max(1, min(cint(settings['concurrency']) or 1, math.ceil(backlog / (cint(settings['batch_size']) or 1))))
+    for slot in range(slots):
+        job_ids = drain_job_ids(lane, slot)
+        if not any(is_job_enqueued(job_id) for job_id in job_ids):
+            enqueue_drain(lane, slot, settings)
+
+
+def enqueue_drain(lane, slot, settings, continuation=False):
+    frappe.enqueue('shopee.api.webhook_queue.drain_lane', queue=settings['queue'],
+                   job_id=drain_job_ids(lane, slot)[1 if continuation else 0], deduplicate=True,
+                   lane=lane, slot=slot, continuation=continuation)
+
+
+def pop_events(batch_size, key=None):
+    """
+    Atomically take up to `batch_size` raw payloads from the head of a queue.
+    """
+    cache = frappe.cache()
+    pipe = cache.pipeline()
+    pipe.lrange(cache.make_key(key or QUEUE_KEY), 0, batch_size - 1)
+    pipe.ltrim(cache.make_key(key or QUEUE_KEY), batch_size, -1)
+    payloads, _ = pipe.execute()
+    return [frappe.safe_decode(p) for p in payloads]
+
+
+def drain_lane(lane, slot=0, continuation=False):
+    """
+    Background job: process one lane's queue in batches until it is empty.
+
+    After DRAIN_TIME_BUDGET seconds the job re-enqueues itself and returns, so a flooded lane
+    never holds a worker that other lanes sharing the same RQ queue are waiting for.
+    """
+    lanes = get_lanes()
+    settings = lanes.get(lane) or lanes[DEFAULT_LANE]
+    batch_size = cint(settings['batch_size']) or DRAIN_BATCH_SIZE
+    deadline = time.monotonic() + (cint(settings.get('time_budget')) or DRAIN_TIME_BUDGET)
+
+    with timer('job_seconds', {'job': 'drain_events', 'lane': lane}):
+        while True:
+            payloads = pop_events(batch_size, lane_key(lane))
+            if not payloads:
+                return
+            process_events(payloads)
+            if time.monotonic() > deadline:
+                incr('webhook_drain_yield', labels={'lane': lane})
+                enqueue_drain(lane, slot, settings, continuation=not continuation)
+                return
+
+
+def drain_events(batch_size=None):
+    """
+    Scheduled safety net: kick every lane that still has a backlog (highest priority first),
+    and drain events left in the pre-lane queue.
+    """
+    lanes = get_lanes()
+    cache = frappe.cache()
+    pipe = cache.pipeline()
+    names = sorted(lanes, key=lambda name: cint(lanes[name].get('priority')))
+    for name in names:
+        pipe.llen(cache.make_key(lane_key(name)))
+    for name, backlog in zip(names, pipe.execute()):
+        if backlog:
+            schedule_drain(name, backlog)
+
+    batch_size = batch_size or DRAIN_BATCH_SIZE
+    while True:
+        payloads = pop_events(batch_size)
+        if not payloads:
+            return
+        process_events(payloads)
+
+
+def process_events(payloads):
+    """
+    Dispatch each raw payload to its handler in EVENT_HANDLER_MAP.
+    Order status/tracking events (COALESCED_CODES) are handed to the coalescing buffer instead.
+    A failing event is logged with its payload and does not stop the rest of the batch.
+    """
+    order_events = []
+    for payload in payloads:
+        event_type = None
+        try:
+            data = json.loads(payload)
+            event_type = data.get('code')
+            if event_type in COALESCED_CODES:
+                order_events.append(data)
+                continue
+            event_handler = get_event_handler(event_type)
+            if event_handler:
+                with timer('webhook_handler_seconds', {'code': event_type}):
+                    event_handler(data)
+            else:
+                frappe.log_error(f"No handler for event type {event_type}", "Shopee Webhook Error")
+            frappe.db.commit()
+            incr('webhook_processed', labels={'code': event_type, 'result': 'success'})
+        except Exception:
+            frappe.db.rollback()
+            incr('webhook_processed', labels={'code': event_type, 'result': 'failure'})
+            frappe.log_error(f"{frappe.get_traceback()}\n\nPayload: {payload}", "Shopee Webhook Processing Error")
+
+    if order_events:
+        buffer_order_events(order_events)
@@ -0,0 +1,186 @@
+"""
+Local stand-in for the Shopee Open Platform, used by the benchmark suite.
+
+Implements the endpoints the app calls during onboarding and token refresh with configurable
+latency and error rates. Does not import frappe, so it can also run standalone:
+
+    python -m shopee.benchmarks.mock_server --port 8765 --latency-ms 80 --error-rate 0.01 --shops 200
+"""
+import json
+import time
+import random
+import argparse
+import threading
+from collections import Counter
+from urllib.parse import urlparse, parse_qs
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+# 基准测试使用的 ID 区间，避免与真实店铺冲突
+BASE_SHOP_ID = 9_000_000_000
+BASE_MERCHANT_ID = 8_000_000_000
+
+
+class MockShopeeServer:
+    """
+    Threaded HTTP server answering like Shopee.
+
+    - latency_ms / jitter_ms: per-request delay
+    - error_rate: share of requests answered with HTTP 500
+    - throttle_rate: share of requests answered with error_too_many_request
+    - shops / merchants: how many ids /auth/token/get returns
+    """
+    def __init__(self, host='127.0.0.1', port=0, latency_ms=50, jitter_ms=10, error_rate=0.0,
+                 throttle_rate=0.0, shops=10, merchants=1, expire_in=14400):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.shops = shops
+        self.merchants = merchants
+        self.expire_in = expire_in
+        self.requests = Counter()
+        self._lock = threading.Lock()
+        self._token_seq = 0
+        self.httpd = ThreadingHTTPServer((host, port), self._make_handler())
+        self.httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def next_token(self, prefix):
+        with self._lock:
+            self._token_seq += 1
+            return f"{prefix}{self._token_seq:012d}"
+
+    def routes(self):
+        return {
+            '/api/v2/auth/token/get': self.token_get,
+            '/api/v2/auth/access_token/get': self.access_token_get,
+            '/api/v2/shop/get_shop_info': self.shop_info,
+            '/api/v2/merchant/get_merchant_info': self.merchant_info,
+        }
+
+    def token_get(self, query, body):
+        return {
+            'error': '', 'message': '', 'request_id': self.next_token('req'),
+            'access_token': self.next_token('access'),
+            'refresh_token': self.next_token('refresh'),
+            'expire_in': self.expire_in,
+            'merchant_id_list': [BASE_MERCHANT_ID + i for i in range(self.merchants)],
+            'shop_id_list': [BASE_SHOP_ID + i for i in range(self.shops)],
+        }
+
+    def access_token_get(self, query, body):
+        return {
+            'error': '', 'message': '', 'request_id': self.next_token('req'),
+            'access_token': self.next_token('access'),
+            'refresh_token': self.next_token('refresh'),
+            'expire_in': self.expire_in,
+            'shop_id': body.get('shop_id'), 'merchant_id': body.get('merchant_id'),
+        }
+
+    def shop_info(self, query, body):
+        shop_id = int(query.get('shop_id', ['0'])[0])
+        now = int(time.time())
+        return {
+            'error': '', 'message': '', 'request_id': self.next_token('req'),
+            'shop_name': f"Bench Shop {shop_id}", 'region': 'SG', 'status': 'NORMAL',
+            'shop_cbsc': 'CNSC', 'is_sip': False, 'shop_fulfillment_flag': 'Pure - 3PF Shop',
+            'merchant_id': BASE_MERCHANT_ID if self.merchants else None,
+            'auth_time': now, 'expire_time': now + 365 * 24 * 3600,
+        }
+
+    def merchant_info(self, query, body):
+        now = int(time.time())
+        return {
+            'error': '', 'message': '', 'request_id': self.next_token('req'),
+            'merchant_name': 'Bench Merchant', 'merchant_region': 'CN', 'merchant_currency': 'CNY',
+            'is_cnsc': True, 'is_upgraded_cbsc': True,
+            'auth_time': now, 'expire_time': now + 365 * 24 * 3600,
+        }
+
+    def _make_handler(server):
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'  # keep-alive, like the real gateway
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                self.handle_request({})
+
+            def do_POST(self):
+                length = int(self.headers.get('Content-Length') or 0)
+                raw = self.rfile.read(length) if length else b''
+                self.handle_request(json.loads(raw or b'{}'))
+
+            def handle_request(self, body):
+                parsed = urlparse(self.path)
+                with server._lock:
+                    server.requests[parsed.path] += 1
+
+                delay = max(0, server.latency_ms + random.uniform(-server.jitter_ms, server.jitter_ms))
+                time.sleep(delay / 1000)
+
+                route = server.routes().get(parsed.path)
+                roll = random.random()
+                if route is None:
+                    status, payload = 404, {'error': 'error_not_found', 'message': parsed.path}
+                elif roll < server.error_rate:
+                    status, payload = 500, {'error': 'error_server', 'message': 'mock server error'}
+                elif roll < server.error_rate + server.throttle_rate:
+                    status, payload = 429, {'error': 'error_too_many_request', 'message': 'mock throttle'}
+                else:
+                    status, payload = 200, route(parse_qs(parsed.query), body)
+
+                data = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency-ms', type=float, default=50)
+    parser.add_argument('--jitter-ms', type=float, default=10)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--throttle-rate', type=float, default=0.0)
+    parser.add_argument('--shops', type=int, default=10)
+    parser.add_argument('--merchants', type=int, default=1)
+    args = parser.parse_args()
+
+    server = MockShopeeServer(args.host, args.port, args.latency_ms, args.jitter_ms, args.error_rate,
+                              args.throttle_rate, args.shops, args.merchants)
+    print(f"Mock Shopee Open Platform listening on {server.url} (export SHOPEE_URL={server.url})")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == '__main__':
+    main()
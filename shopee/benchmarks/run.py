@@ -0,0 +1,298 @@
+"""
+Benchmarks for the Shopee integration, run against the local mock Shopee Open Platform.
+
+    bench --site bench.localhost execute shopee.benchmarks.run.run_benchmarks --kwargs "{'shops': 200}"
+
+Use a disposable site: the onboarding scenario creates Company records, and refresh_all_tokens
+refreshes every active token of the site against the mock server. Seeded tokens are removed
+afterwards. Results are written as JSON under <site>/shopee_benchmarks/ so runs of different
+releases can be compared with compare_results.
+"""
+import os
+import json
+import math
+import time
+import threading
+import frappe
+import shopee
+from contextlib import contextmanager
+from frappe.utils import add_days, now_datetime
+from shopee.config import clear_shopee_settings_cache
+from shopee.benchmarks.mock_server import MockShopeeServer, BASE_SHOP_ID, BASE_MERCHANT_ID
+
+# 各场景使用互不重叠的 ID 区间
+REFRESH_ID_OFFSET = 100_000
+CONCURRENCY_ID_OFFSET = 200_000
+
+ACCESS_TOKEN_PATH = '/api/v2/auth/access_token/get'
+
+
+def run_benchmarks(shops=100, tokens=500, threads=16, calls_per_thread=50, hot_shops=10,
+                   latency_ms=50, error_rate=0.0, throttle_rate=0.0, rate_limit=False,
+                   scenarios=None, output=None):
+    """
+    Start the mock server, run the selected scenarios and store the results as JSON.
+
+    `rate_limit=False` disables the partner/shop token buckets so the numbers show the app's own
+    overhead; pass True to include Shopee's QPS ceilings.
+    """
+    scenarios = scenarios or list(SCENARIOS)
+    params = {
+        'shops': shops, 'tokens': tokens, 'threads': threads, 'calls_per_thread': calls_per_thread,
+        'hot_shops': hot_shops, 'latency_ms': latency_ms, 'error_rate': error_rate,
+        'throttle_rate': throttle_rate, 'rate_limit': rate_limit
+    }
+    results = {
+        'version': shopee.__version__,
+        'timestamp': now_datetime().isoformat(),
+        'site': frappe.local.site,
+        'params': params,
+        'scenarios': {}
+    }
+
+    with MockShopeeServer(latency_ms=latency_ms, error_rate=error_rate, throttle_rate=throttle_rate) as server, \
+            mock_config(server.url, rate_limit) as overrides:
+        for name in scenarios:
+            print(f"Running {name} ...")
+            results['scenarios'][name] = SCENARIOS[name](server, params, overrides)
+            print(json.dumps(results['scenarios'][name], indent=2))
+
+    path = save_results(results, output)
+    print(f"Results written to {path}")
+    return results
+
+
+@contextmanager
+def mock_config(url, rate_limit):
+    """
+    Point the app at the mock server (SHOPEE_URL) and fill in benchmark credentials for this site.
+    """
+    overrides = {}
+    if not frappe.local.conf.get('shopee_partner_id'):
+        overrides['shopee_partner_id'] = 1000001
+    if not frappe.local.conf.get('shopee_partner_key'):
+        overrides['shopee_partner_key'] = 'benchmark-partner-key'
+    if not rate_limit:
+        overrides.update({'shopee_partner_qps': 0, 'shopee_shop_qps': 0})
+
+    previous_env = os.environ.get('SHOPEE_URL')
+    previous_conf = {key: frappe.local.conf.get(key) for key in overrides}
+    os.environ['SHOPEE_URL'] = url
+    frappe.local.conf.update(overrides)
+    clear_shopee_settings_cache()
+    try:
+        yield overrides
+    finally:
+        if previous_env is None:
+            os.environ.pop('SHOPEE_URL', None)
+        else:
+            os.environ['SHOPEE_URL'] = previous_env
+        frappe.local.conf.update(previous_conf)
+        clear_shopee_settings_cache()
+
+
+def bench_onboarding(server, params, overrides):
+    """
+    Authorize one main account owning `shops` shops through get_tokens.
+    """
+    from shopee.controllers.token_management import get_tokens
+
+    server.shops, server.merchants = params['shops'], 1
+    shop_ids = [str(BASE_SHOP_ID + i) for i in range(params['shops'])]
+    before = server.requests.copy()
+
+    start = time.perf_counter()
+    error = None
+    try:
+        get_tokens('benchmark-auth-code', BASE_MERCHANT_ID)
+    except Exception as e:
+        error = str(e)
+        frappe.db.rollback()
+    elapsed = time.perf_counter() - start
+
+    remove_seeded_tokens(shop_ids, [str(BASE_MERCHANT_ID)])
+    return {
+        'shops': params['shops'],
+        'elapsed': round(elapsed, 4),
+        'shops_per_second': round(params['shops'] / elapsed, 2) if elapsed else None,
+        'error': error,
+        'shopee_requests': dict(server.requests - before)
+    }
+
+
+def bench_refresh_all_tokens(server, params, overrides):
+    """
+    Run refresh_all_tokens over `tokens` seeded tokens whose refresh_token is due.
+    """
+    from shopee.tasks import refresh_all_tokens
+
+    shop_ids = seed_tokens(BASE_SHOP_ID + REFRESH_ID_OFFSET, params['tokens'])
+    frappe.db.set_value('Shopee Token Management', {'shop_id': ['in', shop_ids]},
+                        'last_refreshed', add_days(now_datetime(), -60), update_modified=False)
+    frappe.db.commit()
+    before = server.requests.copy()
+
+    start = time.perf_counter()
+    summary = refresh_all_tokens()
+    elapsed = time.perf_counter() - start
+
+    remove_seeded_tokens(shop_ids, [])
+    return {
+        'tokens': params['tokens'],
+        'elapsed': round(elapsed, 4),
+        'tokens_per_second': round(summary['total'] / elapsed, 2) if elapsed else None,
+        'summary': summary,
+        'shopee_requests': dict(server.requests - before)
+    }
+
+
+def bench_ensure_valid_access_token(server, params, overrides):
+    """
+    `threads` workers (each with its own site connection) call ensure_valid_access_token
+    `calls_per_thread` times over `hot_shops` shops, half of which hold an expiring token.
+    Ideally exactly one refresh call per expiring shop reaches Shopee.
+    """
+    from shopee.controllers.token_management import ensure_valid_access_token
+
+    hot_shops = params['hot_shops']
+    expiring = hot_shops // 2
+    shop_ids = seed_tokens(BASE_SHOP_ID + CONCURRENCY_ID_OFFSET, hot_shops - expiring)
+    shop_ids += seed_tokens(BASE_SHOP_ID + CONCURRENCY_ID_OFFSET + hot_shops, expiring, expire_in=60)
+    frappe.db.commit()
+    before = server.requests.copy()
+
+    site = frappe.local.site
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+
+    def worker(index):
+        frappe.init(site=site)
+        frappe.connect()
+        frappe.local.conf.update(overrides)
+        local_latencies = []
+        try:
+            for call in range(params['calls_per_thread']):
+                shop_id = shop_ids[(index + call) % len(shop_ids)]
+                start = time.perf_counter()
+                try:
+                    ensure_valid_access_token(shop_id=shop_id)
+                except Exception as e:
+                    with lock:
+                        errors.append(str(e))
+                local_latencies.append(time.perf_counter() - start)
+        finally:
+            frappe.destroy()
+        with lock:
+            latencies.extend(local_latencies)
+
+    workers = [threading.Thread(target=worker, args=(i,)) for i in range(params['threads'])]
+    start = time.perf_counter()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    remove_seeded_tokens(shop_ids, [])
+    requests = dict(server.requests - before)
+    return {
+        'threads': params['threads'],
+        'calls': len(latencies),
+        'elapsed': round(elapsed, 4),
+        'calls_per_second': round(len(latencies) / elapsed, 2) if elapsed else None,
+        'latency_ms': latency_summary(latencies),
+        'errors': len(errors),
+        'expiring_shops': expiring,
+        'refresh_calls': requests.get(ACCESS_TOKEN_PATH, 0),
+        'shopee_requests': requests
+    }
+
+
+SCENARIOS = {
+    'onboarding': bench_onboarding,
+    'refresh_all_tokens': bench_refresh_all_tokens,
+    'ensure_valid_access_token': bench_ensure_valid_access_token,
+}
+
+
+def seed_tokens(first_id, count, expire_in=14400):
+    from shopee.controllers.token_management import bulk_upsert_tokens
+
+    shop_ids = [str(first_id + i) for i in range(count)]
+    bulk_upsert_tokens([{
+        'identifier': shop_id, 'is_merchant': False, 'access_token': f"bench-access-{shop_id}",
+        'refresh_token': f"bench-refresh-{shop_id}", 'expire_in': expire_in
+    } for shop_id in shop_ids])
+    return shop_ids
+
+
+def remove_seeded_tokens(shop_ids, merchant_ids):
+    from shopee.api.shopee_event_handlers import delete_associated_tokens
+    from shopee.controllers.token_cache import invalidate_token
+
+    delete_associated_tokens(shop_ids, merchant_ids)
+    frappe.db.commit()
+    for shop_id in shop_ids:
+        invalidate_token('shop_id', shop_id)
+    for merchant_id in merchant_ids:
+        invalidate_token('merchant_id', merchant_id)
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return None
+    index = max(0, math.ceil(pct / 100 * len(sorted_values)) - 1)
+    return sorted_values[index]
+
+
+def latency_summary(latencies):
+    values = sorted(latency * 1000 for latency in latencies)
+    if not values:
+        return {}
+    return {
+        'min': round(values[0], 3),
+        'p50': round(percentile(values, 50), 3),
+        'p90': round(percentile(values, 90), 3),
+        'p99': round(percentile(values, 99), 3),
+        'max': round(values[-1], 3),
+        'mean': round(sum(values) / len(values), 3)
+    }
+
+
+def save_results(results, output=None):
+    if not output:
+        directory = frappe.get_site_path('shopee_benchmarks')
+        os.makedirs(directory, exist_ok=True)
+        stamp = results['timestamp'].replace(':', '').replace('-', '').split('.')[0]
+        output = os.path.join(directory, f"{stamp}-v{results['version']}.json")
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=2, default=str)
+    return output
+
+
+def compare_results(baseline, current):
+    """
+    Print the relative change of every numeric result between two result files.
+
+    bench --site <site> execute shopee.benchmarks.run.compare_results --args "['old.json', 'new.json']"
+    """
+    with open(baseline) as f:
+        old = json.load(f)
+    with open(current) as f:
+        new = json.load(f)
+
+    def flatten(data, prefix=''):
+        for key, value in data.items():
+            if isinstance(value, dict):
+                yield from flatten(value, f"{prefix}{key}.")
+            elif isinstance(value, (int, float)) and not isinstance(value, bool):
+                yield f"{prefix}{key}", value
+
+    old_values = dict(flatten(old['scenarios']))
+    changes = {}
+    for key, value in flatten(new['scenarios']):
+        if key in old_values and old_values[key]:
+            changes[key] = round((value - old_values[key]) / old_values[key] * 100, 1)
+            print(f"{key:60} {old_values[key]:>12} -> {value:>12} ({changes[key]:+}%)")
+    return changes
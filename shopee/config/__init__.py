@@ -0,0 +1 @@
+from .config import SHOPEE_URL, get_shopee_settings, clear_shopee_settings_cache, get_partner_id, get_partner_key
@@ -1,16 +1,62 @@
 # config.py
+import os
 import frappe
 
 SHOPEE_URL = "https://openplatform.shopee.cn"
 
+# site -> (site_config mtimes, ShopeeSettings)，按站点惰性解析并缓存（同一个 worker 可能服务多个站点）；
+# site_config.json / common_site_config.json 修改后自动重新读取
+_settings = {}
+
+class ShopeeSettings:
+    """
+    Shopee configuration of one site, read from site_config on first use.
+
+    - shopee_partner_id / shopee_partner_key: partner credentials
+    - shopee_host: API host (defaults to SHOPEE_URL; the SHOPEE_URL environment variable wins,
+      e.g. to point a benchmark run at a local mock server)
+    - shopee_region_hosts: optional {region: host} map of regional API endpoints, e.g.
+      {"SG": "https://partner.shopeemobile.com", "BR": "https://openplatform.shopee.com.br"};
+      shop/merchant-scoped calls go to the endpoint of the company's region (ignored when the
+      SHOPEE_URL environment variable is set)
+    """
+    def __init__(self, conf):
+        self.partner_id = conf.get('shopee_partner_id', None)
+        self.partner_key = conf.get('shopee_partner_key', None)
+        self.host = (os.environ.get('SHOPEE_URL') or conf.get('shopee_host') or SHOPEE_URL).rstrip('/')
+        self.region_hosts = {} if os.environ.get('SHOPEE_URL') else {
+            region.upper(): host.rstrip('/') for region, host in (conf.get('shopee_region_hosts') or {}).items()
+        }
+
+def get_shopee_settings():
+    """
+    Return the memoized settings of the current site, rebuilt when its site config files change.
+    """
+    site = frappe.local.site
+    mtimes = _config_mtimes()
+    cached = _settings.get(site)
+    if cached is None or cached[0] != mtimes:
+        cached = _settings[site] = (mtimes, ShopeeSettings(frappe.local.conf))
+    return cached[1]
+
+def _config_mtimes():
+    paths = (frappe.get_site_path('site_config.json'), os.path.join(frappe.local.sites_path, 'common_site_config.json'))
+    return tuple(os.path.getmtime(path) if os.path.exists(path) else None for path in paths)
+
+def clear_shopee_settings_cache():
+    """
+    Forget the memoized settings of the current site, e.g. after site_config changes.
+    """
+    _settings.pop(frappe.local.site, None)
+
 def get_partner_id():
-    partner_id = frappe.local.conf.get('shopee_partner_id', None)
+    partner_id = get_shopee_settings().partner_id
     if not partner_id:
         frappe.throw("Shopee partner id is not configured.", exc=frappe.ConfigurationError)
     return partner_id
 
 def get_partner_key():
-    partner_key = frappe.local.conf.get('shopee_partner_key', None)
+    partner_key = get_shopee_settings().partner_key
     if not partner_key:
         frappe.throw("Shopee partner key is not configured.", exc=frappe.ConfigurationError)
     return partner_key
@@ -0,0 +1,103 @@
+import frappe
+from frappe.utils import cint, add_days, now_datetime
+
+LOG_DOCTYPE = 'Shopee Sync Log'
+
+# 缓冲超过该条数时先写入当前事务（不提交），避免长任务占用过多内存
+MAX_BUFFER = 500
+MAX_MESSAGE_LENGTH = 1000
+
+# 保留策略：按天数（Log Settings 可调整）和总行数上限，可通过 site_config 覆盖
+DEFAULT_RETENTION_DAYS = 30
+DEFAULT_MAX_ROWS = 1_000_000
+PRUNE_CHUNK_SIZE = 10_000
+
+
+def log_sync_event(event, reference=None, message=None):
+    """
+    Record a successful sync operation in the Shopee Sync Log.
+
+    Records are buffered for the current transaction and written with one bulk insert after it
+    commits (flush_audit_log); a rollback discards them. Never commits the caller's transaction.
+    Use frappe.log_error for real errors only.
+    """
+    buffer = getattr(frappe.local, 'shopee_audit_log', None)
+    if buffer is None:
+        buffer = frappe.local.shopee_audit_log = []
+        frappe.db.after_commit.add(flush_audit_log)
+        frappe.db.after_rollback.add(discard_audit_log)
+    buffer.append((now_datetime(), event, str(reference) if reference is not None else None,
+                   (message or '')[:MAX_MESSAGE_LENGTH] or None))
+    if len(buffer) >= MAX_BUFFER:
+        # 写入调用方的事务，随其一起提交或回滚
+        insert_records(buffer)
+        buffer.clear()
+
+
+def discard_audit_log():
+    frappe.local.shopee_audit_log = None
+
+
+def flush_audit_log():
+    """
+    after_commit callback: write the buffered records of the committed transaction in one bulk
+    insert and commit them. Never raises: the caller's work is already committed.
+    """
+    buffer = getattr(frappe.local, 'shopee_audit_log', None)
+    frappe.local.shopee_audit_log = None
+    if not buffer:
+        return
+    try:
+        insert_records(buffer)
+        # 直接提交，不通过 frappe.db.commit() 再次触发 before/after_commit 回调
+        frappe.db.sql("commit")
+        frappe.db.begin()
+    except Exception:
+        try:
+            frappe.db.sql("rollback")
+            frappe.db.begin()
+        except Exception:
+            pass
+        frappe.log_error(frappe.get_traceback(), 'Shopee Sync Log Error')
+
+
+def insert_records(records):
+    user = frappe.session.user if getattr(frappe.local, 'session', None) else 'Administrator'
+    frappe.db.bulk_insert(LOG_DOCTYPE,
+                          ['name', 'creation', 'modified', 'owner', 'modified_by', 'docstatus', 'event', 'reference', 'message'],
+                          [(frappe.generate_hash(length=12), timestamp, timestamp, user, user, 0, event, reference, message)
+                           for timestamp, event, reference, message in records])
+
+
+def prune_sync_log(days=None, max_rows=None):
+    """
+    Delete Shopee Sync Log rows older than `days`, then the oldest rows beyond `max_rows`,
+    in chunks of PRUNE_CHUNK_SIZE. Runs daily through Log Settings (ShopeeSyncLog.clear_old_logs).
+    """
+    conf = frappe.local.conf
+    days = cint(days or conf.get('shopee_sync_log_retention_days')) or DEFAULT_RETENTION_DAYS
+    max_rows = cint(max_rows or conf.get('shopee_sync_log_max_rows')) or DEFAULT_MAX_ROWS
+
+    Log = frappe.qb.DocType(LOG_DOCTYPE)
+    cutoff = add_days(now_datetime(), -days)
+    while True:
+        names = frappe.qb.from_(Log).select(Log.name).where(Log.creation < cutoff) \
+            .limit(PRUNE_CHUNK_SIZE).run(pluck=True)
+        if not names:
+            break
+        delete_logs(names)
+
+    excess = frappe.db.count(LOG_DOCTYPE) - max_rows
+    while excess > 0:
+        names = frappe.qb.from_(Log).select(Log.name).orderby(Log.creation) \
+            .limit(min(excess, PRUNE_CHUNK_SIZE)).run(pluck=True)
+        if not names:
+            break
+        delete_logs(names)
+        excess -= len(names)
+
+
+def delete_logs(names):
+    Log = frappe.qb.DocType(LOG_DOCTYPE)
+    frappe.qb.from_(Log).delete().where(Log.name.isin(names)).run()
+    frappe.db.commit()
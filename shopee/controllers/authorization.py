@@ -4,12 +4,9 @@ from urllib.parse import urlencode, quote_plus
 from .utils import generate_signature
 from .token_management import get_tokens
 from frappe import _
-from shopee.config import SHOPEE_URL, get_partner_id, get_partner_key
+from shopee.config import get_shopee_settings, get_partner_id, get_partner_key
 
-# 常量配置
-PARTNER_ID = get_partner_id()
-PARTNER_KEY = get_partner_key()
-HOST = frappe.utils.get_url()
+# 配置在调用时按站点解析，避免在 import 时读取（此时可能没有站点上下文）
 #REDIRECT_URL = frappe.utils.get_url('/api/method/shopee_integration.shopee_auth_callback')  # 回调URL
 
 @frappe.whitelist(allow_guest=True)
@@ -17,19 +14,20 @@ def generate_auth_link():
     """
     生成Shopee授权链接。
     """
+    partner_id = get_partner_id()
     timestamp = int(time.time())
     path = "/api/v2/shop/auth_partner"
-    signature = generate_signature(PARTNER_ID, path, timestamp, PARTNER_KEY)
+    signature = generate_signature(partner_id, path, timestamp, get_partner_key())
     redirect_path = '/auth-callback'  # 前端回调路径
-    redirect_url = f"{HOST}:3000{redirect_path}"
+    redirect_url = f"{frappe.utils.get_url()}:3000{redirect_path}"
 
     query_params = {
-        'partner_id': PARTNER_ID,
+        'partner_id': partner_id,
         'timestamp': timestamp,
         'sign': signature,
         'redirect': redirect_url
     }
-    auth_url = f"{SHOPEE_URL}{path}?{urlencode(query_params, quote_via=quote_plus)}"
+    auth_url = f"{get_shopee_settings().host}{path}?{urlencode(query_params, quote_via=quote_plus)}"
     return auth_url
 
 def shopee_auth_callback(auth_code, main_account_id):
@@ -55,17 +53,18 @@ def generate_deauth_link():
     """
     生成Shopee授权链接。
     """
+    partner_id = get_partner_id()
     timestamp = int(time.time())
     path = "/api/v2/shop/cancel_auth_partner"
-    signature = generate_signature(PARTNER_ID, path, timestamp, PARTNER_KEY)
+    signature = generate_signature(partner_id, path, timestamp, get_partner_key())
     redirect_path = '/deauth-callback'  # 前端回调路径
-    redirect_url = f"{HOST}:3000{redirect_path}"
+    redirect_url = f"{frappe.utils.get_url()}:3000{redirect_path}"
 
     query_params = {
-        'partner_id': PARTNER_ID,
+        'partner_id': partner_id,
         'timestamp': timestamp,
         'sign': signature,
         'redirect': redirect_url
     }
-    deauth_url = f"{SHOPEE_URL}{path}?{urlencode(query_params, quote_via=quote_plus)}"
+    deauth_url = f"{get_shopee_settings().host}{path}?{urlencode(query_params, quote_via=quote_plus)}"
     return deauth_url
\ No newline at end of file
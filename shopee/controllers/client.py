@@ -0,0 +1,253 @@
+import os
+import json
+import time
+import random
+import threading
+import frappe
+import requests
+from requests.adapters import HTTPAdapter
+from frappe.utils import cint, flt
+from .utils import generate_signature, normalize_id
+from .region import get_region_hosts
+from .rate_limit import RateLimiter
+from .metrics import incr, observe, metrics_key, API_LATENCY_BUCKETS
+from shopee.config import SHOPEE_URL, get_partner_id, get_partner_key
+
+# 连接池与超时的默认值，可通过 site_config 覆盖
+DEFAULT_CONNECT_TIMEOUT = 3.05
+DEFAULT_READ_TIMEOUT = 20
+DEFAULT_POOL_SIZE = 20
+
+# 限流/服务端错误的自动重试：次数、退避基数与上限（秒）
+DEFAULT_MAX_RETRIES = 3
+BACKOFF_BASE = 0.5
+BACKOFF_CAP = 8
+RETRYABLE_ERRORS = ('error_too_many_request',)
+
+# 每个 worker 进程、每个 host 共用一个 Session（keep-alive）
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+
+class ShopeeHTTPError(frappe.ValidationError):
+    """
+    The request never produced a usable Shopee payload (network error, bad status, non-JSON body).
+    """
+    def __init__(self, message, status_code=None, response_text=None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.response_text = response_text or ''
+
+
+class ShopeeAPIError(frappe.ValidationError):
+    """
+    Shopee answered, but reported an `error` in the response body.
+    """
+    def __init__(self, error, message=None, request_id=None, response=None, status_code=None):
+        self.error = error
+        self.message = message or ''
+        self.request_id = request_id
+        self.response = response or {}
+        self.status_code = status_code
+        super().__init__(f"{error}: {self.message}" if self.message else error)
+
+
+def get_session(host=SHOPEE_URL, pool_size=DEFAULT_POOL_SIZE):
+    """
+    Return the pooled session for `host`, creating it on first use in this process.
+    Sessions are keyed by pid so forked workers never share sockets with their parent.
+    """
+    key = (os.getpid(), host)
+    session = _sessions.get(key)
+    if session is None:
+        with _sessions_lock:
+            session = _sessions.get(key)
+            if session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+                session.mount('https://', adapter)
+                session.mount('http://', adapter)
+                _sessions[key] = session
+    return session
+
+
+class ShopeeClient:
+    """
+    Thin wrapper around the Shopee Open Platform v2 API.
+
+    Signs every request with `generate_signature`, sends it over the shared pooled session of
+    the shop's (or merchant's) regional host (see shopee_region_hosts) and returns the decoded JSON body, raising `ShopeeAPIError`/`ShopeeHTTPError` on failure.
+    Every attempt first passes the partner/shop rate limiter; throttled and 5xx responses are
+    retried with jittered exponential backoff. Every attempt is recorded in the
+    `api_request_seconds` histogram, labelled by path and error code.
+    Credentials and regional hosts are resolved when the client is built, so an instance can be handed to
+    worker threads that have no site context of their own.
+    """
+    def __init__(self, partner_id=None, partner_key=None, host=None, timeout=None, pool_size=None, max_retries=None):
+        conf = frappe.local.conf
+        self.partner_id = partner_id or get_partner_id()
+        self.partner_key = partner_key or get_partner_key()
+        # 按店铺/商户所在区域选择 API 域名；显式指定 host 时不做区域路由
+        self.entity_hosts, default_host = ({}, host) if host else get_region_hosts()
+        self.host = default_host
+        self.timeout = timeout or (
+            flt(conf.get('shopee_connect_timeout')) or DEFAULT_CONNECT_TIMEOUT,
+            flt(conf.get('shopee_read_timeout')) or DEFAULT_READ_TIMEOUT
+        )
+        self.pool_size = pool_size or cint(conf.get('shopee_pool_size')) or DEFAULT_POOL_SIZE
+        self.max_retries = cint(max_retries if max_retries is not None else conf.get('shopee_max_retries', DEFAULT_MAX_RETRIES))
+        self.session = get_session(self.host, self.pool_size)
+        self.rate_limiter = RateLimiter(self.partner_id)
+        self.metrics_key = metrics_key()
+
+    def get(self, path, params=None, **kwargs):
+        return self.request('GET', path, params=params, **kwargs)
+
+    def post(self, path, body=None, params=None, **kwargs):
+        return self.request('POST', path, params=params, body=body, **kwargs)
+
+    def signed_params(self, path, access_token=None, shop_id=None, merchant_id=None):
+        """
+        Build the common query parameters (partner_id, timestamp, sign, ...) for `path`.
+        """
+        timestamp = int(time.time())
+        params = {
+            'partner_id': self.partner_id,
+            'timestamp': timestamp,
+            'sign': generate_signature(self.partner_id, path, timestamp, self.partner_key,
+                                       access_token=access_token, shop_id=shop_id, merchant_id=merchant_id)
+        }
+        if access_token:
+            params['access_token'] = access_token
+        if shop_id:
+            params['shop_id'] = shop_id
+        if merchant_id:
+            params['merchant_id'] = merchant_id
+        return params
+
+    def host_for(self, shop_id=None, merchant_id=None):
+        """
+        API host of the shop's (or merchant's) region, falling back to the default host.
+        """
+        if not self.entity_hosts or not (shop_id or merchant_id):
+            return self.host
+        return self.entity_hosts.get(normalize_id(shop_id or merchant_id), self.host)
+
+    def request(self, method, path, params=None, body=None, access_token=None, shop_id=None, merchant_id=None, host=None):
+        attempt = 0
+        while True:
+            waited = self.rate_limiter.acquire(shop_id=shop_id)
+            if waited:
+                observe('api_rate_limit_wait_seconds', waited, {'path': path}, key=self.metrics_key)
+            start = time.monotonic()
+            try:
+                data = self.send(method, path, params, body, access_token, shop_id, merchant_id, host)
+                observe('api_request_seconds', time.monotonic() - start, {'path': path, 'error': ''},
+                        API_LATENCY_BUCKETS, key=self.metrics_key)
+                return data
+            except (ShopeeAPIError, ShopeeHTTPError) as e:
+                observe('api_request_seconds', time.monotonic() - start, {'path': path, 'error': error_label(e)},
+                        API_LATENCY_BUCKETS, key=self.metrics_key)
+                if attempt >= self.max_retries or not is_retryable(e):
+                    raise
+            incr('api_retries', labels={'path': path}, key=self.metrics_key)
+            # Full jitter keeps retrying workers from re-synchronising into the next burst
+            time.sleep(random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * 2 ** attempt)))
+            attempt += 1
+
+    def send(self, method, path, params=None, body=None, access_token=None, shop_id=None, merchant_id=None, host=None):
+        """
+        Perform a single signed request without rate limiting or retries, on the pooled session
+        of `host` (by default the host of the shop's/merchant's region).
+        """
+        host = host or self.host_for(shop_id, merchant_id)
+        query = self.signed_params(path, access_token, shop_id, merchant_id)
+        if params:
+            query.update(params)
+
+        try:
+            response = get_session(host, self.pool_size).request(method, f"{host}{path}", params=query, json=body,
+                                                                 timeout=self.timeout)
+        except requests.RequestException as e:
+            raise ShopeeHTTPError(f"Request to Shopee {path} failed: {e}") from e
+
+        try:
+            data = response.json()
+        except ValueError:
+            raise ShopeeHTTPError(f"Invalid response from Shopee {path} (HTTP {response.status_code})",
+                                  response.status_code, response.text)
+
+        if data.get('error'):
+            raise ShopeeAPIError(data['error'], data.get('message'), data.get('request_id'), data, response.status_code)
+        if not response.ok:
+            raise ShopeeHTTPError(f"Shopee {path} returned HTTP {response.status_code}",
+                                  response.status_code, response.text)
+        return data
+
+
+    def stream(self, method, path, params=None, body=None, access_token=None, shop_id=None, merchant_id=None):
+        """
+        Send a request that answers with a file (e.g. a shipping label PDF) and return the open
+        streaming `requests.Response`; read it with iter_content and close it. Shopee reports
+        errors as JSON, which raise `ShopeeAPIError`/`ShopeeHTTPError` like `send`. Not retried.
+        """
+        self.rate_limiter.acquire(shop_id=shop_id)
+        query = self.signed_params(path, access_token, shop_id, merchant_id)
+        if params:
+            query.update(params)
+
+        host = self.host_for(shop_id, merchant_id)
+        start = time.monotonic()
+        try:
+            response = get_session(host, self.pool_size).request(method, f"{host}{path}", params=query, json=body,
+                                                                 timeout=self.timeout, stream=True)
+        except requests.RequestException as e:
+            raise ShopeeHTTPError(f"Request to Shopee {path} failed: {e}") from e
+
+        error = None
+        if 'application/json' in response.headers.get('Content-Type', ''):
+            with response:
+                try:
+                    data = response.json()
+                except ValueError:
+                    data = {}
+            if data.get('error'):
+                error = ShopeeAPIError(data['error'], data.get('message'), data.get('request_id'), data, response.status_code)
+            else:
+                error = ShopeeHTTPError(f"Shopee {path} returned no file (HTTP {response.status_code})",
+                                        response.status_code, json.dumps(data))
+        elif not response.ok:
+            response.close()
+            error = ShopeeHTTPError(f"Shopee {path} returned HTTP {response.status_code}", response.status_code)
+
+        observe('api_request_seconds', time.monotonic() - start, {'path': path, 'error': error_label(error) if error else ''},
+                API_LATENCY_BUCKETS, key=self.metrics_key)
+        if error:
+            raise error
+        return response
+
+
+def is_retryable(error):
+    """
+    Throttling (error_too_many_request / HTTP 429) and server-side (5xx) failures are worth retrying.
+    """
+    if isinstance(error, ShopeeAPIError) and error.error in RETRYABLE_ERRORS:
+        return True
+    status_code = error.status_code or 0
+    return status_code == 429 or status_code >= 500
+
+
+def error_label(error):
+    """
+    Metric label for a failed attempt: the Shopee error code, `http_<status>` or `connection_error`.
+    """
+    if isinstance(error, ShopeeAPIError):
+        return error.error
+    return f"http_{error.status_code}" if error.status_code else 'connection_error'
+
+
+def get_client(**kwargs):
+    """
+    Return a `ShopeeClient` for the current site.
+    """
+    return ShopeeClient(**kwargs)
@@ -0,0 +1,112 @@
+import frappe
+from frappe.utils import cint
+
+# 物化路径：根节点为公司名，子节点为 "父路径/公司名"；公司名中的 "%" 和 "/" 被编码（见 path_segment），
+# 因此分隔符只会出现在层级之间
+PATH_FIELD = 'shopee_hierarchy_path'
+PATH_SEPARATOR = '/'
+CACHE_KEY = "shopee:company_hierarchy"
+
+
+def update_hierarchy_path(doc, method=None):
+    """
+    Company after_insert/on_update hook: keep the stored path of the company (and of its whole
+    subtree, in one UPDATE) in sync with parent_company, then drop the cached hierarchy.
+    """
+    parent_path = frappe.db.get_value('Company', doc.parent_company, PATH_FIELD) if doc.parent_company else None
+    new_path = join_path(parent_path or path_segment(doc.parent_company), doc.name) if doc.parent_company \
+        else path_segment(doc.name)
+    old_path = frappe.db.get_value('Company', doc.name, PATH_FIELD)
+
+    if new_path != old_path:
+        frappe.db.set_value('Company', doc.name, PATH_FIELD, new_path, update_modified=False)
+        if old_path:
+            # 整棵子树的路径前缀一次性替换
+            frappe.db.sql(f"""
+                update `tabCompany`
+                set `{PATH_FIELD}` = concat(%(new_path)s, substring(`{PATH_FIELD}`, %(start)s))
+                where `{PATH_FIELD}` like %(prefix)s
+            """, {
+                'new_path': new_path,
+                'start': len(old_path) + 1,
+                'prefix': escape_like(f"{old_path}{PATH_SEPARATOR}") + '%'
+            })
+
+    invalidate_hierarchy_cache()
+
+
+def path_segment(name):
+    """
+    Company name as one path segment: "%" and the separator are percent-encoded.
+    """
+    return name.replace('%', '%25').replace(PATH_SEPARATOR, '%2F')
+
+
+def join_path(parent_path, name):
+    return f"{parent_path}{PATH_SEPARATOR}{path_segment(name)}"
+
+
+def invalidate_hierarchy_cache(doc=None, method=None):
+    """
+    Drop the cached hierarchy. Also used as a Company on_trash hook and after bulk Company updates.
+    """
+    frappe.cache().delete_value(CACHE_KEY)
+
+
+def escape_like(value):
+    return value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def get_hierarchy_nodes():
+    """
+    Return every authorized company as a flat list ordered by path (parents before children).
+    Served from Redis; rebuilt with a single query on a miss.
+    """
+    nodes = frappe.cache().get_value(CACHE_KEY)
+    if nodes is None:
+        nodes = frappe.get_all('Company', filters={'is_authorized': 1},
+                               fields=['name', 'parent_company', 'entity_name', f'{PATH_FIELD} as path'],
+                               order_by=f'{PATH_FIELD} asc')
+        nodes = [dict(node) for node in nodes]
+        frappe.cache().set_value(CACHE_KEY, nodes)
+    return nodes
+
+
+def build_tree(nodes, root=None):
+    """
+    Build a nested tree from `nodes` without mutating them. A node is a root when it has no
+    parent_company (or is `root`); nodes whose parent is not in `nodes` are left out.
+    """
+    copies = {node['name']: {'name': node['name'], 'parent_company': node['parent_company'],
+                             'entity_name': node['entity_name']} for node in nodes}
+    roots = []
+    for node in nodes:
+        copy = copies[node['name']]
+        parent = node['parent_company']
+        if node['name'] == root or not parent:
+            roots.append(copy)
+        elif parent in copies:
+            copies[parent].setdefault('children', []).append(copy)
+    return roots
+
+
+def get_hierarchy(company=None, start=0, page_length=0):
+    """
+    Return the authorized company tree.
+
+    With `company`, only that company's subtree is returned (as a single-element list).
+    Otherwise top-level companies are paged with `start`/`page_length` (0 = all).
+    """
+    nodes = get_hierarchy_nodes()
+
+    if company:
+        root = next((node for node in nodes if node['name'] == company), None)
+        if not root:
+            return []
+        prefix = f"{root['path']}{PATH_SEPARATOR}"
+        subtree = [root] + [node for node in nodes if (node['path'] or '').startswith(prefix)]
+        return build_tree(subtree, root=company)
+
+    tree = build_tree(nodes)
+    start, page_length = cint(start), cint(page_length)
+    return tree[start:start + page_length] if page_length else tree[start:]
@@ -0,0 +1,250 @@
+import time
+import frappe
+from datetime import datetime
+from frappe.utils import cint, flt, getdate, now_datetime
+from .client import get_client, ShopeeAPIError, ShopeeHTTPError
+from .sync_cursor import get_cursor, set_cursor
+from .token_management import ensure_valid_access_token
+from .utils import normalize_id
+from .metrics import incr, timer
+from .audit import log_sync_event
+
+CURSOR_RESOURCE = 'escrow'
+ESCROW_DOCTYPE = 'Shopee Escrow'
+
+# Shopee 接口限制：get_escrow_list 单次时间窗口最多 15 天、每页最多 100 条；get_escrow_detail_batch 每次最多 50 个
+MAX_WINDOW_SECONDS = 15 * 24 * 3600
+ESCROW_LIST_PAGE_SIZE = 100
+ESCROW_DETAIL_BATCH_SIZE = 50
+
+# 首次同步回溯一个月；增量同步与上次游标重叠，已入库的 order_sn 会被跳过
+INITIAL_LOOKBACK_SECONDS = 30 * 24 * 3600
+CURSOR_OVERLAP_SECONDS = 3600
+
+# 每张 Journal Entry 汇总的结算笔数
+JOURNAL_BATCH_SIZE = 500
+
+
+def sync_all_shops():
+    """
+    Scheduled entry point: enqueue one escrow reconciliation per authorized shop.
+    """
+    shop_ids = frappe.get_all('Shopee Token Management', filters={'active': 1, 'shop_id': ['is', 'set']}, pluck='shop_id')
+    for shop_id in shop_ids:
+        frappe.enqueue('shopee.controllers.escrow_sync.sync_shop_escrow', queue='long', shop_id=shop_id,
+                       job_id=f"shopee_escrow_sync:{shop_id}", deduplicate=True)
+
+
+def sync_shop_escrow(shop_id):
+    """
+    Store every escrow released for `shop_id` since the checkpoint and post it to the ledger.
+
+    Walks forward in 15-day windows, pages through get_escrow_list and fetches details of new
+    order_sns 50 at a time; each page is stored with one bulk INSERT and committed, and the
+    checkpoint is committed after every window, so memory stays bounded and an interrupted run
+    resumes where it stopped. Stored settlements are then posted as batched Journal Entries.
+    """
+    client = get_client()
+    access_token = ensure_valid_access_token(shop_id=shop_id)
+    company = frappe.db.get_value('Company', {'entity_id': normalize_id(shop_id)}, 'name')
+
+    now = int(time.time())
+    cursor = get_cursor(shop_id, CURSOR_RESOURCE)
+    time_from = max(cursor - CURSOR_OVERLAP_SECONDS, 0) if cursor else now - INITIAL_LOOKBACK_SECONDS
+
+    try:
+        with timer('job_seconds', {'job': 'sync_shop_escrow'}):
+            while time_from < now:
+                time_to = min(time_from + MAX_WINDOW_SECONDS, now)
+                for escrows in iter_escrow_list(client, shop_id, access_token, time_from, time_to):
+                    release_times = {e['order_sn']: e.get('escrow_release_time') for e in escrows}
+                    new_order_sns = filter_new_order_sns(list(release_times))
+                    if new_order_sns:
+                        details = get_escrow_details(client, shop_id, access_token, new_order_sns)
+                        store_escrows(shop_id, company, details, release_times)
+                        frappe.db.commit()
+                set_cursor(shop_id, CURSOR_RESOURCE, time_to)
+                frappe.db.commit()
+                time_from = time_to
+    except (ShopeeAPIError, ShopeeHTTPError) as e:
+        frappe.db.rollback()
+        handle_escrow_sync_error(shop_id, e)
+
+    post_escrow_journals(shop_id, company)
+
+
+def iter_escrow_list(client, shop_id, access_token, release_time_from, release_time_to):
+    """
+    Yield the escrow list (order_sn, payout_amount, escrow_release_time) one page at a time.
+    """
+    page_no = 1
+    while True:
+        response = client.get('/api/v2/payment/get_escrow_list', access_token=access_token, shop_id=shop_id, params={
+            'release_time_from': release_time_from,
+            'release_time_to': release_time_to,
+            'page_size': ESCROW_LIST_PAGE_SIZE,
+            'page_no': page_no
+        }).get('response', {})
+
+        escrows = response.get('escrow_list', [])
+        if escrows:
+            yield escrows
+        if not response.get('more'):
+            return
+        page_no += 1
+
+
+def filter_new_order_sns(order_sns):
+    """
+    Drop order_sns whose escrow is already stored (one query), so resumed runs skip the detail fetch.
+    """
+    if not order_sns:
+        return []
+    known = set(frappe.get_all(ESCROW_DOCTYPE, filters={'order_sn': ['in', order_sns]}, pluck='order_sn'))
+    return [order_sn for order_sn in order_sns if order_sn not in known]
+
+
+def get_escrow_details(client, shop_id, access_token, order_sns):
+    """
+    Fetch escrow details in batches of ESCROW_DETAIL_BATCH_SIZE order_sns per call.
+    """
+    details = []
+    for i in range(0, len(order_sns), ESCROW_DETAIL_BATCH_SIZE):
+        response = client.post('/api/v2/payment/get_escrow_detail_batch', access_token=access_token, shop_id=shop_id,
+                               body={'order_sn_list': order_sns[i:i + ESCROW_DETAIL_BATCH_SIZE]})
+        for entry in response.get('response') or []:
+            details.append(entry.get('escrow_detail', entry))
+    return details
+
+
+def store_escrows(shop_id, company, details, release_times):
+    """
+    Insert one batch of escrow details with one bulk INSERT, without committing.
+    Each settlement is matched to its Sales Order through the shopee_order_sn index in one query.
+    """
+    if not details:
+        return
+    order_sns = [detail['order_sn'] for detail in details]
+    sales_orders = dict(frappe.get_all('Sales Order', filters={'shopee_order_sn': ['in', order_sns]},
+                                       fields=['shopee_order_sn', 'name'], as_list=True))
+
+    now = now_datetime()
+    rows = []
+    for detail in details:
+        order_sn = detail['order_sn']
+        income = detail.get('order_income') or {}
+        release_time = cint(release_times.get(order_sn))
+        rows.append((
+            order_sn, now, now, frappe.session.user, frappe.session.user, 0,
+            order_sn, normalize_id(shop_id), company, sales_orders.get(order_sn),
+            datetime.fromtimestamp(release_time) if release_time else now,
+            flt(income.get('buyer_total_amount'), 2), flt(income.get('escrow_amount'), 2),
+            flt(income.get('commission_fee'), 2), flt(income.get('service_fee'), 2),
+            flt(income.get('seller_transaction_fee'), 2)
+        ))
+
+    frappe.db.bulk_insert(ESCROW_DOCTYPE,
+                          ['name', 'creation', 'modified', 'owner', 'modified_by', 'docstatus',
+                           'order_sn', 'shop_id', 'company', 'sales_order', 'release_time',
+                           'buyer_total_amount', 'escrow_amount', 'commission_fee', 'service_fee', 'transaction_fee'],
+                          rows, ignore_duplicates=True)
+    incr('db_rows_written', len(rows), {'doctype': ESCROW_DOCTYPE, 'op': 'insert'})
+    unmatched = len([row for row in rows if not row[9]])
+    if unmatched:
+        incr('escrow_unmatched_orders', unmatched)
+
+
+def get_escrow_accounts(company):
+    """
+    Accounts used for posting: site_config shopee_escrow_accounts[company] (or ["*"]) with keys
+    bank, fees and receivable, falling back to the Company's default accounts.
+    """
+    configured = frappe.local.conf.get('shopee_escrow_accounts') or {}
+    accounts = dict(configured.get('*') or {}, **(configured.get(company) or {}))
+    defaults = frappe.db.get_value('Company', company, ['default_bank_account', 'default_expense_account',
+                                                       'default_receivable_account'], as_dict=True) or {}
+    accounts.setdefault('bank', defaults.get('default_bank_account'))
+    accounts.setdefault('fees', defaults.get('default_expense_account'))
+    accounts.setdefault('receivable', defaults.get('default_receivable_account'))
+    return accounts if all(accounts.get(key) for key in ('bank', 'fees', 'receivable')) else None
+
+
+def post_escrow_journals(shop_id, company):
+    """
+    Post every unposted settlement of the shop, JOURNAL_BATCH_SIZE at a time, as one Journal Entry
+    each: Dr bank (escrow amount), Dr fees, Cr the customer's receivable. Commits per Journal Entry.
+    """
+    customer = frappe.local.conf.get('shopee_default_customer')
+    accounts = get_escrow_accounts(company) if company else None
+    if not (company and customer and accounts):
+        if frappe.db.exists(ESCROW_DOCTYPE, {'shop_id': normalize_id(shop_id), 'journal_entry': ['is', 'not set']}):
+            frappe.log_error(f"Cannot post escrow for shop {shop_id}: company={company!r}, "
+                             f"shopee_default_customer={customer!r}, accounts={accounts!r}", 'Shopee Escrow Sync Error')
+        return
+
+    while True:
+        rows = frappe.get_all(ESCROW_DOCTYPE, filters={'shop_id': normalize_id(shop_id), 'journal_entry': ['is', 'not set']},
+                              fields=['name', 'release_time', 'escrow_amount', 'commission_fee', 'service_fee', 'transaction_fee'],
+                              order_by='release_time asc', limit=JOURNAL_BATCH_SIZE)
+        if not rows:
+            return
+        try:
+            journal_entry = make_journal_entry(company, customer, accounts, shop_id, rows)
+            frappe.db.set_value(ESCROW_DOCTYPE, {'name': ['in', [row.name for row in rows]]},
+                                'journal_entry', journal_entry.name, update_modified=False)
+            frappe.db.commit()
+        except Exception:
+            frappe.db.rollback()
+            frappe.log_error(f"{frappe.get_traceback()}\n\nShop {shop_id}: {len(rows)} settlements", 'Shopee Escrow Sync Error')
+            return
+        log_sync_event('escrow_posted', shop_id, f"{journal_entry.name}: {len(rows)} settlements")
+
+
+def make_journal_entry(company, customer, accounts, shop_id, rows):
+    journal_entry = frappe.get_doc({
+        'doctype': 'Journal Entry',
+        'voucher_type': 'Bank Entry',
+        'company': company,
+        'posting_date': getdate(rows[-1].release_time),
+        'cheque_no': f"Shopee escrow {shop_id}",
+        'cheque_date': getdate(rows[-1].release_time),
+        'user_remark': f"Shopee escrow release for shop {shop_id}: {len(rows)} orders "
+                       f"({getdate(rows[0].release_time)} - {getdate(rows[-1].release_time)})",
+        'accounts': journal_entry_lines(accounts, customer, rows)
+    })
+    journal_entry.insert(ignore_permissions=True)
+    journal_entry.submit()
+    return journal_entry
+
+
+def journal_entry_lines(accounts, customer, rows):
+    """
+    Dr bank (escrow amount), Dr fees, Cr the customer's receivable (their sum). Settlements can be
+    negative (refunds, adjustments, fee rebates); a negative total is posted on the opposite side,
+    since Journal Entry rows do not take negative amounts. Zero totals get no row.
+    """
+    escrow_total = flt(sum(flt(row.escrow_amount) for row in rows), 2)
+    fees_total = flt(sum(flt(row.commission_fee) + flt(row.service_fee) + flt(row.transaction_fee) for row in rows), 2)
+    lines = [
+        amount_line(accounts['bank'], escrow_total),
+        amount_line(accounts['fees'], fees_total),
+        amount_line(accounts['receivable'], -flt(escrow_total + fees_total, 2), party_type='Customer', party=customer),
+    ]
+    return [line for line in lines if line]
+
+
+def amount_line(account, amount, **values):
+    """
+    Journal Entry row debiting a positive `amount` or crediting a negative one; None for zero.
+    """
+    if not amount:
+        return None
+    side = 'debit_in_account_currency' if amount > 0 else 'credit_in_account_currency'
+    return dict(values, account=account, **{side: abs(amount)})
+
+
+def handle_escrow_sync_error(shop_id, error):
+    if isinstance(error, ShopeeAPIError):
+        frappe.log_error(f"Shop {shop_id}: {error.message}", 'Shopee API Error: ' + error.error)
+    else:
+        frappe.log_error(f"Shop {shop_id}: {error}", 'Shopee Escrow Sync Error')
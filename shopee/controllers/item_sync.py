@@ -0,0 +1,348 @@
+import time
+import frappe
+from frappe.utils import cint, flt, now_datetime
+from .client import get_client, ShopeeAPIError, ShopeeHTTPError
+from .sync_cursor import get_cursor, set_cursor
+from .token_management import ensure_valid_access_token
+from .utils import normalize_id, map_concurrently
+from .metrics import incr, timer
+
+CURSOR_RESOURCE = 'items'
+
+# Shopee 接口限制：get_item_list 每页最多 100 条；get_item_base_info 每次最多 50 个 item_id
+ITEM_LIST_PAGE_SIZE = 100
+ITEM_BATCH_SIZE = 50
+ITEM_STATUSES = ('NORMAL', 'UNLIST', 'BANNED')
+CURSOR_OVERLAP_SECONDS = 60
+
+# get_model_list 只接受单个 item_id，按批并发请求
+DEFAULT_MODEL_WORKERS = 8
+
+# 新建 Item / Item Price 的默认值，可通过 site_config 覆盖
+DEFAULT_ITEM_GROUP = 'Products'
+DEFAULT_STOCK_UOM = 'Nos'
+DEFAULT_PRICE_LIST = 'Standard Selling'
+
+# 日志中最多列出的无 SKU 商品数
+MAX_LOGGED_SKIPPED = 20
+
+
+def sync_all_shops():
+    """
+    Scheduled entry point: enqueue one incremental catalog sync per authorized shop.
+    """
+    shop_ids = frappe.get_all('Shopee Token Management', filters={'active': 1, 'shop_id': ['is', 'set']}, pluck='shop_id')
+    for shop_id in shop_ids:
+        frappe.enqueue('shopee.controllers.item_sync.sync_shop_items', queue='long', shop_id=shop_id,
+                       job_id=f"shopee_item_sync:{shop_id}", deduplicate=True)
+
+
+def sync_shop_items(shop_id):
+    """
+    Pull every item of `shop_id` updated since the persisted cursor into Item and Item Price.
+
+    Item ids are streamed page by page and processed 50 at a time (base info, then model list for
+    items with variations); every batch is written and committed before the next page is
+    requested, so memory stays flat regardless of catalog size. The cursor only moves once the
+    whole range has been walked; an interrupted run repeats it, which the upserts tolerate.
+    """
+    client = get_client()
+    access_token = ensure_valid_access_token(shop_id=shop_id)
+
+    now = int(time.time())
+    cursor = get_cursor(shop_id, CURSOR_RESOURCE)
+    time_from = max(cursor - CURSOR_OVERLAP_SECONDS, 0) if cursor else None
+
+    skipped, skipped_count = [], 0
+    try:
+        with timer('job_seconds', {'job': 'sync_shop_items'}):
+            for item_ids in iter_item_batches(client, shop_id, access_token, time_from, now):
+                batch_skipped = sync_item_batch(client, shop_id, access_token, item_ids)
+                frappe.db.commit()
+                skipped_count += len(batch_skipped)
+                skipped = (skipped + batch_skipped)[:MAX_LOGGED_SKIPPED]
+            set_cursor(shop_id, CURSOR_RESOURCE, now)
+            frappe.db.commit()
+    except (ShopeeAPIError, ShopeeHTTPError) as e:
+        frappe.db.rollback()
+        handle_item_sync_error(shop_id, e)
+
+    if skipped_count:
+        frappe.log_error(f"{skipped_count} items without SKU skipped for shop {shop_id}, e.g. {', '.join(skipped)}",
+                         'Shopee Item Sync Error')
+
+
+def sync_items_by_id(shop_id, item_ids):
+    """
+    Fetch and upsert specific items, e.g. those announced by banned item or promotion pushes.
+    """
+    item_ids = [cint(item_id) for item_id in item_ids if item_id]
+    if not item_ids:
+        return
+    client = get_client()
+    access_token = ensure_valid_access_token(shop_id=shop_id)
+    try:
+        for i in range(0, len(item_ids), ITEM_BATCH_SIZE):
+            sync_item_batch(client, shop_id, access_token, item_ids[i:i + ITEM_BATCH_SIZE])
+    except (ShopeeAPIError, ShopeeHTTPError) as e:
+        frappe.db.rollback()
+        handle_item_sync_error(shop_id, e)
+        return
+    frappe.db.commit()
+
+
+def iter_item_list(client, shop_id, access_token, time_from=None, time_to=None):
+    """
+    Yield lists of item_id updated within [time_from, time_to] (the whole catalog if time_from
+    is None), one list per page.
+    """
+    offset = 0
+    while True:
+        params = {'offset': offset, 'page_size': ITEM_LIST_PAGE_SIZE, 'item_status': list(ITEM_STATUSES)}
+        if time_from is not None:
+            params.update({'update_time_from': time_from, 'update_time_to': time_to})
+        response = client.get('/api/v2/product/get_item_list', access_token=access_token, shop_id=shop_id,
+                              params=params).get('response', {})
+
+        item_ids = [item['item_id'] for item in response.get('item', [])]
+        if item_ids:
+            yield item_ids
+        if not response.get('has_next_page'):
+            return
+        offset = response.get('next_offset', offset + ITEM_LIST_PAGE_SIZE)
+
+
+def iter_item_batches(client, shop_id, access_token, time_from=None, time_to=None):
+    """
+    Re-chunk the item list pages into batches of ITEM_BATCH_SIZE item ids.
+    """
+    for item_ids in iter_item_list(client, shop_id, access_token, time_from, time_to):
+        for i in range(0, len(item_ids), ITEM_BATCH_SIZE):
+            yield item_ids[i:i + ITEM_BATCH_SIZE]
+
+
+def sync_item_batch(client, shop_id, access_token, item_ids):
+    """
+    Fetch one batch of items (and their models) and upsert them without committing.
+    Returns the Shopee ids of items/models skipped because they have no SKU.
+    """
+    items = get_item_base_info(client, shop_id, access_token, item_ids)
+    models = get_model_lists(client, shop_id, access_token, [item['item_id'] for item in items if item.get('has_model')])
+
+    rows, skipped = build_item_rows(shop_id, items, models)
+    failed = upsert_items(rows)
+    upsert_item_prices([row for row in rows if row['item_code'] not in failed])
+    incr('items_synced', len(rows))
+    return skipped
+
+
+def get_item_base_info(client, shop_id, access_token, item_ids):
+    response = client.get('/api/v2/product/get_item_base_info', access_token=access_token, shop_id=shop_id, params={
+        'item_id_list': ','.join(str(item_id) for item_id in item_ids)
+    })
+    return response.get('response', {}).get('item_list', [])
+
+
+def get_model_lists(client, shop_id, access_token, item_ids):
+    """
+    Return {item_id: get_model_list response} for items with variations, fetched concurrently.
+    """
+    max_workers = cint(frappe.local.conf.get('shopee_item_sync_workers')) or DEFAULT_MODEL_WORKERS
+    results = map_concurrently(
+        lambda item_id: client.get('/api/v2/product/get_model_list', access_token=access_token, shop_id=shop_id,
+                                   params={'item_id': item_id}).get('response', {}),
+        item_ids, max_workers)
+
+    models = {}
+    for item_id, response, error in results:
+        if error:
+            raise error
+        models[item_id] = response
+    return models
+
+
+def build_item_rows(shop_id, items, models):
+    """
+    Flatten items and their models into one row per ERPNext Item (the SKU is the item_code,
+    as in order_sync.item_sku). Items and models without a SKU cannot be mapped and are skipped.
+    """
+    rows = []
+    skipped = []
+    for item in items:
+        disabled = 0 if item.get('item_status') == 'NORMAL' else 1
+        if item.get('has_model'):
+            model_list = models.get(item['item_id'], {})
+            tiers = model_list.get('tier_variation', [])
+            for model in model_list.get('model', []):
+                if not model.get('model_sku'):
+                    skipped.append(f"{item['item_id']}/{model.get('model_id')}")
+                    continue
+                rows.append(item_row(shop_id, item, model['model_sku'], model_name(item, tiers, model),
+                                     model.get('model_id'), model.get('price_info'), disabled))
+        elif item.get('item_sku'):
+            rows.append(item_row(shop_id, item, item['item_sku'], item.get('item_name'), None,
+                                 item.get('price_info'), disabled))
+        else:
+            skipped.append(str(item['item_id']))
+    return rows, skipped
+
+
+def item_row(shop_id, item, sku, item_name, model_id, price_info, disabled):
+    price = (price_info or [{}])[0]
+    return {
+        'item_code': sku,
+        'item_name': (item_name or sku)[:140],
+        'shopee_item_id': normalize_id(item['item_id']),
+        'shopee_model_id': normalize_id(model_id) if model_id else None,
+        'shopee_shop_id': normalize_id(shop_id),
+        'disabled': disabled,
+        'price': flt(price.get('current_price')),
+        'currency': price.get('currency')
+    }
+
+
+def model_name(item, tiers, model):
+    """
+    "<item name> - <option> / <option>" built from the model's tier_index.
+    """
+    options = []
+    for tier, index in zip(tiers, model.get('tier_index', [])):
+        option_list = tier.get('option_list', [])
+        if index < len(option_list):
+            options.append(option_list[index].get('option'))
+    name = item.get('item_name') or model.get('model_sku')
+    return f"{name} - {' / '.join(filter(None, options))}" if options else name
+
+
+def upsert_items(rows):
+    """
+    Write a batch of item rows to Item without committing.
+
+    Existing Items are resolved with one query and changed ones are updated with one bulk UPDATE;
+    new Items are inserted as documents (see insert_items). Returns the item_codes that failed to insert.
+    """
+    if not rows:
+        return set()
+    fields = ('item_name', 'shopee_item_id', 'shopee_model_id', 'shopee_shop_id', 'disabled')
+
+    existing = {
+        row.name: row
+        for row in frappe.get_all('Item', filters={'name': ['in', [r['item_code'] for r in rows]]},
+                                  fields=('name',) + fields)
+    }
+
+    updates = {}
+    new_rows = {}
+    for row in rows:
+        current = existing.get(row['item_code'])
+        if not current:
+            new_rows.setdefault(row['item_code'], row)
+            continue
+        values = {field: row[field] for field in fields if (current.get(field) or None) != (row[field] or None)}
+        if values:
+            updates[row['item_code']] = values
+
+    if updates:
+        frappe.db.bulk_update('Item', updates)
+        incr('db_rows_written', len(updates), {'doctype': 'Item', 'op': 'update'})
+    if new_rows:
+        return insert_items(list(new_rows.values()))
+    return set()
+
+
+def insert_items(rows):
+    """
+    Insert new stock Items (item_code as name, the configured item group and stock UOM) as documents
+    in the batch transaction, so Item.validate/after_insert add item defaults, UOM conversions etc.
+
+    A row failing validation is rolled back on its own and logged; an Item created concurrently by
+    another job is left untouched. Returns the item_codes that failed.
+    """
+    conf = frappe.local.conf
+    item_group = conf.get('shopee_item_group') or DEFAULT_ITEM_GROUP
+    stock_uom = conf.get('shopee_stock_uom') or DEFAULT_STOCK_UOM
+
+    inserted = 0
+    failed = {}
+    for row in rows:
+        doc = frappe.get_doc({
+            'doctype': 'Item',
+            'item_code': row['item_code'],
+            'item_name': row['item_name'],
+            'description': row['item_name'],
+            'item_group': item_group,
+            'stock_uom': stock_uom,
+            'is_stock_item': 1,
+            'disabled': row['disabled'],
+            'shopee_item_id': row['shopee_item_id'],
+            'shopee_model_id': row['shopee_model_id'],
+            'shopee_shop_id': row['shopee_shop_id']
+        })
+        frappe.db.savepoint('shopee_item_insert')
+        try:
+            doc.insert(ignore_permissions=True)
+        except frappe.DuplicateEntryError:
+            frappe.db.rollback(save_point='shopee_item_insert')
+            continue
+        except Exception:
+            frappe.db.rollback(save_point='shopee_item_insert')
+            failed[row['item_code']] = frappe.get_traceback()
+            continue
+        inserted += 1
+
+    incr('db_rows_written', inserted, {'doctype': 'Item', 'op': 'insert'})
+    if failed:
+        frappe.log_error("Items that failed to insert:\n\n" +
+                         "\n\n".join(f"{item_code}:\n{traceback}" for item_code, traceback in failed.items()),
+                         'Shopee Item Sync Error')
+    return set(failed)
+
+
+def upsert_item_prices(rows):
+    """
+    Write the Shopee current price of each row to the configured selling Price List without committing:
+    one lookup, one bulk UPDATE for changed rates and one bulk INSERT for new Item Prices.
+    """
+    rows = [row for row in rows if row['price']]
+    if not rows:
+        return
+    price_list = frappe.local.conf.get('shopee_price_list') or DEFAULT_PRICE_LIST
+    default_currency = frappe.db.get_value('Price List', price_list, 'currency')
+
+    existing = {
+        row.item_code: row
+        for row in frappe.get_all('Item Price', filters={'price_list': price_list,
+                                                         'item_code': ['in', [r['item_code'] for r in rows]]},
+                                  fields=['name', 'item_code', 'price_list_rate'])
+    }
+
+    now = now_datetime()
+    updates = {}
+    inserts = []
+    for row in {row['item_code']: row for row in rows}.values():
+        current = existing.get(row['item_code'])
+        if current:
+            if flt(current.price_list_rate) != row['price']:
+                updates[current.name] = {'price_list_rate': row['price']}
+            continue
+        inserts.append((
+            frappe.generate_hash(length=10), now, now, frappe.session.user, frappe.session.user, 0,
+            row['item_code'], row['item_name'], price_list, row['price'], row['currency'] or default_currency, 1, 0
+        ))
+
+    if updates:
+        frappe.db.bulk_update('Item Price', updates)
+        incr('db_rows_written', len(updates), {'doctype': 'Item Price', 'op': 'update'})
+    if inserts:
+        frappe.db.bulk_insert('Item Price',
+                              ['name', 'creation', 'modified', 'owner', 'modified_by', 'docstatus',
+                               'item_code', 'item_name', 'price_list', 'price_list_rate', 'currency', 'selling', 'buying'],
+                              inserts)
+        incr('db_rows_written', len(inserts), {'doctype': 'Item Price', 'op': 'insert'})
+
+
+def handle_item_sync_error(shop_id, error):
+    if isinstance(error, ShopeeAPIError):
+        frappe.log_error(f"Shop {shop_id}: {error.message}", 'Shopee API Error: ' + error.error)
+    else:
+        frappe.log_error(f"Shop {shop_id}: {error}", 'Shopee Item Sync Error')
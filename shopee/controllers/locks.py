@@ -0,0 +1,42 @@
+import time
+import frappe
+from contextlib import contextmanager
+from redis.exceptions import LockError
+from .metrics import incr, observe
+
+LOCK_PREFIX = "shopee:lock:"
+
+
+@contextmanager
+def distributed_lock(name, timeout=30, blocking_timeout=10, metric='lock'):
+    """
+    Hold a Redis lock shared by every worker of the site.
+
+    Yields True once the lock is held, or False if it could not be acquired within
+    `blocking_timeout` seconds. `timeout` bounds how long a crashed holder can keep it.
+    Wait time is recorded as `<metric>_wait_seconds`, and every acquisition that had to
+    wait for another holder increments `<metric>_contended`.
+    """
+    cache = frappe.cache()
+    lock = cache.lock(cache.make_key(f"{LOCK_PREFIX}{name}"), timeout=timeout)
+
+    start = time.monotonic()
+    acquired = lock.acquire(blocking=False)
+    if not acquired:
+        incr(f"{metric}_contended")
+        acquired = lock.acquire(blocking=True, blocking_timeout=blocking_timeout)
+        waited = time.monotonic() - start
+        observe(f"{metric}_wait_seconds", waited)
+        frappe.logger("shopee").info(f"Waited {waited:.3f}s for lock {name} (acquired={acquired})")
+        if not acquired:
+            incr(f"{metric}_timeout")
+
+    try:
+        yield acquired
+    finally:
+        if acquired:
+            try:
+                lock.release()
+            except LockError:
+                # The lock expired while we held it; someone else may own it now.
+                pass
@@ -0,0 +1,187 @@
+import frappe
+from frappe import _
+from .client import get_client, ShopeeAPIError, ShopeeHTTPError
+from .token_management import ensure_valid_access_token
+from .utils import normalize_id
+from .metrics import incr, timer
+from .audit import log_sync_event
+
+# Shopee 接口限制：mass_ship_order / batch_ship_order 每次最多 50 个包裹/订单
+SHIP_BATCH_SIZE = 50
+READY_TO_SHIP = 'READY_TO_SHIP'
+# arrange shipment 成功后 Shopee 的订单状态
+PROCESSED = 'PROCESSED'
+
+
+def arrange_shipment(shop_ids=None, order_sns=None):
+    """
+    Background job: arrange shipment for every READY_TO_SHIP Sales Order of `shop_ids`
+    (or only `order_sns`), publishing progress to the user who started it.
+
+    Orders are grouped by shop, logistics channel and pickup address; get_shipping_parameter is
+    called once per group and the group is shipped in batches of 50. Outcomes are written back
+    with one bulk UPDATE and committed per batch.
+    """
+    groups = group_orders(get_ready_orders(shop_ids, order_sns))
+    progress = {'done': 0, 'total': sum(len(orders) for orders in groups.values())}
+    shipped = 0
+    errors = []
+
+    with timer('job_seconds', {'job': 'arrange_shipment'}):
+        for (shop_id, channel_id, address_id), orders in groups.items():
+            shipped += ship_group(shop_id, channel_id, address_id, orders, errors, progress)
+
+    total = progress['total']
+    incr('orders_shipped', shipped, {'result': 'success'})
+    incr('orders_shipped', total - shipped, {'result': 'failure'})
+    if errors:
+        frappe.log_error("\n".join(errors), 'Shopee Mass Ship Error')
+    log_sync_event('shipment_arranged', None, f"{shipped} of {total} orders")
+    return {'total': total, 'shipped': shipped, 'failed': total - shipped}
+
+
+def get_ready_orders(shop_ids=None, order_sns=None):
+    filters = {'shopee_order_status': READY_TO_SHIP, 'docstatus': ['!=', 2]}
+    if shop_ids:
+        filters['shopee_shop_id'] = ['in', [normalize_id(shop_id) for shop_id in shop_ids]]
+    if order_sns:
+        filters['shopee_order_sn'] = ['in', order_sns]
+    return frappe.get_all('Sales Order', filters=filters, order_by='delivery_date asc',
+                          fields=['name', 'shopee_order_sn', 'shopee_shop_id', 'shopee_package_number',
+                                  'shopee_logistics_channel_id', 'set_warehouse'])
+
+
+def group_orders(orders):
+    """
+    {(shop_id, logistics_channel_id, pickup address_id): [orders]}.
+    """
+    addresses = frappe.local.conf.get('shopee_pickup_addresses') or {}
+    groups = {}
+    for order in orders:
+        key = (order.shopee_shop_id, order.shopee_logistics_channel_id, pickup_address_id(order, addresses))
+        groups.setdefault(key, []).append(order)
+    return groups
+
+
+def pickup_address_id(order, addresses):
+    """
+    Pickup address from site_config shopee_pickup_addresses, keyed by the order's warehouse or its
+    shop_id. None uses the shop's default pickup address.
+    """
+    address_id = addresses.get(order.set_warehouse) if order.set_warehouse else None
+    return str(address_id or addresses.get(order.shopee_shop_id) or '') or None
+
+
+def ship_group(shop_id, channel_id, address_id, orders, errors, progress):
+    """
+    Ship one group and return the number of orders shipped. If the group's parameters cannot be
+    fetched or a call fails, the unshipped rest of the group is marked with the error.
+    """
+    shipped = 0
+    batch, pending = [], orders
+    try:
+        client = get_client()
+        access_token = ensure_valid_access_token(shop_id=shop_id)
+        method = shipping_method(get_shipping_parameter(client, shop_id, access_token, orders[0]), address_id)
+        if not method:
+            frappe.throw(_('No pickup address or drop-off option available for logistics channel {0}').format(channel_id))
+
+        while pending:
+            batch, pending = pending[:SHIP_BATCH_SIZE], pending[SHIP_BATCH_SIZE:]
+            failures = ship_batch(client, shop_id, access_token, channel_id, method, batch)
+            write_outcomes(batch, failures)
+            frappe.db.commit()
+            shipped += len(batch) - len(failures)
+            errors.extend(f"{order_sn}: {message}" for order_sn, message in failures.items())
+            publish_ship_progress(progress, len(batch))
+    except (ShopeeAPIError, ShopeeHTTPError, frappe.ValidationError) as e:
+        frappe.db.rollback()
+        message = e.message if isinstance(e, ShopeeAPIError) else str(e)
+        failed = batch + pending
+        write_outcomes(failed, {order.shopee_order_sn: message for order in failed})
+        frappe.db.commit()
+        errors.append(f"Shop {shop_id}, channel {channel_id}: {message} ({len(failed)} orders)")
+        publish_ship_progress(progress, len(failed))
+    return shipped
+
+
+def get_shipping_parameter(client, shop_id, access_token, order):
+    params = {'order_sn': order.shopee_order_sn}
+    if order.shopee_package_number:
+        params['package_number'] = order.shopee_package_number
+    return client.get('/api/v2/logistics/get_shipping_parameter', access_token=access_token, shop_id=shop_id,
+                      params=params).get('response') or {}
+
+
+def shipping_method(parameter, address_id=None):
+    """
+    Build the pickup / dropoff / non_integrated part of the ship request from get_shipping_parameter:
+    the configured (else the default pickup, else the first) address with its first time slot,
+    or the first drop-off branch.
+    """
+    info_needed = parameter.get('info_needed') or {}
+    if 'pickup' in info_needed:
+        addresses = (parameter.get('pickup') or {}).get('address_list') or []
+        address = next((a for a in addresses if address_id and str(a.get('address_id')) == address_id), None) or \
+            next((a for a in addresses if 'pickup_address' in (a.get('address_flag') or [])), None) or \
+            (addresses[0] if addresses else None)
+        if not address:
+            return None
+        pickup = {'address_id': address['address_id']}
+        slots = address.get('time_slot_list') or []
+        if slots and 'pickup_time_id' in info_needed['pickup']:
+            pickup['pickup_time_id'] = slots[0]['pickup_time_id']
+        return {'pickup': pickup}
+    if 'dropoff' in info_needed:
+        dropoff = {}
+        branches = (parameter.get('dropoff') or {}).get('branch_list') or []
+        if branches and 'branch_id' in info_needed['dropoff']:
+            dropoff['branch_id'] = branches[0]['branch_id']
+        return {'dropoff': dropoff}
+    return {'non_integrated': {}}
+
+
+def ship_batch(client, shop_id, access_token, channel_id, method, batch):
+    """
+    Ship up to 50 orders in one call: mass_ship_order when every order has a package number
+    (same channel), batch_ship_order otherwise. Returns {order_sn: failure message}.
+    """
+    if channel_id and all(order.shopee_package_number for order in batch):
+        packages = {order.shopee_package_number: order.shopee_order_sn for order in batch}
+        response = client.post('/api/v2/logistics/mass_ship_order', access_token=access_token, shop_id=shop_id,
+                               body=dict(method, logistics_channel_id=int(channel_id),
+                                         package_list=[{'package_number': number} for number in packages]))
+        return {packages[result['package_number']]: result.get('fail_message') or result.get('fail_error')
+                for result in (response.get('response') or {}).get('fail_list', [])
+                if result.get('package_number') in packages}
+
+    order_list = []
+    for order in batch:
+        entry = {'order_sn': order.shopee_order_sn}
+        if order.shopee_package_number:
+            entry['package_number'] = order.shopee_package_number
+        order_list.append(entry)
+    response = client.post('/api/v2/logistics/batch_ship_order', access_token=access_token, shop_id=shop_id,
+                           body=dict(method, order_list=order_list))
+    return {result['order_sn']: result.get('fail_message') or result['fail_error']
+            for result in (response.get('response') or {}).get('result_list', []) if result.get('fail_error')}
+
+
+def write_outcomes(orders, failures):
+    """
+    Mark shipped orders PROCESSED and store the failure message of the others, in one bulk UPDATE.
+    """
+    updates = {
+        order.name: {'shopee_ship_error': failures[order.shopee_order_sn]} if order.shopee_order_sn in failures
+        else {'shopee_order_status': PROCESSED, 'shopee_ship_error': None}
+        for order in orders
+    }
+    if updates:
+        frappe.db.bulk_update('Sales Order', updates)
+        incr('db_rows_written', len(updates), {'doctype': 'Sales Order', 'op': 'update'})
+
+
+def publish_ship_progress(progress, count):
+    progress['done'] += count
+    frappe.publish_progress(progress['done'] * 100 / (progress['total'] or 1), title=_('Arranging Shopee Shipment'),
+                            description=_('{0} of {1} orders').format(progress['done'], progress['total']))
@@ -0,0 +1,194 @@
+import json
+import time
+import threading
+import frappe
+from contextlib import contextmanager
+from redis.exceptions import RedisError
+
+# 所有指标都存放在同一个 Redis hash 中（按站点区分），字段名为 "<metric>|<labels json>"
+METRICS_KEY = "shopee:metrics"
+
+# 进程内先累加，最多每 FLUSH_INTERVAL 秒（以及每个请求/后台任务结束时）用一个 pipeline 写入 Redis
+FLUSH_INTERVAL = 5
+
+# Histogram buckets (seconds)
+API_LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10, 20)
+HANDLER_BUCKETS = (0.01, 0.05, 0.1, 0.5, 1, 5, 30, 120)
+
+# (redis key, field) -> pending amount
+_pending = {}
+_pending_lock = threading.Lock()
+_last_flush = time.monotonic()
+
+
+def metrics_key():
+    """
+    Site-prefixed Redis key of the metrics hash. Resolve it on the request/job thread and pass it
+    as `key` when recording from worker threads, which have no site context.
+    """
+    return frappe.cache().make_key(METRICS_KEY)
+
+
+def metric_field(metric, labels=None):
+    if not labels:
+        return metric
+    return f"{metric}|{json.dumps({k: str(v) for k, v in labels.items()}, sort_keys=True)}"
+
+
+def incr(metric, amount=1, labels=None, key=None):
+    """
+    Increment a counter. Metrics must never break the caller, so Redis errors are ignored.
+    """
+    _add(key or metrics_key(), [(metric_field(metric, labels), amount)])
+
+
+def observe(metric, value, labels=None, buckets=None, key=None):
+    """
+    Record a sample (e.g. a duration in seconds) as `<metric>_count` and `<metric>_sum`,
+    plus cumulative `<metric>_bucket` counters when `buckets` is given.
+    """
+    fields = [(metric_field(f"{metric}_count", labels), 1), (metric_field(f"{metric}_sum", labels), float(value))]
+    if buckets:
+        for le in list(buckets) + ['+Inf']:
+            if le == '+Inf' or value <= le:
+                fields.append((metric_field(f"{metric}_bucket", dict(labels or {}, le=le)), 1))
+    _add(key or metrics_key(), fields)
+
+
+@contextmanager
+def timer(metric, labels=None, buckets=HANDLER_BUCKETS, key=None):
+    """
+    Observe the wall time of the block as a histogram sample of `metric`.
+    """
+    key = key or metrics_key()
+    start = time.monotonic()
+    try:
+        yield
+    finally:
+        observe(metric, time.monotonic() - start, labels, buckets, key)
+
+
+def _add(key, fields):
+    with _pending_lock:
+        for field, amount in fields:
+            _pending[(key, field)] = _pending.get((key, field), 0) + amount
+        due = time.monotonic() - _last_flush >= FLUSH_INTERVAL
+    if due:
+        flush()
+
+
+def flush():
+    """
+    Write the counters accumulated in this process to Redis in one pipeline.
+    Also registered as after_request/after_job hook so short-lived work horses do not lose them.
+    """
+    global _last_flush
+    with _pending_lock:
+        pending = dict(_pending)
+        _pending.clear()
+        _last_flush = time.monotonic()
+    if not pending:
+        return
+
+    try:
+        pipe = frappe.cache().pipeline(transaction=False)
+        for (key, field), amount in pending.items():
+            if isinstance(amount, float):
+                pipe.hincrbyfloat(key, field, amount)
+            else:
+                pipe.hincrby(key, field, amount)
+        pipe.execute()
+    except RedisError:
+        pass
+
+
+def get_metrics():
+    """
+    Return every recorded metric as a {field: number} dict.
+    """
+    # RedisWrapper.hgetall expects pickled values, so read the raw hash through a pipeline
+    pipe = frappe.cache().pipeline()
+    pipe.hgetall(metrics_key())
+    raw = pipe.execute()[0] or {}
+    return {frappe.safe_decode(k): float(v) for k, v in raw.items()}
+
+
+def render_prometheus(metrics, gauges=None, prefix='shopee_'):
+    """
+    Render get_metrics() (and optional {metric_field: value} gauges) in the Prometheus text exposition format.
+
+    Families with `_bucket` samples are histograms, `_count`/`_sum` only are summaries,
+    everything else is a counter exposed as `<name>_total`.
+    """
+    families = {}
+    for field, value in metrics.items():
+        name, _, labels = field.partition('|')
+        labels = json.loads(labels) if labels else {}
+        base, suffix = name, ''
+        for candidate in ('_bucket', '_count', '_sum'):
+            if name.endswith(candidate):
+                base, suffix = name[:-len(candidate)], candidate
+        families.setdefault(base, []).append((suffix, labels, value))
+
+    lines = []
+    for base in sorted(families):
+        samples = families[base]
+        suffixes = {suffix for suffix, _, _ in samples}
+        if '_bucket' in suffixes:
+            kind = 'histogram'
+            samples = fill_buckets(samples)
+        elif suffixes <= {'_count', '_sum'}:
+            kind = 'summary'
+        else:
+            kind = 'counter'
+
+        name = f"{prefix}{base}" + ('_total' if kind == 'counter' else '')
+        lines.append(f"# TYPE {name} {kind}")
+        for suffix, labels, value in sorted(samples, key=_sample_sort_key):
+            lines.append(f"{name}{suffix}{format_labels(labels)} {format_value(value)}")
+
+    gauge_families = {}
+    for field, value in (gauges or {}).items():
+        name, _, labels = field.partition('|')
+        gauge_families.setdefault(name, []).append((json.loads(labels) if labels else {}, value))
+    for name in sorted(gauge_families):
+        lines.append(f"# TYPE {prefix}{name} gauge")
+        for labels, value in sorted(gauge_families[name], key=lambda sample: sorted(sample[0].items())):
+            lines.append(f"{prefix}{name}{format_labels(labels)} {format_value(value)}")
+
+    return "\n".join(lines) + "\n"
+
+
+def fill_buckets(samples):
+    """
+    Buckets below the smallest sample of a series were never written; expose them as 0.
+    """
+    bounds = {labels['le'] for suffix, labels, _ in samples if suffix == '_bucket'}
+    seen = {}
+    for suffix, labels, _ in samples:
+        if suffix == '_bucket':
+            series = tuple(sorted((k, v) for k, v in labels.items() if k != 'le'))
+            seen.setdefault(series, set()).add(labels['le'])
+    missing = [('_bucket', dict(series, le=le), 0) for series, present in seen.items() for le in bounds - present]
+    return samples + missing
+
+
+def _sample_sort_key(sample):
+    suffix, labels, _ = sample
+    le = labels.get('le')
+    other = sorted((k, v) for k, v in labels.items() if k != 'le')
+    return (other, suffix, float(le) if le is not None else 0)
+
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    escaped = (
+        f'{k}="' + str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') + '"'
+        for k, v in sorted(labels.items())
+    )
+    return '{' + ','.join(escaped) + '}'
+
+
+def format_value(value):
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
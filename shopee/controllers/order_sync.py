@@ -0,0 +1,270 @@
+import time
+import frappe
+from datetime import datetime
+from frappe.utils import cint, flt, getdate, add_days
+from .client import get_client, ShopeeAPIError, ShopeeHTTPError
+from .sync_cursor import get_cursor, set_cursor
+from .token_management import ensure_valid_access_token
+from .utils import normalize_id
+from .metrics import incr, timer
+
+CURSOR_RESOURCE = 'orders'
+
+# Shopee 接口限制：get_order_list 单次时间窗口最多 15 天、每页最多 100 条；get_order_detail 每次最多 50 个 order_sn
+MAX_WINDOW_SECONDS = 15 * 24 * 3600
+ORDER_LIST_PAGE_SIZE = 100
+ORDER_DETAIL_BATCH_SIZE = 50
+
+# 首次同步回溯的时间，以及每次增量同步与上次游标的重叠（防止边界上的漏单）
+INITIAL_LOOKBACK_SECONDS = MAX_WINDOW_SECONDS
+CURSOR_OVERLAP_SECONDS = 60
+# 未能导入的订单（SKU 未映射、缺少公司/客户配置、Sales Order 校验失败）会让游标停在它们之前，下次同步时重试；
+# 超过此时长仍未导入的订单不再阻挡游标
+SKIPPED_RETRY_SECONDS = 7 * 24 * 3600
+
+ORDER_DETAIL_FIELDS = 'buyer_user_id,buyer_username,item_list,total_amount,pay_time,shipping_carrier,package_list'
+
+
+def sync_all_shops():
+    """
+    Scheduled entry point: enqueue one incremental order sync per authorized shop.
+    """
+    shop_ids = frappe.get_all('Shopee Token Management', filters={'active': 1, 'shop_id': ['is', 'set']}, pluck='shop_id')
+    for shop_id in shop_ids:
+        frappe.enqueue('shopee.controllers.order_sync.sync_shop_orders', queue='long', shop_id=shop_id,
+                       job_id=f"shopee_order_sync:{shop_id}", deduplicate=True)
+
+
+def sync_shop_orders(shop_id):
+    """
+    Pull every order of `shop_id` whose update_time moved since the persisted cursor.
+
+    Walks forward in 15-day windows, pages through get_order_list, fetches details 50 at a time
+    and upserts them; the cursor is committed after every window so an interrupted run resumes.
+    The cursor never moves past an order that could not be imported (for up to
+    SKIPPED_RETRY_SECONDS), so it is retried once its Items are mapped.
+    """
+    client = get_client()
+    access_token = ensure_valid_access_token(shop_id=shop_id)
+
+    now = int(time.time())
+    cursor = get_cursor(shop_id, CURSOR_RESOURCE)
+    time_from = max(cursor - CURSOR_OVERLAP_SECONDS, 0) if cursor else now - INITIAL_LOOKBACK_SECONDS
+
+    oldest_skipped = None
+    try:
+        with timer('job_seconds', {'job': 'sync_shop_orders'}):
+            while time_from < now:
+                time_to = min(time_from + MAX_WINDOW_SECONDS, now)
+                for order_sns in iter_order_list(client, shop_id, access_token, time_from, time_to):
+                    skipped = upsert_orders(shop_id, get_order_details(client, shop_id, access_token, order_sns))
+                    for order in skipped:
+                        update_time = cint(order.get('update_time'))
+                        if update_time > now - SKIPPED_RETRY_SECONDS:
+                            oldest_skipped = min(oldest_skipped or update_time, update_time)
+                next_cursor = min(time_to, oldest_skipped) if oldest_skipped else time_to
+                set_cursor(shop_id, CURSOR_RESOURCE, max(next_cursor, cursor))
+                frappe.db.commit()
+                time_from = time_to
+    except (ShopeeAPIError, ShopeeHTTPError) as e:
+        # 当前窗口回滚，下次从已提交的游标继续
+        frappe.db.rollback()
+        handle_order_sync_error(shop_id, e)
+
+
+def sync_orders_by_sn(shop_id, order_sns, tracking_numbers=None):
+    """
+    Fetch and upsert specific orders, e.g. those announced by order status (code 3) or
+    tracking number (code 4) pushes. `tracking_numbers` maps order_sn to a pushed tracking number.
+    """
+    if not order_sns:
+        return
+    client = get_client()
+    access_token = ensure_valid_access_token(shop_id=shop_id)
+    try:
+        upsert_orders(shop_id, get_order_details(client, shop_id, access_token, list(order_sns)), tracking_numbers)
+    except (ShopeeAPIError, ShopeeHTTPError) as e:
+        frappe.db.rollback()
+        handle_order_sync_error(shop_id, e)
+        return
+    frappe.db.commit()
+
+
+def iter_order_list(client, shop_id, access_token, time_from, time_to):
+    """
+    Yield lists of order_sn updated within [time_from, time_to], one list per page.
+    """
+    page_cursor = ''
+    while True:
+        response = client.get('/api/v2/order/get_order_list', access_token=access_token, shop_id=shop_id, params={
+            'time_range_field': 'update_time',
+            'time_from': time_from,
+            'time_to': time_to,
+            'page_size': ORDER_LIST_PAGE_SIZE,
+            'cursor': page_cursor
+        }).get('response', {})
+
+        order_sns = [order['order_sn'] for order in response.get('order_list', [])]
+        if order_sns:
+            yield order_sns
+        if not response.get('more'):
+            return
+        page_cursor = response.get('next_cursor', '')
+
+
+def get_order_details(client, shop_id, access_token, order_sns):
+    """
+    Fetch order details in batches of ORDER_DETAIL_BATCH_SIZE order_sns per call.
+    """
+    orders = []
+    for i in range(0, len(order_sns), ORDER_DETAIL_BATCH_SIZE):
+        response = client.get('/api/v2/order/get_order_detail', access_token=access_token, shop_id=shop_id, params={
+            'order_sn_list': ','.join(order_sns[i:i + ORDER_DETAIL_BATCH_SIZE]),
+            'response_optional_fields': ORDER_DETAIL_FIELDS
+        })
+        orders.extend(response.get('response', {}).get('order_list', []))
+    return orders
+
+
+def upsert_orders(shop_id, orders, tracking_numbers=None):
+    """
+    Write a batch of Shopee orders to Sales Order without committing.
+
+    Existing orders are resolved with one query and their Shopee status (and any pushed
+    tracking number) is updated with one bulk UPDATE. New orders are inserted as draft
+    Sales Orders; orders whose items are not mapped to an ERPNext Item, or that fail Sales Order
+    validation, are skipped and logged. Returns the skipped orders.
+    """
+    if not orders:
+        return []
+    tracking_numbers = tracking_numbers or {}
+
+    existing = {
+        row.shopee_order_sn: row
+        for row in frappe.get_all('Sales Order', filters={'shopee_order_sn': ['in', [o['order_sn'] for o in orders]]},
+                                  fields=['name', 'shopee_order_sn', 'shopee_update_time', 'shopee_package_number',
+                                          'shopee_logistics_channel_id'])
+    }
+
+    updates = {}
+    new_orders = []
+    for order in orders:
+        row = existing.get(order['order_sn'])
+        if not row:
+            new_orders.append(order)
+            continue
+        values = {}
+        if cint(order.get('update_time')) > cint(row.shopee_update_time):
+            values.update({
+                'shopee_order_status': order.get('order_status'),
+                'shopee_update_time': cint(order.get('update_time'))
+            })
+        if tracking_numbers.get(order['order_sn']):
+            values['shopee_tracking_number'] = tracking_numbers[order['order_sn']]
+        if package_number(order) and package_number(order) != row.shopee_package_number:
+            values['shopee_package_number'] = package_number(order)
+        if logistics_channel_id(order) and logistics_channel_id(order) != row.shopee_logistics_channel_id:
+            values['shopee_logistics_channel_id'] = logistics_channel_id(order)
+        if values:
+            updates[row.name] = values
+
+    if updates:
+        frappe.db.bulk_update('Sales Order', updates)
+        incr('db_rows_written', len(updates), {'doctype': 'Sales Order', 'op': 'update'})
+    if new_orders:
+        return insert_sales_orders(shop_id, new_orders, tracking_numbers)
+    return []
+
+
+def insert_sales_orders(shop_id, orders, tracking_numbers=None):
+    company = frappe.db.get_value('Company', {'entity_id': normalize_id(shop_id)}, 'name')
+    customer = frappe.local.conf.get('shopee_default_customer')
+    if not company or not customer:
+        frappe.log_error(f"Cannot import {len(orders)} orders for shop {shop_id}: "
+                         f"company={company!r}, shopee_default_customer={customer!r}", 'Shopee Order Sync Error')
+        return orders
+
+    # 一次查询解析所有 SKU 对应的 Item
+    skus = {item_sku(item) for order in orders for item in order.get('item_list', [])}
+    known_items = set(frappe.get_all('Item', filters={'name': ['in', list(skus)]}, pluck='name')) if skus else set()
+
+    unmapped = []
+    failed = []
+    inserted = 0
+    for order in orders:
+        lines = order.get('item_list', [])
+        if not lines or any(item_sku(item) not in known_items for item in lines):
+            unmapped.append(order)
+            continue
+
+        create_time = datetime.fromtimestamp(cint(order.get('create_time')) or int(time.time()))
+        delivery_date = getdate(datetime.fromtimestamp(cint(order['ship_by_date']))) if order.get('ship_by_date') \
+            else add_days(getdate(create_time), 7)
+        doc = frappe.get_doc({
+            'doctype': 'Sales Order',
+            'company': company,
+            'customer': customer,
+            'transaction_date': getdate(create_time),
+            'delivery_date': delivery_date,
+            'po_no': order['order_sn'],
+            'shopee_order_sn': order['order_sn'],
+            'shopee_shop_id': normalize_id(shop_id),
+            'shopee_order_status': order.get('order_status'),
+            'shopee_update_time': cint(order.get('update_time')),
+            'shopee_tracking_number': (tracking_numbers or {}).get(order['order_sn']),
+            'shopee_package_number': package_number(order),
+            'shopee_logistics_channel_id': logistics_channel_id(order),
+            'items': [{
+                'item_code': item_sku(item),
+                'qty': cint(item.get('model_quantity_purchased')) or 1,
+                'rate': flt(item.get('model_discounted_price') or item.get('model_original_price')),
+                'delivery_date': delivery_date
+            } for item in lines]
+        })
+        # 单个订单校验失败（会计期间关闭、Item 停用等）只跳过该订单，不影响同批其它订单和游标
+        frappe.db.savepoint('shopee_order_insert')
+        try:
+            doc.insert(ignore_permissions=True)
+        except Exception:
+            frappe.db.rollback(save_point='shopee_order_insert')
+            failed.append((order, frappe.get_traceback()))
+            continue
+        inserted += 1
+
+    incr('db_rows_written', inserted, {'doctype': 'Sales Order', 'op': 'insert'})
+    if unmapped:
+        frappe.log_error(f"Orders skipped for shop {shop_id} (unmapped items): "
+                         f"{', '.join(order['order_sn'] for order in unmapped)}", 'Shopee Order Sync Error')
+    if failed:
+        frappe.log_error(f"Orders that failed to insert for shop {shop_id}:\n\n" +
+                         "\n\n".join(f"{order['order_sn']}:\n{traceback}" for order, traceback in failed),
+                         'Shopee Order Sync Error')
+    return unmapped + [order for order, _ in failed]
+
+
+def item_sku(item):
+    """
+    ERPNext item_code for a Shopee order line: the model SKU if set, otherwise the item SKU.
+    """
+    return item.get('model_sku') or item.get('item_sku')
+
+
+def package_number(order):
+    """
+    The order's (first) logistics package number, needed for tracking and shipping documents.
+    """
+    packages = order.get('package_list') or []
+    return packages[0].get('package_number') if packages else None
+
+
+def logistics_channel_id(order):
+    packages = order.get('package_list') or []
+    channel = packages[0].get('logistics_channel_id') if packages else None
+    return str(channel) if channel else None
+
+
+def handle_order_sync_error(shop_id, error):
+    if isinstance(error, ShopeeAPIError):
+        frappe.log_error(f"Shop {shop_id}: {error.message}", 'Shopee API Error: ' + error.error)
+    else:
+        frappe.log_error(f"Shop {shop_id}: {error}", 'Shopee Order Sync Error')
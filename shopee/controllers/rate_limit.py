@@ -0,0 +1,83 @@
+import time
+import frappe
+from frappe.utils import flt
+from redis.exceptions import RedisError
+
+# 默认速率（每秒请求数），可通过 site_config 覆盖；设为 0 表示不限速
+DEFAULT_PARTNER_QPS = 50
+DEFAULT_SHOP_QPS = 10
+
+# Longest a caller will sleep for a single reservation before giving up on rate limiting.
+MAX_WAIT = 30
+
+# Token buckets with reservation semantics, evaluated atomically in Redis.
+# KEYS: one bucket per key. ARGV: rate_1, burst_1, rate_2, burst_2, ...
+# Each bucket refills at `rate` tokens/s up to `burst`; a request always takes one token
+# (the balance may go negative) and the script returns how many ms the caller must wait
+# until every bucket has paid off its reservation. Sharing the clock (Redis TIME) keeps
+# all workers consistent.
+TOKEN_BUCKET_SCRIPT = """
+local now_parts = redis.call('TIME')
+local now = tonumber(now_parts[1]) * 1000 + math.floor(tonumber(now_parts[2]) / 1000)
+local wait = 0
+for i, key in ipairs(KEYS) do
+    local rate = tonumber(ARGV[i * 2 - 1])
+    local burst = tonumber(ARGV[i * 2])
+    local state = redis.call('HMGET', key, 'tokens', 'ts')
+    local tokens = tonumber(state[1])
+    local ts = tonumber(state[2])
+    if tokens == nil then
+        tokens = burst
+        ts = now
+    end
+    tokens = math.min(burst, tokens + (now - ts) * rate / 1000) - 1
+    if tokens < 0 then
+        wait = math.max(wait, math.ceil(-tokens * 1000 / rate))
+    end
+    redis.call('HSET', key, 'tokens', tokens, 'ts', now)
+    redis.call('PEXPIRE', key, math.ceil((burst - tokens) * 1000 / rate) + 1000)
+end
+return wait
+"""
+
+
+class RateLimiter:
+    """
+    Shopee QPS limiter shared across workers: one token bucket per partner_id and one per shop_id.
+
+    Built on the job/request thread (it captures the site's Redis key prefix), after which
+    `acquire` may be called from any thread.
+    """
+    def __init__(self, partner_id, partner_qps=None, shop_qps=None):
+        conf = frappe.local.conf
+        cache = frappe.cache()
+        self.partner_id = partner_id
+        self.partner_qps = flt(partner_qps if partner_qps is not None else conf.get('shopee_partner_qps', DEFAULT_PARTNER_QPS))
+        self.shop_qps = flt(shop_qps if shop_qps is not None else conf.get('shopee_shop_qps', DEFAULT_SHOP_QPS))
+        self.prefix = cache.make_key("shopee:ratelimit:")
+        self.script = cache.register_script(TOKEN_BUCKET_SCRIPT)
+
+    def acquire(self, shop_id=None):
+        """
+        Reserve one request for the partner (and the shop, if given), sleeping until it may be sent.
+        Returns the number of seconds waited. Fails open if Redis is unavailable.
+        """
+        keys, args = [], []
+        if self.partner_qps > 0:
+            keys.append(f"{self.prefix}partner:{self.partner_id}")
+            args += [self.partner_qps, self.partner_qps]
+        if shop_id and self.shop_qps > 0:
+            keys.append(f"{self.prefix}shop:{shop_id}")
+            args += [self.shop_qps, self.shop_qps]
+        if not keys:
+            return 0
+
+        try:
+            wait = self.script(keys=keys, args=args) / 1000
+        except RedisError:
+            return 0
+
+        wait = min(wait, MAX_WAIT)
+        if wait > 0:
+            time.sleep(wait)
+        return wait
@@ -0,0 +1,43 @@
+import frappe
+from shopee.config import get_shopee_settings
+
+# entity_id (shop_id / merchant_id) -> region，来自 process_shop_data / process_merchant_data 写入的 Company.country
+CACHE_KEY = "shopee:entity_regions"
+
+
+def get_entity_regions():
+    """
+    Return {entity_id: region} of every Shopee company. Served from Redis; rebuilt with a single query on a miss.
+    """
+    regions = frappe.cache().get_value(CACHE_KEY)
+    if regions is None:
+        regions = {
+            entity_id: (country or '').upper()
+            for entity_id, country in frappe.get_all('Company', filters={'entity_id': ['is', 'set']},
+                                                     fields=['entity_id', 'country'], as_list=True)
+        }
+        frappe.cache().set_value(CACHE_KEY, regions)
+    return regions
+
+
+def invalidate_region_cache(doc=None, method=None):
+    """
+    Company on_update/on_trash hook: drop the cached regions.
+    """
+    frappe.cache().delete_value(CACHE_KEY)
+
+
+def get_region_hosts():
+    """
+    Return ({entity_id: host}, default host) for the current site: each company whose region has an
+    endpoint in site_config shopee_region_hosts is routed there, everything else uses the default host.
+    Resolve it on the request/job thread; the result is plain data that worker threads can use.
+    """
+    settings = get_shopee_settings()
+    if not settings.region_hosts:
+        return {}, settings.host
+    hosts = {
+        entity_id: settings.region_hosts[region]
+        for entity_id, region in get_entity_regions().items() if region in settings.region_hosts
+    }
+    return hosts, settings.host
@@ -0,0 +1,342 @@
+import os
+import time
+import hashlib
+import frappe
+from frappe.utils import cint, flt, now_datetime
+from .client import get_client, ShopeeAPIError, ShopeeHTTPError
+from .token_management import ensure_valid_access_token
+from .utils import normalize_id, map_concurrently
+from .metrics import incr, timer
+from .audit import log_sync_event
+
+# Shopee 接口限制：create/download_shipping_document 与 get_mass_tracking_number 每次最多 50 个包裹
+SHIPPING_DOCUMENT_BATCH_SIZE = 50
+TRACKING_BATCH_SIZE = 50
+DEFAULT_DOCUMENT_TYPE = 'THERMAL_AIR_WAYBILL'
+DEFAULT_DOWNLOAD_WORKERS = 8
+# 写入文件时每次读取的字节数
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+
+# Sales Order.shopee_document_status
+STATUS_PROCESSING = 'PROCESSING'
+STATUS_FAILED = 'FAILED'
+STATUS_DOWNLOADED = 'DOWNLOADED'
+
+# 面单就绪推送（code 15）在一个短窗口内合并，按 50 个一批下载
+READY_BUFFER_KEY = "shopee:shipping_documents:ready"
+# 每个缓冲条目失败的次数；达到上限后记录日志并丢弃，不再重试
+READY_ATTEMPTS_KEY = "shopee:shipping_documents:attempts"
+MAX_DOWNLOAD_ATTEMPTS = 5
+WINDOW_KEY = "shopee:shipping_documents:window"
+FLUSH_JOB_ID = "shopee_shipping_document_download"
+DEFAULT_WINDOW = 1  # 秒
+
+
+def get_document_type(document_type=None):
+    return document_type or frappe.local.conf.get('shopee_shipping_document_type') or DEFAULT_DOCUMENT_TYPE
+
+
+def prepare_shipping_documents(shop_id, order_sns, document_type=None):
+    """
+    Fetch missing tracking numbers and request shipping documents for the given orders,
+    50 per call. The labels are downloaded when Shopee pushes that they are ready (code 15).
+    """
+    client = get_client()
+    access_token = ensure_valid_access_token(shop_id=shop_id)
+    document_type = get_document_type(document_type)
+
+    orders = frappe.get_all('Sales Order', filters={'shopee_shop_id': normalize_id(shop_id), 'shopee_order_sn': ['in', order_sns]},
+                            fields=['name', 'shopee_order_sn', 'shopee_package_number', 'shopee_tracking_number'])
+    try:
+        with timer('job_seconds', {'job': 'prepare_shipping_documents'}):
+            missing = [order for order in orders if not order.shopee_tracking_number]
+            if missing:
+                tracking_numbers = fetch_tracking_numbers(client, shop_id, access_token, missing)
+                for order in missing:
+                    order.shopee_tracking_number = tracking_numbers.get(order.shopee_order_sn)
+                if tracking_numbers:
+                    by_order_sn = {order.shopee_order_sn: order.name for order in missing}
+                    frappe.db.bulk_update('Sales Order', {by_order_sn[order_sn]: {'shopee_tracking_number': tracking_number}
+                                                          for order_sn, tracking_number in tracking_numbers.items()})
+                    frappe.db.commit()
+
+            ready = [order for order in orders if order.shopee_tracking_number]
+            results = create_shipping_documents(client, shop_id, access_token, ready, document_type)
+    except (ShopeeAPIError, ShopeeHTTPError) as e:
+        frappe.db.rollback()
+        handle_shipping_error(shop_id, e)
+        return
+
+    failures = {order_sn: message for order_sn, message in results.items() if message}
+    updates = {order.name: {'shopee_document_status': STATUS_FAILED if order.shopee_order_sn in failures else STATUS_PROCESSING}
+               for order in ready if order.shopee_order_sn in results}
+    if updates:
+        frappe.db.bulk_update('Sales Order', updates, update_modified=False)
+    frappe.db.commit()
+
+    not_ready = [order.shopee_order_sn for order in orders if not order.shopee_tracking_number]
+    errors = [f"{order_sn}: {message}" for order_sn, message in failures.items()] + \
+             [f"{order_sn}: no tracking number" for order_sn in not_ready]
+    if errors:
+        frappe.log_error(f"Shop {shop_id}:\n" + "\n".join(errors), 'Shopee Shipping Document Error')
+    log_sync_event('shipping_documents_requested', shop_id, f"{len(updates) - len(failures)} orders")
+    return {'requested': len(updates) - len(failures), 'failed': len(errors)}
+
+
+def fetch_tracking_numbers(client, shop_id, access_token, orders):
+    """
+    Return {order_sn: tracking_number}: get_mass_tracking_number 50 packages per call for
+    orders with a known package number, get_tracking_number concurrently for the rest.
+    """
+    tracking_numbers = {}
+    packages = {order.shopee_package_number: order.shopee_order_sn for order in orders if order.shopee_package_number}
+    package_numbers = list(packages)
+    for i in range(0, len(package_numbers), TRACKING_BATCH_SIZE):
+        response = client.post('/api/v2/logistics/get_mass_tracking_number', access_token=access_token, shop_id=shop_id,
+                               body={'package_list': [{'package_number': number}
+                                                      for number in package_numbers[i:i + TRACKING_BATCH_SIZE]]})
+        for result in (response.get('response') or {}).get('success_list', []):
+            if result.get('tracking_number') and result.get('package_number') in packages:
+                tracking_numbers[packages[result['package_number']]] = result['tracking_number']
+
+    single = [order.shopee_order_sn for order in orders if not order.shopee_package_number]
+    max_workers = cint(frappe.local.conf.get('shopee_download_workers')) or DEFAULT_DOWNLOAD_WORKERS
+    for order_sn, response, error in map_concurrently(
+            lambda order_sn: client.get('/api/v2/logistics/get_tracking_number', access_token=access_token,
+                                        shop_id=shop_id, params={'order_sn': order_sn}),
+            single, max_workers):
+        if error:
+            raise error
+        tracking_number = (response.get('response') or {}).get('tracking_number')
+        if tracking_number:
+            tracking_numbers[order_sn] = tracking_number
+    return tracking_numbers
+
+
+def create_shipping_documents(client, shop_id, access_token, orders, document_type):
+    """
+    Call create_shipping_document 50 orders at a time.
+    Returns {order_sn: failure message or None}.
+    """
+    results = {}
+    for i in range(0, len(orders), SHIPPING_DOCUMENT_BATCH_SIZE):
+        response = client.post('/api/v2/logistics/create_shipping_document', access_token=access_token, shop_id=shop_id, body={
+            'order_list': [document_order(order, document_type) for order in orders[i:i + SHIPPING_DOCUMENT_BATCH_SIZE]]
+        })
+        for result in (response.get('response') or {}).get('result_list', []):
+            results[result.get('order_sn')] = result.get('fail_message') or result.get('fail_error') or None
+    return results
+
+
+def document_order(order, document_type=None):
+    entry = {'order_sn': order.shopee_order_sn}
+    if order.shopee_package_number:
+        entry['package_number'] = order.shopee_package_number
+    if order.get('shopee_tracking_number'):
+        entry['tracking_number'] = order.shopee_tracking_number
+    if document_type:
+        entry['shipping_document_type'] = document_type
+    return entry
+
+
+def handle_document_status_push(shop_id, push):
+    """
+    Shipping document status push (code 15): buffer READY documents for a batched download,
+    mark FAILED ones.
+    """
+    order_sn = push.get('ordersn') or push.get('order_sn')
+    if not (shop_id and order_sn):
+        return
+    status = push.get('status')
+    if status == 'READY':
+        buffer_ready_document(shop_id, order_sn, push.get('package_number'))
+    elif status == 'FAILED':
+        frappe.db.set_value('Sales Order', {'shopee_order_sn': order_sn}, 'shopee_document_status', STATUS_FAILED,
+                            update_modified=False)
+        frappe.log_error(f"Shop {shop_id}: shipping document for {order_sn} failed: {push}", 'Shopee Shipping Document Error')
+
+
+def buffer_ready_document(shop_id, order_sn, package_number=None):
+    cache = frappe.cache()
+    pipe = cache.pipeline()
+    pipe.hset(cache.make_key(READY_BUFFER_KEY), f"{normalize_id(shop_id)}:{order_sn}", package_number or '')
+    pipe.execute()
+    window = flt(frappe.local.conf.get('shopee_shipping_document_window')) or DEFAULT_WINDOW
+    if cache.set(cache.make_key(WINDOW_KEY), 1, nx=True, px=int(window * 1000)):
+        frappe.enqueue('shopee.controllers.shipping_document.download_ready_documents', queue='short',
+                       job_id=FLUSH_JOB_ID, deduplicate=True)
+
+
+def get_ready_documents(exclude=()):
+    """
+    Read the buffered READY documents not in `exclude` and close the window: {shop_id: [order_sn, ...]}.
+    Entries stay buffered until remove_ready_documents, so a failed or interrupted download is retried.
+    """
+    cache = frappe.cache()
+    pipe = cache.pipeline()
+    pipe.hkeys(cache.make_key(READY_BUFFER_KEY))
+    pipe.delete(cache.make_key(WINDOW_KEY))
+    fields, _ = pipe.execute()
+
+    ready = {}
+    for field in fields:
+        field = frappe.safe_decode(field)
+        if field in exclude:
+            continue
+        shop_id, order_sn = field.split(':', 1)
+        ready.setdefault(shop_id, []).append(order_sn)
+    return ready
+
+
+def remove_ready_documents(shop_id, order_sns):
+    if order_sns:
+        cache = frappe.cache()
+        fields = [f"{shop_id}:{order_sn}" for order_sn in order_sns]
+        pipe = cache.pipeline()
+        pipe.hdel(cache.make_key(READY_BUFFER_KEY), *fields)
+        pipe.hdel(cache.make_key(READY_ATTEMPTS_KEY), *fields)
+        pipe.execute()
+
+
+def record_failed_documents(shop_id, order_sns):
+    """
+    Count a failed download for each entry; entries that reached MAX_DOWNLOAD_ATTEMPTS are
+    removed from the buffer. Returns the dropped order_sns.
+    """
+    if not order_sns:
+        return []
+    cache = frappe.cache()
+    pipe = cache.pipeline()
+    for order_sn in order_sns:
+        pipe.hincrby(cache.make_key(READY_ATTEMPTS_KEY), f"{shop_id}:{order_sn}", 1)
+    dropped = [order_sn for order_sn, attempts in zip(order_sns, pipe.execute()) if attempts >= MAX_DOWNLOAD_ATTEMPTS]
+    remove_ready_documents(shop_id, dropped)
+    return dropped
+
+
+def retry_ready_documents():
+    """
+    Scheduled safety net: start a download run if READY documents are still buffered, e.g. after
+    a failed batch when the shop sends no further pushes.
+    """
+    cache = frappe.cache()
+    pipe = cache.pipeline()
+    pipe.hlen(cache.make_key(READY_BUFFER_KEY))
+    if pipe.execute()[0]:
+        frappe.enqueue('shopee.controllers.shipping_document.download_ready_documents', queue='short',
+                       job_id=FLUSH_JOB_ID, deduplicate=True)
+
+
+def download_ready_documents(document_type=None):
+    """
+    Background job: once the buffering window closes, download every READY document in PDFs of
+    up to 50 labels, streamed concurrently to private File storage, and attach them to the orders.
+    Repeats while new pushes keep arriving; documents that failed stay buffered for the next run
+    (see retry_ready_documents) until MAX_DOWNLOAD_ATTEMPTS.
+    """
+    cache = frappe.cache()
+    document_type = get_document_type(document_type)
+    attempted = set()
+    while True:
+        remaining = cache.pttl(cache.make_key(WINDOW_KEY))
+        if remaining and remaining > 0:
+            time.sleep(remaining / 1000)
+
+        ready = get_ready_documents(exclude=attempted)
+        if not ready:
+            return
+        attempted.update(f"{shop_id}:{order_sn}" for shop_id, order_sns in ready.items() for order_sn in order_sns)
+        with timer('job_seconds', {'job': 'download_shipping_documents'}):
+            download_documents(ready, document_type)
+
+
+def download_documents(ready, document_type):
+    client = get_client()
+    orders = frappe.get_all('Sales Order', filters={'shopee_order_sn': ['in', [sn for sns in ready.values() for sn in sns]]},
+                            fields=['name', 'shopee_order_sn', 'shopee_package_number'])
+    by_order_sn = {order.shopee_order_sn: order for order in orders}
+
+    jobs = []
+    errors = []
+    done = {}
+    failed = {}
+    for shop_id, order_sns in ready.items():
+        try:
+            access_token = ensure_valid_access_token(shop_id=shop_id)
+        except frappe.ValidationError as e:
+            errors.append(f"Shop {shop_id}: {e}")
+            failed[shop_id] = order_sns
+            continue
+        known = [by_order_sn[order_sn] for order_sn in order_sns if order_sn in by_order_sn]
+        # 找不到对应 Sales Order 的推送无法重试成功，直接移出缓冲
+        done[shop_id] = [order_sn for order_sn in order_sns if order_sn not in by_order_sn]
+        for i in range(0, len(known), SHIPPING_DOCUMENT_BATCH_SIZE):
+            file_name = f"shopee-labels-{shop_id}-{frappe.generate_hash(length=10)}.pdf"
+            jobs.append((shop_id, access_token, known[i:i + SHIPPING_DOCUMENT_BATCH_SIZE], file_name,
+                         frappe.get_site_path('private', 'files', file_name)))
+
+    def download(job):
+        shop_id, access_token, batch, file_name, path = job
+        response = client.stream('POST', '/api/v2/logistics/download_shipping_document', access_token=access_token,
+                                 shop_id=shop_id, body={'shipping_document_type': document_type,
+                                                        'order_list': [document_order(order) for order in batch]})
+        digest = hashlib.md5()
+        size = 0
+        try:
+            with response, open(path, 'wb') as f:
+                for chunk in response.iter_content(DOWNLOAD_CHUNK_SIZE):
+                    f.write(chunk)
+                    digest.update(chunk)
+                    size += len(chunk)
+        except Exception:
+            if os.path.exists(path):
+                os.remove(path)
+            raise
+        return size, digest.hexdigest()
+
+    max_workers = cint(frappe.local.conf.get('shopee_download_workers')) or DEFAULT_DOWNLOAD_WORKERS
+    updates = {}
+    files = []
+    now = now_datetime()
+    user = frappe.session.user
+    for (shop_id, _, batch, file_name, path), result, error in map_concurrently(download, jobs, max_workers):
+        if error:
+            if not isinstance(error, (ShopeeAPIError, ShopeeHTTPError, OSError)):
+                raise error
+            errors.append(f"Shop {shop_id} {', '.join(order.shopee_order_sn for order in batch)}: {error}")
+            failed.setdefault(shop_id, []).extend(order.shopee_order_sn for order in batch)
+            continue
+        size, content_hash = result
+        file_url = f"/private/files/{file_name}"
+        # 每个订单一条 File 记录（共用同一个 PDF），附加到 Sales Order，有订单读权限的用户即可打开；
+        # content_hash 直接写入，File 不必把整个 PDF 读回内存
+        for order in batch:
+            files.append((frappe.generate_hash(length=10), now, now, user, user, 0, file_name, file_url, 1, size,
+                          content_hash, 'Home/Attachments', 'Sales Order', order.name, 'shopee_shipping_document'))
+            updates[order.name] = {'shopee_shipping_document': file_url, 'shopee_document_status': STATUS_DOWNLOADED}
+        done.setdefault(shop_id, []).extend(order.shopee_order_sn for order in batch)
+
+    if files:
+        frappe.db.bulk_insert('File', ['name', 'creation', 'modified', 'owner', 'modified_by', 'docstatus', 'file_name',
+                                       'file_url', 'is_private', 'file_size', 'content_hash', 'folder',
+                                       'attached_to_doctype', 'attached_to_name', 'attached_to_field'], files)
+    if updates:
+        frappe.db.bulk_update('Sales Order', updates, update_modified=False)
+    frappe.db.commit()
+    # 提交之后才移出缓冲，失败或中断的批次留待下次重试
+    for shop_id, order_sns in done.items():
+        remove_ready_documents(shop_id, order_sns)
+    for shop_id, order_sns in failed.items():
+        dropped = record_failed_documents(shop_id, order_sns)
+        if dropped:
+            errors.append(f"Shop {shop_id}: gave up after {MAX_DOWNLOAD_ATTEMPTS} attempts: {', '.join(dropped)}")
+    incr('shipping_documents_downloaded', len(updates))
+    if errors:
+        frappe.log_error("\n".join(errors), 'Shopee Shipping Document Error')
+
+
+def handle_shipping_error(shop_id, error):
+    if isinstance(error, ShopeeAPIError):
+        frappe.log_error(f"Shop {shop_id}: {error.message}", 'Shopee API Error: ' + error.error)
+    else:
+        frappe.log_error(f"Shop {shop_id}: {error}", 'Shopee Shipping Document Error')
@@ -1,42 +1,73 @@
 import frappe
-import requests
 from datetime import datetime
-from .utils import generate_signature  # 确保这个函数可以生成正确的签名
+from frappe.utils import cint
+from .client import get_client, ShopeeAPIError, ShopeeHTTPError
+from .utils import map_concurrently, normalize_id
+from .audit import log_sync_event
 from shopee.shopee.doctype.shopee_token_management.api_helper import get_token_by_shop_or_merchant_id
-from shopee.config import SHOPEE_URL, get_partner_id, get_partner_key
 
-# 常量配置
-PARTNER_ID = get_partner_id()
-PARTNER_KEY = get_partner_key()
+# 授权后并发拉取商户/店铺信息的默认并发数，可通过 site_config 的 shopee_onboarding_workers 覆盖
+DEFAULT_ONBOARDING_WORKERS = 8
 
 def fetch_merchant_info(merchant_id):
-    # 获取必要的 token 和时间戳
+    # 获取必要的 token
     access_token = get_token_by_shop_or_merchant_id(merchant_id=merchant_id)
-    timestamp = int(datetime.now().timestamp())
-    sign = generate_signature(PARTNER_ID, '/api/v2/merchant/get_merchant_info', timestamp, access_token=access_token, merchant_id=merchant_id)
-
-    # 构建请求 URL 和参数
-    url = f"{SHOPEE_URL}/api/v2/merchant/get_merchant_info"
-    params = {
-        'partner_id': PARTNER_ID,
-        'timestamp': timestamp,
-        'sign': sign,
-        'access_token': access_token,
-        'merchant_id': merchant_id
-    }
-
-    # 发送请求
-    response = requests.get(url, params=params)
-    data = response.json()
 
-    # 检查是否有错误返回
-    if data.get('error'):
-        frappe.log_error(data['message'], 'Shopee API Error: ' + data['error'])
+    # 发送请求（签名由 client 生成）
+    try:
+        data = request_merchant_info(get_client(), merchant_id, access_token)
+    except (ShopeeAPIError, ShopeeHTTPError) as e:
+        log_fetch_error(e, 'merchant')
         return
 
     # 处理返回的商户数据
     process_merchant_data(data, merchant_id)
 
+def request_merchant_info(client, merchant_id, access_token):
+    """
+    Call get_merchant_info and return the response. No database access, safe in worker threads.
+    """
+    return client.get('/api/v2/merchant/get_merchant_info', access_token=access_token, merchant_id=merchant_id)
+
+def request_shop_info(client, shop_id, access_token):
+    """
+    Call get_shop_info and return the response. No database access, safe in worker threads.
+    """
+    return client.get('/api/v2/shop/get_shop_info', access_token=access_token, shop_id=shop_id)
+
+def log_fetch_error(error, entity):
+    if isinstance(error, ShopeeAPIError):
+        # 检查是否有错误返回
+        frappe.log_error(error.message, 'Shopee API Error: ' + error.error)
+    else:
+        frappe.log_error(getattr(error, 'response_text', None) or str(error), f'Failed to fetch {entity} info from Shopee')
+
+def fetch_entities_info(merchant_ids, shop_ids, access_token, max_workers=None):
+    """
+    Fetch merchant and shop info for a freshly authorized account concurrently, then upsert
+    the Company records on this thread: merchants first, so each shop's parent_company resolves.
+    """
+    max_workers = cint(max_workers or frappe.local.conf.get('shopee_onboarding_workers')) or DEFAULT_ONBOARDING_WORKERS
+    client = get_client()
+
+    def fetch(job):
+        entity, identifier = job
+        if entity == 'merchant':
+            return request_merchant_info(client, identifier, access_token)
+        return request_shop_info(client, identifier, access_token)
+
+    jobs = [('merchant', merchant_id) for merchant_id in merchant_ids] + [('shop', shop_id) for shop_id in shop_ids]
+    results = map_concurrently(fetch, jobs, max_workers)
+
+    # 先处理商户，再处理店铺（results 与 jobs 顺序一致）
+    for (entity, identifier), data, error in results:
+        if error:
+            log_fetch_error(error, entity)
+        elif entity == 'merchant':
+            process_merchant_data(data, identifier)
+        else:
+            process_shop_data(data, identifier)
+
 def process_merchant_data(data, merchant_id):
     merchant_name = data.get('merchant_name', '')
     region = data.get('merchant_region', '')
@@ -60,7 +91,8 @@ def process_merchant_data(data, merchant_id):
     expire_time = datetime.fromtimestamp(data.get('expire_time'))
 
     # Check if the company record exists
-    company_exists = frappe.db.exists('Company', {'entity_id': data.get('request_id')})
+    merchant_id = normalize_id(merchant_id)
+    company_exists = frappe.db.exists('Company', {'entity_id': merchant_id})
 
     if company_exists:
         # Update existing company record
@@ -85,32 +117,18 @@ def process_merchant_data(data, merchant_id):
 
     company_doc.save(ignore_permissions=True)
     frappe.db.commit()
-    frappe.log_error(f"Processed merchant info for {data.get('request_id')}", 'Shopee Merchant Process')
+    log_sync_event('merchant_processed', merchant_id, company_doc.name)
 
 
 def fetch_shop_info(shop_id):
     access_token = get_token_by_shop_or_merchant_id(shop_id=shop_id)
-    timestamp = int(datetime.now().timestamp())
-    sign = generate_signature(PARTNER_ID, '/api/v2/shop/get_shop_info', timestamp, access_token, shop_id=shop_id)
-
-    url = f"{SHOPEE_URL}/api/v2/shop/get_shop_info"
-    params = {
-        'partner_id': PARTNER_ID,
-        'timestamp': timestamp,
-        'sign': sign,
-        'access_token': access_token,
-        'shop_id': shop_id
-    }
 
-    response = requests.get(url, params=params)
-    if response.status_code == 200:
-        data = response.json()
-        if data.get('error') is not None:
-            frappe.log_error(data['message'], 'Shopee API Error')
-        else:
-            process_shop_data(data, shop_id)
+    try:
+        data = request_shop_info(get_client(), shop_id, access_token)
+    except (ShopeeAPIError, ShopeeHTTPError) as e:
+        log_fetch_error(e, 'shop')
     else:
-        frappe.log_error(response.text, 'Failed to fetch shop info from Shopee')
+        process_shop_data(data, shop_id)
 
 def process_shop_data(data, shop_id):
     shop_name = data.get('shop_name', '')
@@ -143,11 +161,12 @@ def process_shop_data(data, shop_id):
     auth_time = datetime.fromtimestamp(data.get('auth_time')) if data.get('auth_time') else datetime.now()
     expire_time = datetime.fromtimestamp(data.get('expire_time')) if data.get('expire_time') else datetime.now()
 
-    # Determine the parent company based on merchant_id
-    merchant_id = data.get('merchant_id')
-    parent_company = frappe.get_value('Company', {'merchant_id': merchant_id}, 'name') if merchant_id else None
+    # Determine the parent company based on merchant_id (merchants are stored with entity_id = merchant_id)
+    merchant_id = normalize_id(data.get('merchant_id'))
+    parent_company = frappe.get_value('Company', {'entity_id': merchant_id}, 'name') if merchant_id else None
 
     # Check if the shop record exists by using shop_id
+    shop_id = normalize_id(shop_id)
     shop_exists = frappe.db.exists('Company', {'entity_id': shop_id})
 
     if shop_exists:
@@ -175,5 +194,5 @@ def process_shop_data(data, shop_id):
 
     shop_doc.save(ignore_permissions=True)
     frappe.db.commit()
-    frappe.log_error(f"Processed shop info for {shop_id}", 'Shopee Shop Process')
+    log_sync_event('shop_processed', shop_id, shop_doc.name)
 
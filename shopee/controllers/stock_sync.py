@@ -0,0 +1,287 @@
+from datetime import timedelta
+import frappe
+from frappe.query_builder.functions import Sum
+from frappe.utils import cint, flt, now_datetime, add_to_date, get_datetime
+from frappe.utils.background_jobs import get_queue, execute_job, create_job_id
+from pypika.terms import Values
+from .client import get_client, ShopeeAPIError, ShopeeHTTPError
+from .token_management import ensure_valid_access_token
+from .utils import normalize_id, map_concurrently
+from .metrics import incr, timer
+
+DELTA_DOCTYPE = 'Shopee Stock Delta'
+FLUSH_JOB_ID = "shopee_stock_flush"
+DELAYED_FLUSH_KEY = "shopee:stock_flush:delayed"
+
+# 同一 (shop, item, model) 在该窗口（秒）内的多次变动只推送一次
+DEFAULT_DEBOUNCE = 30
+# 每轮从待推送表读取的行数；update_stock 每次最多 50 个 model
+FLUSH_BATCH_SIZE = 1000
+UPDATE_STOCK_MAX_MODELS = 50
+DEFAULT_STOCK_WORKERS = 8
+# 尚未到期的变动不在任务内等待，而是延迟这么多秒（至少）后重新入队
+MIN_FLUSH_DELAY = 1
+# 解析 Item 映射时每次查询的 item_code 数
+ITEM_LOOKUP_CHUNK = 1000
+
+
+def capture_stock_change(doc, method=None):
+    """
+    doc_events hook for Stock Ledger Entry and Bin: remember the item_code for this transaction.
+
+    The codes are written to Shopee Stock Delta once, right before the transaction commits,
+    so a stock reconciliation of 20k rows costs a handful of queries instead of 20k.
+    """
+    changes = getattr(frappe.local, 'shopee_stock_changes', None)
+    if changes is None:
+        changes = frappe.local.shopee_stock_changes = set()
+        frappe.db.before_commit.add(record_stock_changes)
+        frappe.db.after_rollback.add(discard_stock_changes)
+    changes.add(doc.item_code)
+
+
+def discard_stock_changes():
+    frappe.local.shopee_stock_changes = None
+
+
+def record_stock_changes():
+    """
+    Mark every Shopee-mapped item changed in this transaction as pending and schedule a flush.
+
+    Runs inside the stock transaction's commit, so it never raises: a failure is logged and the
+    stock change commits without its delta (the next change of the item re-marks it).
+    """
+    item_codes = list(getattr(frappe.local, 'shopee_stock_changes', None) or [])
+    frappe.local.shopee_stock_changes = None
+    if not item_codes:
+        return
+
+    try:
+        # 自定义字段尚未创建（如安装未完成）时不做任何事
+        if not frappe.db.has_column('Item', 'shopee_item_id'):
+            return
+        frappe.db.savepoint('shopee_stock_changes')
+        record_pending_items(item_codes)
+    except Exception:
+        try:
+            frappe.db.rollback(save_point='shopee_stock_changes')
+        except Exception:
+            pass
+        frappe.log_error(frappe.get_traceback(), 'Shopee Stock Sync Error')
+
+
+def record_pending_items(item_codes):
+    rows = []
+    for i in range(0, len(item_codes), ITEM_LOOKUP_CHUNK):
+        rows += frappe.get_all('Item', filters={'name': ['in', item_codes[i:i + ITEM_LOOKUP_CHUNK]],
+                                                'shopee_item_id': ['is', 'set'], 'shopee_shop_id': ['is', 'set']},
+                               fields=['name', 'shopee_shop_id', 'shopee_item_id', 'shopee_model_id'])
+    if not rows:
+        return
+
+    mark_pending([(row.shopee_shop_id, row.shopee_item_id, row.shopee_model_id, row.name) for row in rows])
+    frappe.db.after_commit.add(schedule_flush)
+
+
+def delta_name(shop_id, item_id, model_id):
+    return f"{normalize_id(shop_id)}-{normalize_id(item_id)}-{normalize_id(model_id) or 0}"
+
+
+def mark_pending(keys):
+    """
+    Upsert (shop_id, item_id, model_id, item_code) tuples into Shopee Stock Delta as pending,
+    in one statement and without committing. Re-marking an existing row only moves `changed_at`.
+    """
+    now = now_datetime()
+    Delta = frappe.qb.DocType(DELTA_DOCTYPE)
+    query = frappe.qb.into(Delta).columns(
+        Delta.name, Delta.creation, Delta.modified, Delta.owner, Delta.modified_by, Delta.docstatus,
+        Delta.shop_id, Delta.shopee_item_id, Delta.shopee_model_id, Delta.item_code, Delta.pending, Delta.changed_at)
+    for shop_id, item_id, model_id, item_code in {delta_name(*key[:3]): key for key in keys}.values():
+        query = query.insert(delta_name(shop_id, item_id, model_id), now, now, frappe.session.user, frappe.session.user, 0,
+                             normalize_id(shop_id), normalize_id(item_id), normalize_id(model_id) or '0', item_code, 1, now)
+    if frappe.db.db_type == "mariadb":
+        query = query.on_duplicate_key_update(Delta.pending, Values(Delta.pending)) \
+            .on_duplicate_key_update(Delta.changed_at, Values(Delta.changed_at)) \
+            .on_duplicate_key_update(Delta.modified, Values(Delta.modified))
+    elif frappe.db.db_type == "postgres":
+        query = query.on_conflict(Delta.name).do_update(Delta.pending).do_update(Delta.changed_at).do_update(Delta.modified)
+    query.run()
+    incr('stock_deltas_marked', len(keys))
+
+
+def schedule_flush():
+    """
+    Enqueue the flush job. Every run (after-commit, delayed and the scheduled safety net) goes
+    through the same deduplicated job id, so at most one flush is queued or running at a time.
+    """
+    frappe.enqueue('shopee.controllers.stock_sync.flush_stock_deltas', queue='default',
+                   job_id=FLUSH_JOB_ID, deduplicate=True)
+
+
+def schedule_delayed_flush(delay):
+    """
+    Enqueue schedule_flush through RQ's scheduler after `delay` seconds, at most once per delay.
+    If no worker runs the RQ scheduler, the periodic schedule_flush picks the rows up instead.
+    """
+    delay = max(int(delay) + 1, MIN_FLUSH_DELAY)
+    cache = frappe.cache()
+    if not cache.set(cache.make_key(DELAYED_FLUSH_KEY), 1, nx=True, ex=delay):
+        return
+    method = 'shopee.controllers.stock_sync.schedule_flush'
+    get_queue('default').enqueue_in(timedelta(seconds=delay), execute_job, job_id=create_job_id(f"{FLUSH_JOB_ID}:delayed"),
+                                    kwargs={'site': frappe.local.site, 'user': frappe.session.user, 'method': method,
+                                            'event': None, 'job_name': method, 'is_async': True, 'kwargs': {}})
+
+
+def flush_stock_deltas():
+    """
+    Background job: push the current ERPNext stock of every pending delta older than the debounce
+    window to Shopee. Younger deltas are not waited for; the job is re-enqueued for when the
+    oldest of them becomes due. Stops after a round with failed pushes; those rows stay pending
+    and are retried by the next run.
+    """
+    debounce = cint(frappe.local.conf.get('shopee_stock_debounce')) or DEFAULT_DEBOUNCE
+    with timer('job_seconds', {'job': 'flush_stock_deltas'}):
+        while True:
+            cutoff = add_to_date(now_datetime(), seconds=-debounce)
+            rows = frappe.get_all(DELTA_DOCTYPE, filters={'pending': 1, 'changed_at': ['<=', cutoff]},
+                                  fields=['name', 'shop_id', 'shopee_item_id', 'shopee_model_id', 'item_code',
+                                          'last_pushed_stock', 'last_pushed_at', 'changed_at'],
+                                  order_by='changed_at asc', limit=FLUSH_BATCH_SIZE)
+            if not rows:
+                break
+            if not push_stock(rows, cutoff):
+                break
+
+        next_due = frappe.get_all(DELTA_DOCTYPE, filters={'pending': 1}, order_by='changed_at asc',
+                                  limit=1, pluck='changed_at')
+        if next_due:
+            schedule_delayed_flush((get_datetime(next_due[0]) - cutoff).total_seconds())
+
+
+def get_available_stock(item_codes):
+    """
+    {item_code: actual_qty - reserved_qty} summed over the Shopee warehouses
+    (site_config shopee_stock_warehouses, all warehouses if unset), in one query.
+
+    Shopee's own reserved stock (promotions, campaigns) is carved out of the seller stock on
+    Shopee's side, so it is not subtracted here.
+    """
+    if not item_codes:
+        return {}
+    Bin = frappe.qb.DocType('Bin')
+    query = frappe.qb.from_(Bin).select(Bin.item_code, Sum(Bin.actual_qty - Bin.reserved_qty)) \
+        .where(Bin.item_code.isin(item_codes)).groupby(Bin.item_code)
+    warehouses = frappe.local.conf.get('shopee_stock_warehouses')
+    if warehouses:
+        query = query.where(Bin.warehouse.isin(warehouses))
+    return {item_code: max(cint(flt(qty)), 0) for item_code, qty in query.run()}
+
+
+def push_stock(rows, cutoff):
+    """
+    Push one batch of pending deltas: one update_stock call per Shopee item (up to 50 models each),
+    skipping models whose stock equals the last pushed value. Returns False if any push failed.
+    """
+    stock = get_available_stock(list({row.item_code for row in rows if row.item_code}))
+    client = get_client()
+
+    done = {}
+    unmapped = []
+    retry = []
+    jobs = []
+    by_shop = {}
+    for row in rows:
+        by_shop.setdefault(row.shop_id, {}).setdefault(row.shopee_item_id, []).append(row)
+
+    for shop_id, items in by_shop.items():
+        try:
+            access_token = ensure_valid_access_token(shop_id=shop_id)
+        except frappe.ValidationError:
+            frappe.log_error(f"Shop {shop_id}: no valid access token, stock push postponed", 'Shopee Stock Sync Error')
+            retry += [row.name for models in items.values() for row in models]
+            continue
+        for item_id, models in items.items():
+            changed = []
+            for row in models:
+                if not row.item_code:
+                    # 未映射到 ERPNext Item 的 model 不推送
+                    unmapped.append(row.name)
+                    continue
+                quantity = stock.get(row.item_code, 0)
+                if row.last_pushed_at and cint(row.last_pushed_stock) == quantity:
+                    done[row.name] = quantity
+                else:
+                    changed.append((row, quantity))
+            for i in range(0, len(changed), UPDATE_STOCK_MAX_MODELS):
+                jobs.append((shop_id, access_token, item_id, changed[i:i + UPDATE_STOCK_MAX_MODELS]))
+
+    max_workers = cint(frappe.local.conf.get('shopee_stock_workers')) or DEFAULT_STOCK_WORKERS
+    results = map_concurrently(lambda job: client.post('/api/v2/product/update_stock', body={
+        'item_id': cint(job[2]),
+        'stock_list': [{'model_id': cint(row.shopee_model_id), 'seller_stock': [{'stock': quantity}]}
+                       for row, quantity in job[3]]
+    }, access_token=job[1], shop_id=job[0]), jobs, max_workers)
+
+    errors = []
+    failed_pushes = 0
+    for (shop_id, _, item_id, changed), response, error in results:
+        if error:
+            failed_pushes += 1
+            if not isinstance(error, (ShopeeAPIError, ShopeeHTTPError)):
+                raise error
+            errors.append(f"Shop {shop_id} item {item_id}: {error}")
+            retry += [row.name for row, _ in changed]
+            continue
+        # 被 Shopee 拒绝的 model（如已删除）记录后不再重试，直到库存再次变动
+        for failure in (response.get('response') or {}).get('failure_list', []):
+            errors.append(f"Shop {shop_id} item {item_id} model {failure.get('model_id')}: {failure.get('failed_reason')}")
+        for row, quantity in changed:
+            done[row.name] = quantity
+
+    now = now_datetime()
+    if done:
+        frappe.db.bulk_update(DELTA_DOCTYPE, {name: {'last_pushed_stock': quantity, 'last_pushed_at': now}
+                                              for name, quantity in done.items()}, update_modified=False)
+    # 推送期间再次变动的行（changed_at 晚于 cutoff）保持 pending
+    if done or unmapped:
+        Delta = frappe.qb.DocType(DELTA_DOCTYPE)
+        frappe.qb.update(Delta).set(Delta.pending, 0) \
+            .where(Delta.name.isin(list(done) + unmapped) & (Delta.changed_at <= cutoff)).run()
+    if retry:
+        # 推迟一个防抖窗口后重试
+        frappe.db.set_value(DELTA_DOCTYPE, {'name': ['in', retry]}, 'changed_at', now, update_modified=False)
+    frappe.db.commit()
+
+    incr('stock_pushes', len(jobs) - failed_pushes, {'result': 'success'})
+    incr('stock_pushes', failed_pushes, {'result': 'failure'})
+    incr('stock_models_pushed', sum(len(job[3]) for job in jobs))
+    if errors:
+        frappe.log_error("\n".join(errors), 'Shopee Stock Sync Error')
+    return not retry
+
+
+def handle_reserved_stock_push(shop_id, push):
+    """
+    Reserved stock change push: force a re-push of ERPNext's available stock, so both sides
+    converge after Shopee reserved stock (e.g. for a promotion) on its own. The reserved
+    quantity is kept on the delta for reference only; it is not subtracted from pushed stock.
+    """
+    item_id = push.get('item_id')
+    if not (shop_id and item_id):
+        return
+    model_id = push.get('model_id') or push.get('variation_id') or 0
+
+    item_code = frappe.db.get_value('Item', {'shopee_item_id': normalize_id(item_id),
+                                             'shopee_model_id': normalize_id(model_id) if model_id else ['is', 'not set']},
+                                    'name')
+    mark_pending([(shop_id, item_id, model_id, item_code)])
+
+    name = delta_name(shop_id, item_id, model_id)
+    values = {'last_pushed_at': None}
+    for change in push.get('changed_values') or []:
+        if change.get('name') == 'reserved_stock':
+            values['shopee_reserved_stock'] = cint(change.get('new'))
+    frappe.db.set_value(DELTA_DOCTYPE, name, values, update_modified=False)
+    frappe.db.after_commit.add(schedule_flush)
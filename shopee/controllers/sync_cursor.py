@@ -0,0 +1,26 @@
+import frappe
+from frappe.utils import cint, now_datetime
+from .utils import normalize_id
+
+def get_cursor(shop_id, resource):
+    """
+    Return the persisted cursor (a Shopee unix timestamp) for a shop and resource, or 0 if none.
+    """
+    return cint(frappe.db.get_value('Shopee Sync Cursor', f"{resource}-{normalize_id(shop_id)}", 'cursor'))
+
+def set_cursor(shop_id, resource, value):
+    """
+    Persist the cursor for a shop and resource. Does not commit.
+    """
+    shop_id = normalize_id(shop_id)
+    name = f"{resource}-{shop_id}"
+    if frappe.db.exists('Shopee Sync Cursor', name):
+        frappe.db.set_value('Shopee Sync Cursor', name, {'cursor': cint(value), 'last_synced': now_datetime()})
+    else:
+        frappe.get_doc({
+            'doctype': 'Shopee Sync Cursor',
+            'shop_id': shop_id,
+            'resource': resource,
+            'cursor': cint(value),
+            'last_synced': now_datetime()
+        }).insert(ignore_permissions=True)
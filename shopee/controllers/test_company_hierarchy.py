@@ -0,0 +1,86 @@
+from unittest.mock import patch
+import frappe
+from frappe.tests.utils import FrappeTestCase
+from shopee.controllers import company_hierarchy
+from shopee.controllers.company_hierarchy import update_hierarchy_path, path_segment, get_hierarchy, PATH_FIELD
+
+ROOT = '_Test Shopee Root'
+MERCHANT = '_Test Shopee A/B Merchant'
+SHOP = '_Test Shopee Shop 100%'
+OTHER_ROOT = '_Test Shopee Other Root'
+
+
+def company(name, parent=None):
+    return frappe._dict(name=name, parent_company=parent)
+
+
+class TestHierarchyPath(FrappeTestCase):
+    def setUp(self):
+        frappe.db.bulk_insert('Company', ['name', 'company_name', 'abbr', 'parent_company'], [
+            (ROOT, ROOT, '_TSR', None),
+            (MERCHANT, MERCHANT, '_TSM', ROOT),
+            (SHOP, SHOP, '_TSS', MERCHANT),
+            (OTHER_ROOT, OTHER_ROOT, '_TSO', None),
+        ])
+        for name in (ROOT, OTHER_ROOT, MERCHANT, SHOP):
+            update_hierarchy_path(company(name, frappe.db.get_value('Company', name, 'parent_company')))
+
+    def tearDown(self):
+        frappe.db.rollback()
+
+    def path(self, name):
+        return frappe.db.get_value('Company', name, PATH_FIELD)
+
+    def test_separator_in_names_is_encoded(self):
+        self.assertEqual(path_segment('A/B 100%'), 'A%2FB 100%25')
+        self.assertEqual(self.path(MERCHANT), f"{ROOT}/_Test Shopee A%2FB Merchant")
+        self.assertEqual(self.path(SHOP), f"{ROOT}/_Test Shopee A%2FB Merchant/_Test Shopee Shop 100%25")
+
+    def test_moving_a_company_rewrites_its_subtree(self):
+        frappe.db.set_value('Company', MERCHANT, 'parent_company', OTHER_ROOT)
+        update_hierarchy_path(company(MERCHANT, OTHER_ROOT))
+
+        self.assertEqual(self.path(MERCHANT), f"{OTHER_ROOT}/_Test Shopee A%2FB Merchant")
+        self.assertEqual(self.path(SHOP), f"{OTHER_ROOT}/_Test Shopee A%2FB Merchant/_Test Shopee Shop 100%25")
+        self.assertEqual(self.path(ROOT), ROOT)
+
+    def test_moving_to_top_level(self):
+        update_hierarchy_path(company(MERCHANT))
+        self.assertEqual(self.path(MERCHANT), '_Test Shopee A%2FB Merchant')
+        self.assertEqual(self.path(SHOP), '_Test Shopee A%2FB Merchant/_Test Shopee Shop 100%25')
+
+    def test_sibling_with_common_prefix_is_not_rewritten(self):
+        # "<merchant path>x" starts like the merchant's path but is not below it
+        sibling = '_Test Shopee A/B Merchantx'
+        frappe.db.bulk_insert('Company', ['name', 'company_name', 'abbr', 'parent_company'],
+                              [(sibling, sibling, '_TSX', ROOT)])
+        update_hierarchy_path(company(sibling, ROOT))
+
+        update_hierarchy_path(company(MERCHANT, OTHER_ROOT))
+        self.assertEqual(self.path(sibling), f"{ROOT}/_Test Shopee A%2FB Merchantx")
+
+
+class TestGetHierarchy(FrappeTestCase):
+    NODES = [
+        {'name': ROOT, 'parent_company': None, 'entity_name': 'root', 'path': ROOT},
+        {'name': MERCHANT, 'parent_company': ROOT, 'entity_name': 'merchant',
+         'path': f"{ROOT}/{path_segment(MERCHANT)}"},
+        {'name': SHOP, 'parent_company': MERCHANT, 'entity_name': 'shop',
+         'path': f"{ROOT}/{path_segment(MERCHANT)}/{path_segment(SHOP)}"},
+        {'name': OTHER_ROOT, 'parent_company': None, 'entity_name': 'other', 'path': OTHER_ROOT},
+    ]
+
+    def setUp(self):
+        nodes = patch.object(company_hierarchy, 'get_hierarchy_nodes', return_value=self.NODES)
+        nodes.start()
+        self.addCleanup(nodes.stop)
+
+    def test_subtree(self):
+        tree = get_hierarchy(MERCHANT)
+        self.assertEqual(len(tree), 1)
+        self.assertEqual(tree[0]['name'], MERCHANT)
+        self.assertEqual([child['name'] for child in tree[0]['children']], [SHOP])
+
+    def test_paging_top_level(self):
+        self.assertEqual([node['name'] for node in get_hierarchy(start=1, page_length=1)], [OTHER_ROOT])
+        self.assertEqual(get_hierarchy('_Test Shopee Missing'), [])
@@ -0,0 +1,57 @@
+import frappe
+from frappe.tests.utils import FrappeTestCase
+from shopee.controllers.escrow_sync import journal_entry_lines
+
+ACCOUNTS = {'bank': 'Bank', 'fees': 'Fees', 'receivable': 'Debtors'}
+CUSTOMER = 'Shopee Customer'
+
+
+def settlement(escrow_amount, commission_fee=0, service_fee=0, transaction_fee=0):
+    return frappe._dict(escrow_amount=escrow_amount, commission_fee=commission_fee, service_fee=service_fee,
+                        transaction_fee=transaction_fee)
+
+
+def totals(lines):
+    return (round(sum(line.get('debit_in_account_currency', 0) for line in lines), 2),
+            round(sum(line.get('credit_in_account_currency', 0) for line in lines), 2))
+
+
+class TestJournalEntryLines(FrappeTestCase):
+    def test_settlements_are_summed(self):
+        lines = journal_entry_lines(ACCOUNTS, CUSTOMER, [settlement(90.5, 5, 3, 1.5), settlement(45, 2.25, 1, 0.75)])
+        self.assertEqual(lines, [
+            {'account': 'Bank', 'debit_in_account_currency': 135.5},
+            {'account': 'Fees', 'debit_in_account_currency': 13.5},
+            {'account': 'Debtors', 'party_type': 'Customer', 'party': CUSTOMER, 'credit_in_account_currency': 149},
+        ])
+
+    def test_no_fee_row_without_fees(self):
+        lines = journal_entry_lines(ACCOUNTS, CUSTOMER, [settlement(20)])
+        self.assertEqual([line['account'] for line in lines], ['Bank', 'Debtors'])
+        self.assertEqual(totals(lines), (20, 20))
+
+    def test_adjustments_reduce_the_totals(self):
+        # a refund adjustment settled in the same batch as a sale
+        lines = journal_entry_lines(ACCOUNTS, CUSTOMER, [settlement(100, 6), settlement(-30, -2)])
+        self.assertEqual(lines[0], {'account': 'Bank', 'debit_in_account_currency': 70})
+        self.assertEqual(lines[1], {'account': 'Fees', 'debit_in_account_currency': 4})
+        self.assertEqual(lines[2]['credit_in_account_currency'], 74)
+
+    def test_negative_totals_switch_sides(self):
+        # net refunds (and fee rebates) exceed the released amount
+        lines = journal_entry_lines(ACCOUNTS, CUSTOMER, [settlement(-50, -3), settlement(10, 1)])
+        self.assertEqual(lines, [
+            {'account': 'Bank', 'credit_in_account_currency': 40},
+            {'account': 'Fees', 'credit_in_account_currency': 2},
+            {'account': 'Debtors', 'party_type': 'Customer', 'party': CUSTOMER, 'debit_in_account_currency': 42},
+        ])
+        self.assertEqual(totals(lines), (42, 42))
+
+    def test_fee_rebate_larger_than_fees(self):
+        lines = journal_entry_lines(ACCOUNTS, CUSTOMER, [settlement(30, -1.2)])
+        self.assertEqual(lines[1], {'account': 'Fees', 'credit_in_account_currency': 1.2})
+        self.assertEqual(totals(lines), (30, 30))
+
+    def test_amounts_are_rounded_to_cents(self):
+        lines = journal_entry_lines(ACCOUNTS, CUSTOMER, [settlement(0.1, 0.01), settlement(0.2, 0.02)])
+        self.assertEqual(totals(lines), (0.33, 0.33))
@@ -0,0 +1,61 @@
+from unittest.mock import patch
+from frappe.tests.utils import FrappeTestCase
+from shopee.controllers import item_sync
+from shopee.controllers.item_sync import build_item_rows, model_name, sync_item_batch
+
+SHOP_ID = '990000001'
+
+
+def base_item(item_id, **values):
+    return dict({'item_id': item_id, 'item_name': f"Item {item_id}", 'item_status': 'NORMAL',
+                 'price_info': [{'current_price': 9.5, 'currency': 'SGD'}]}, **values)
+
+
+TIERS = [{'option_list': [{'option': 'Red'}, {'option': 'Blue'}]},
+         {'option_list': [{'option': 'S'}, {'option': 'M'}]}]
+
+
+class TestBuildItemRows(FrappeTestCase):
+    def test_item_without_models(self):
+        rows, skipped = build_item_rows(SHOP_ID, [base_item(1, item_sku='SKU-1')], {})
+        self.assertEqual(skipped, [])
+        self.assertEqual(rows, [{
+            'item_code': 'SKU-1', 'item_name': 'Item 1', 'shopee_item_id': '1', 'shopee_model_id': None,
+            'shopee_shop_id': SHOP_ID, 'disabled': 0, 'price': 9.5, 'currency': 'SGD'
+        }])
+
+    def test_one_row_per_model(self):
+        models = {2: {'tier_variation': TIERS, 'model': [
+            {'model_id': 21, 'model_sku': 'SKU-2-RS', 'tier_index': [0, 0], 'price_info': [{'current_price': 5}]},
+            {'model_id': 22, 'model_sku': 'SKU-2-BM', 'tier_index': [1, 1]},
+            {'model_id': 23, 'model_sku': '', 'tier_index': [1, 0]},
+        ]}}
+        rows, skipped = build_item_rows(SHOP_ID, [base_item(2, has_model=True, item_status='UNLIST')], models)
+
+        self.assertEqual([row['item_code'] for row in rows], ['SKU-2-RS', 'SKU-2-BM'])
+        self.assertEqual([row['item_name'] for row in rows], ['Item 2 - Red / S', 'Item 2 - Blue / M'])
+        self.assertEqual([row['shopee_model_id'] for row in rows], ['21', '22'])
+        self.assertEqual([row['price'] for row in rows], [5, 0])
+        self.assertTrue(all(row['disabled'] for row in rows))
+        # models without SKU cannot be mapped
+        self.assertEqual(skipped, ['2/23'])
+
+    def test_items_without_sku_are_skipped(self):
+        rows, skipped = build_item_rows(SHOP_ID, [base_item(3)], {})
+        self.assertEqual((rows, skipped), ([], ['3']))
+
+    def test_model_name_ignores_unknown_tier_index(self):
+        self.assertEqual(model_name({'item_name': 'Shirt'}, TIERS, {'tier_index': [1, 5]}), 'Shirt - Blue')
+        self.assertEqual(model_name({'item_name': 'Shirt'}, [], {'tier_index': []}), 'Shirt')
+
+
+class TestSyncItemBatch(FrappeTestCase):
+    def test_no_prices_for_items_that_failed_to_insert(self):
+        items = [base_item(1, item_sku='SKU-1'), base_item(2, item_sku='SKU-2')]
+        with patch.object(item_sync, 'get_item_base_info', return_value=items), \
+                patch.object(item_sync, 'upsert_items', return_value={'SKU-2'}), \
+                patch.object(item_sync, 'upsert_item_prices') as upsert_item_prices:
+            sync_item_batch(None, SHOP_ID, 'token', [1, 2])
+
+        rows = upsert_item_prices.call_args[0][0]
+        self.assertEqual([row['item_code'] for row in rows], ['SKU-1'])
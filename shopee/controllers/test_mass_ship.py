@@ -0,0 +1,94 @@
+from unittest.mock import MagicMock, patch
+import frappe
+from frappe.tests.utils import FrappeTestCase
+from shopee.controllers.mass_ship import shipping_method, ship_batch, write_outcomes, pickup_address_id, PROCESSED
+
+SHOP_ID = '990000001'
+
+
+def order(order_sn, package_number=None, name=None, **values):
+    return frappe._dict(name=name or f"SO-{order_sn}", shopee_order_sn=order_sn, shopee_package_number=package_number,
+                        **values)
+
+
+ADDRESSES = [
+    {'address_id': 1, 'address_flag': [], 'time_slot_list': [{'pickup_time_id': 't1'}]},
+    {'address_id': 2, 'address_flag': ['pickup_address'], 'time_slot_list': [{'pickup_time_id': 't2'}, {'pickup_time_id': 't3'}]},
+]
+
+
+class TestShippingMethod(FrappeTestCase):
+    def test_pickup_prefers_configured_then_default_address(self):
+        parameter = {'info_needed': {'pickup': ['address_id', 'pickup_time_id']}, 'pickup': {'address_list': ADDRESSES}}
+        self.assertEqual(shipping_method(parameter, '1'), {'pickup': {'address_id': 1, 'pickup_time_id': 't1'}})
+        self.assertEqual(shipping_method(parameter), {'pickup': {'address_id': 2, 'pickup_time_id': 't2'}})
+        self.assertEqual(shipping_method(parameter, '99'), {'pickup': {'address_id': 2, 'pickup_time_id': 't2'}})
+
+    def test_pickup_falls_back_to_first_address(self):
+        parameter = {'info_needed': {'pickup': ['address_id']}, 'pickup': {'address_list': ADDRESSES[:1]}}
+        # no time slot requested
+        self.assertEqual(shipping_method(parameter), {'pickup': {'address_id': 1}})
+
+    def test_pickup_without_addresses(self):
+        self.assertIsNone(shipping_method({'info_needed': {'pickup': ['address_id']}, 'pickup': {'address_list': []}}))
+
+    def test_dropoff_and_non_integrated(self):
+        parameter = {'info_needed': {'dropoff': ['branch_id']}, 'dropoff': {'branch_list': [{'branch_id': 7}, {'branch_id': 8}]}}
+        self.assertEqual(shipping_method(parameter), {'dropoff': {'branch_id': 7}})
+        self.assertEqual(shipping_method({'info_needed': {'dropoff': []}}), {'dropoff': {}})
+        self.assertEqual(shipping_method({'info_needed': {}}), {'non_integrated': {}})
+
+    def test_pickup_address_from_warehouse_or_shop(self):
+        addresses = {'Stores - T': 11, SHOP_ID: 22}
+        self.assertEqual(pickup_address_id(order('A', set_warehouse='Stores - T', shopee_shop_id=SHOP_ID), addresses), '11')
+        self.assertEqual(pickup_address_id(order('A', set_warehouse='Other - T', shopee_shop_id=SHOP_ID), addresses), '22')
+        self.assertIsNone(pickup_address_id(order('A', set_warehouse=None, shopee_shop_id='1'), addresses))
+
+
+class TestShipBatch(FrappeTestCase):
+    def test_mass_ship_maps_fail_list_by_package(self):
+        client = MagicMock()
+        client.post.return_value = {'response': {'fail_list': [
+            {'package_number': 'P2', 'fail_error': 'logistics.error', 'fail_message': 'Address invalid'},
+            {'package_number': 'P9', 'fail_error': 'unknown package'},
+        ]}}
+        batch = [order('A', 'P1'), order('B', 'P2')]
+
+        failures = ship_batch(client, SHOP_ID, 'token', '30001', {'pickup': {'address_id': 1}}, batch)
+
+        self.assertEqual(failures, {'B': 'Address invalid'})
+        path = client.post.call_args.args[0]
+        body = client.post.call_args.kwargs['body']
+        self.assertEqual(path, '/api/v2/logistics/mass_ship_order')
+        self.assertEqual(body, {'pickup': {'address_id': 1}, 'logistics_channel_id': 30001,
+                                'package_list': [{'package_number': 'P1'}, {'package_number': 'P2'}]})
+
+    def test_batch_ship_maps_result_list_by_order(self):
+        client = MagicMock()
+        client.post.return_value = {'response': {'result_list': [
+            {'order_sn': 'A', 'fail_error': '', 'fail_message': ''},
+            {'order_sn': 'B', 'fail_error': 'logistics.ship_order_failed', 'fail_message': ''},
+        ]}}
+        batch = [order('A', 'P1'), order('B')]
+
+        failures = ship_batch(client, SHOP_ID, 'token', '30001', {'dropoff': {}}, batch)
+
+        self.assertEqual(failures, {'B': 'logistics.ship_order_failed'})
+        self.assertEqual(client.post.call_args.args[0], '/api/v2/logistics/batch_ship_order')
+        self.assertEqual(client.post.call_args.kwargs['body'], {
+            'dropoff': {}, 'order_list': [{'order_sn': 'A', 'package_number': 'P1'}, {'order_sn': 'B'}]})
+
+
+class TestWriteOutcomes(FrappeTestCase):
+    def test_shipped_and_failed_orders(self):
+        with patch.object(frappe.db, 'bulk_update') as bulk_update:
+            write_outcomes([order('A'), order('B')], {'B': 'Address invalid'})
+        bulk_update.assert_called_once_with('Sales Order', {
+            'SO-A': {'shopee_order_status': PROCESSED, 'shopee_ship_error': None},
+            'SO-B': {'shopee_ship_error': 'Address invalid'},
+        })
+
+    def test_no_orders(self):
+        with patch.object(frappe.db, 'bulk_update') as bulk_update:
+            write_outcomes([], {})
+        bulk_update.assert_not_called()
@@ -0,0 +1,84 @@
+import frappe
+from frappe.tests.utils import FrappeTestCase
+from shopee.controllers.metrics import (incr, observe, flush, get_metrics, render_prometheus, metric_field,
+                                        format_labels, format_value)
+
+
+class TestRenderPrometheus(FrappeTestCase):
+    def test_counters_with_labels(self):
+        text = render_prometheus({
+            'webhook_received': 3,
+            metric_field('api_retries', {'path': '/api/v2/order/get_order_list'}): 2,
+        })
+        self.assertIn('# TYPE shopee_webhook_received_total counter\nshopee_webhook_received_total 3\n', text)
+        self.assertIn('shopee_api_retries_total{path="/api/v2/order/get_order_list"} 2\n', text)
+
+    def test_histogram_buckets_are_cumulative_and_filled(self):
+        metrics = {}
+        for field, value in [
+            (metric_field('job_seconds_count', {'job': 'a'}), 1),
+            (metric_field('job_seconds_sum', {'job': 'a'}), 0.75),
+            (metric_field('job_seconds_bucket', {'job': 'a', 'le': 1}), 1),
+            (metric_field('job_seconds_bucket', {'job': 'a', 'le': '+Inf'}), 1),
+            # another series that reached a lower bucket defines le="0.5"
+            (metric_field('job_seconds_count', {'job': 'b'}), 1),
+            (metric_field('job_seconds_sum', {'job': 'b'}), 0.1),
+            (metric_field('job_seconds_bucket', {'job': 'b', 'le': 0.5}), 1),
+            (metric_field('job_seconds_bucket', {'job': 'b', 'le': 1}), 1),
+            (metric_field('job_seconds_bucket', {'job': 'b', 'le': '+Inf'}), 1),
+        ]:
+            metrics[field] = value
+
+        lines = render_prometheus(metrics).splitlines()
+        self.assertEqual(lines[0], '# TYPE shopee_job_seconds histogram')
+        series_a = [line for line in lines if 'job="a"' in line]
+        self.assertEqual(series_a, [
+            'shopee_job_seconds_bucket{job="a",le="0.5"} 0',
+            'shopee_job_seconds_bucket{job="a",le="1"} 1',
+            'shopee_job_seconds_bucket{job="a",le="+Inf"} 1',
+            'shopee_job_seconds_count{job="a"} 1',
+            'shopee_job_seconds_sum{job="a"} 0.75',
+        ])
+
+    def test_count_and_sum_only_is_a_summary(self):
+        text = render_prometheus({'api_rate_limit_wait_seconds_count': 2, 'api_rate_limit_wait_seconds_sum': 1.5})
+        self.assertIn('# TYPE shopee_api_rate_limit_wait_seconds summary', text)
+        self.assertIn('shopee_api_rate_limit_wait_seconds_sum 1.5', text)
+
+    def test_labelled_gauges(self):
+        text = render_prometheus({}, {
+            metric_field('webhook_queue_length', {'lane': 'orders'}): 4,
+            metric_field('webhook_queue_length', {'lane': 'critical'}): 0,
+            'order_events_buffered_orders': 7,
+        })
+        self.assertEqual(text, "\n".join([
+            '# TYPE shopee_order_events_buffered_orders gauge',
+            'shopee_order_events_buffered_orders 7',
+            '# TYPE shopee_webhook_queue_length gauge',
+            'shopee_webhook_queue_length{lane="critical"} 0',
+            'shopee_webhook_queue_length{lane="orders"} 4',
+        ]) + "\n")
+
+    def test_label_escaping_and_values(self):
+        self.assertEqual(format_labels({'b': 'x"y', 'a': 'back\\slash\nnew'}), '{a="back\\\\slash\\nnew",b="x\\"y"}')
+        self.assertEqual(format_labels({}), '')
+        self.assertEqual(format_value(3.0), '3')
+        self.assertEqual(format_value(0.25), '0.25')
+
+
+class TestMetricsRoundTrip(FrappeTestCase):
+    def test_incr_and_observe_are_flushed_to_redis(self):
+        metric = f"test_metric_{frappe.generate_hash(length=6)}"
+        before = get_metrics()
+        incr(metric, 2, {'kind': 'x'})
+        incr(metric, 3, {'kind': 'x'})
+        observe(f"{metric}_seconds", 0.2, buckets=(0.1, 1))
+        flush()
+
+        metrics = get_metrics()
+        self.assertEqual(metrics[metric_field(metric, {'kind': 'x'})], 5)
+        self.assertEqual(metrics[f"{metric}_seconds_count"], 1)
+        self.assertAlmostEqual(metrics[f"{metric}_seconds_sum"], 0.2)
+        self.assertNotIn(metric_field(f"{metric}_seconds_bucket", {'le': 0.1}), metrics)
+        self.assertEqual(metrics[metric_field(f"{metric}_seconds_bucket", {'le': 1})], 1)
+        self.assertNotIn(metric_field(metric, {'kind': 'x'}), before)
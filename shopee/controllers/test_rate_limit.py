@@ -0,0 +1,56 @@
+from unittest.mock import patch
+import frappe
+from frappe.tests.utils import FrappeTestCase
+from redis.exceptions import RedisError
+from shopee.controllers import rate_limit
+from shopee.controllers.rate_limit import RateLimiter
+
+PARTNER_ID = 'test-partner'
+
+
+class TestRateLimiter(FrappeTestCase):
+    def setUp(self):
+        frappe.cache().delete_keys("shopee:ratelimit:")
+        # acquire sleeps for the reserved wait; only the returned value matters here
+        sleep = patch.object(rate_limit.time, 'sleep')
+        self.sleep = sleep.start()
+        self.addCleanup(sleep.stop)
+
+    def tearDown(self):
+        frappe.cache().delete_keys("shopee:ratelimit:")
+
+    def test_burst_then_wait_for_refill(self):
+        limiter = RateLimiter(PARTNER_ID, partner_qps=2, shop_qps=0)
+        self.assertEqual(limiter.acquire(), 0)
+        self.assertEqual(limiter.acquire(), 0)
+
+        wait = limiter.acquire()
+        self.assertAlmostEqual(wait, 0.5, delta=0.1)
+        self.sleep.assert_called_once_with(wait)
+
+        # reservations queue up: the next caller waits behind the previous one
+        self.assertAlmostEqual(limiter.acquire(), 1.0, delta=0.1)
+
+    def test_shop_bucket_is_separate_and_strictest_wins(self):
+        limiter = RateLimiter(PARTNER_ID, partner_qps=100, shop_qps=1)
+        self.assertEqual(limiter.acquire(shop_id=1), 0)
+        self.assertAlmostEqual(limiter.acquire(shop_id=1), 1.0, delta=0.1)
+        # another shop only shares the partner bucket
+        self.assertEqual(limiter.acquire(shop_id=2), 0)
+
+    def test_zero_qps_disables_limiting(self):
+        limiter = RateLimiter(PARTNER_ID, partner_qps=0, shop_qps=0)
+        with patch.object(limiter, 'script') as script:
+            self.assertEqual(limiter.acquire(shop_id=1), 0)
+            script.assert_not_called()
+
+    def test_wait_is_capped(self):
+        limiter = RateLimiter(PARTNER_ID, partner_qps=0.01, shop_qps=0)
+        limiter.acquire()
+        self.assertEqual(limiter.acquire(), rate_limit.MAX_WAIT)
+
+    def test_fails_open_when_redis_is_unavailable(self):
+        limiter = RateLimiter(PARTNER_ID, partner_qps=1, shop_qps=1)
+        with patch.object(limiter, 'script', side_effect=RedisError):
+            self.assertEqual(limiter.acquire(shop_id=1), 0)
+        self.sleep.assert_not_called()
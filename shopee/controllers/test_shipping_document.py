@@ -0,0 +1,76 @@
+from unittest.mock import patch
+import frappe
+from frappe.tests.utils import FrappeTestCase
+from shopee.controllers import shipping_document
+from shopee.controllers.shipping_document import (buffer_ready_document, get_ready_documents, remove_ready_documents,
+                                                  record_failed_documents, retry_ready_documents, document_order,
+                                                  MAX_DOWNLOAD_ATTEMPTS)
+
+SHOP_ID = '990000001'
+
+
+class TestReadyDocumentBuffer(FrappeTestCase):
+    def setUp(self):
+        self.clear()
+        enqueue = patch.object(shipping_document.frappe, 'enqueue')
+        self.enqueue = enqueue.start()
+        self.addCleanup(enqueue.stop)
+
+    def tearDown(self):
+        self.clear()
+
+    def clear(self):
+        cache = frappe.cache()
+        cache.delete_keys("shopee:shipping_documents:")
+
+    def test_entries_stay_buffered_until_removed(self):
+        buffer_ready_document(int(SHOP_ID), 'A', 'PKG-A')
+        buffer_ready_document(SHOP_ID, 'B')
+        self.enqueue.assert_called_once()
+
+        self.assertEqual(sorted(get_ready_documents()[SHOP_ID]), ['A', 'B'])
+        # reading does not remove
+        self.assertEqual(sorted(get_ready_documents()[SHOP_ID]), ['A', 'B'])
+        self.assertEqual(get_ready_documents(exclude={f"{SHOP_ID}:A"}), {SHOP_ID: ['B']})
+
+        remove_ready_documents(SHOP_ID, ['A'])
+        self.assertEqual(get_ready_documents(), {SHOP_ID: ['B']})
+
+    def test_failed_entries_are_dropped_after_max_attempts(self):
+        buffer_ready_document(SHOP_ID, 'A')
+        buffer_ready_document(SHOP_ID, 'B')
+        for _ in range(MAX_DOWNLOAD_ATTEMPTS - 1):
+            self.assertEqual(record_failed_documents(SHOP_ID, ['A']), [])
+        self.assertEqual(record_failed_documents(SHOP_ID, ['A', 'B']), ['A'])
+        self.assertEqual(get_ready_documents(), {SHOP_ID: ['B']})
+
+    def test_success_resets_the_attempt_count(self):
+        buffer_ready_document(SHOP_ID, 'A')
+        record_failed_documents(SHOP_ID, ['A'])
+        remove_ready_documents(SHOP_ID, ['A'])
+
+        buffer_ready_document(SHOP_ID, 'A')
+        for _ in range(MAX_DOWNLOAD_ATTEMPTS - 1):
+            self.assertEqual(record_failed_documents(SHOP_ID, ['A']), [])
+
+    def test_scheduled_retry_only_when_something_is_buffered(self):
+        retry_ready_documents()
+        self.enqueue.assert_not_called()
+
+        buffer_ready_document(SHOP_ID, 'A')
+        self.enqueue.reset_mock()
+        retry_ready_documents()
+        self.enqueue.assert_called_once()
+        self.assertEqual(self.enqueue.call_args.kwargs['job_id'], shipping_document.FLUSH_JOB_ID)
+
+
+class TestDocumentOrder(FrappeTestCase):
+    def test_optional_fields(self):
+        order = frappe._dict(shopee_order_sn='A', shopee_package_number=None)
+        self.assertEqual(document_order(order), {'order_sn': 'A'})
+
+        order = frappe._dict(shopee_order_sn='A', shopee_package_number='PKG', shopee_tracking_number='T1')
+        self.assertEqual(document_order(order, 'NORMAL_AIR_WAYBILL'), {
+            'order_sn': 'A', 'package_number': 'PKG', 'tracking_number': 'T1',
+            'shipping_document_type': 'NORMAL_AIR_WAYBILL'
+        })
@@ -0,0 +1,60 @@
+from unittest.mock import patch
+import frappe
+from frappe.tests.utils import FrappeTestCase
+from shopee.controllers import stock_sync
+from shopee.controllers.stock_sync import get_available_stock, record_stock_changes
+
+ITEM_A = '_Test Shopee Stock A'
+ITEM_B = '_Test Shopee Stock B'
+WAREHOUSE_1 = '_Test Shopee Warehouse 1'
+WAREHOUSE_2 = '_Test Shopee Warehouse 2'
+
+
+class TestGetAvailableStock(FrappeTestCase):
+    def setUp(self):
+        conf = patch.dict(frappe.local.conf)
+        conf.start()
+        self.addCleanup(conf.stop)
+        frappe.local.conf.pop('shopee_stock_warehouses', None)
+
+        frappe.db.bulk_insert('Bin', ['name', 'item_code', 'warehouse', 'actual_qty', 'reserved_qty'], [
+            (frappe.generate_hash(length=10), ITEM_A, WAREHOUSE_1, 10, 3),
+            (frappe.generate_hash(length=10), ITEM_A, WAREHOUSE_2, 5, 0),
+            (frappe.generate_hash(length=10), ITEM_B, WAREHOUSE_1, 2, 4),
+        ])
+
+    def tearDown(self):
+        frappe.db.rollback()
+
+    def test_actual_minus_reserved_over_all_warehouses(self):
+        self.assertEqual(get_available_stock([ITEM_A, ITEM_B, '_Test Shopee Stock Missing']), {ITEM_A: 12, ITEM_B: 0})
+
+    def test_only_configured_warehouses(self):
+        frappe.local.conf.shopee_stock_warehouses = [WAREHOUSE_2]
+        self.assertEqual(get_available_stock([ITEM_A, ITEM_B]), {ITEM_A: 5})
+
+    def test_shopee_reserved_stock_is_not_subtracted(self):
+        frappe.db.bulk_insert(stock_sync.DELTA_DOCTYPE, ['name', 'shop_id', 'shopee_item_id', 'shopee_model_id',
+                                                         'item_code', 'shopee_reserved_stock'],
+                              [('990000001-1-0', '990000001', '1', '0', ITEM_A, 4)])
+        self.assertEqual(get_available_stock([ITEM_A]), {ITEM_A: 12})
+
+
+class TestRecordStockChanges(FrappeTestCase):
+    def tearDown(self):
+        frappe.local.shopee_stock_changes = None
+
+    def test_does_nothing_without_custom_fields(self):
+        frappe.local.shopee_stock_changes = {ITEM_A}
+        with patch.object(frappe.db, 'has_column', return_value=False), \
+                patch.object(stock_sync, 'record_pending_items') as record_pending_items:
+            record_stock_changes()
+        record_pending_items.assert_not_called()
+
+    def test_errors_are_logged_not_raised(self):
+        frappe.local.shopee_stock_changes = {ITEM_A}
+        with patch.object(stock_sync, 'record_pending_items', side_effect=Exception('boom')), \
+                patch.object(frappe, 'log_error') as log_error:
+            record_stock_changes()
+        log_error.assert_called_once()
+        self.assertIsNone(frappe.local.shopee_stock_changes)
@@ -0,0 +1,60 @@
+import frappe
+from frappe.tests.utils import FrappeTestCase
+from frappe.utils.password import get_decrypted_password
+from shopee.controllers.token_management import bulk_upsert_tokens
+
+SHOP_ID = '990000001'
+OTHER_SHOP_ID = '990000002'
+MERCHANT_ID = '990000003'
+
+
+def token(identifier, is_merchant=False, suffix='1', expire_in=14400):
+    return {'identifier': identifier, 'is_merchant': is_merchant, 'access_token': f"access-{suffix}",
+            'refresh_token': f"refresh-{suffix}", 'expire_in': expire_in}
+
+
+class TestBulkUpsertTokens(FrappeTestCase):
+    def tearDown(self):
+        frappe.db.rollback()
+
+    def get_row(self, id_type, id_value):
+        rows = frappe.get_all('Shopee Token Management', filters={id_type: id_value},
+                              fields=['name', 'token_expiry', 'active'])
+        self.assertEqual(len(rows), 1)
+        return rows[0]
+
+    def assertTokens(self, name, access_token, refresh_token):
+        self.assertEqual(get_decrypted_password('Shopee Token Management', name, 'access_token'), access_token)
+        self.assertEqual(get_decrypted_password('Shopee Token Management', name, 'refresh_token'), refresh_token)
+
+    def test_inserts_new_rows(self):
+        bulk_upsert_tokens([token(SHOP_ID), token(MERCHANT_ID, is_merchant=True, suffix='m')], commit=False)
+
+        shop = self.get_row('shop_id', SHOP_ID)
+        merchant = self.get_row('merchant_id', MERCHANT_ID)
+        self.assertEqual(shop.active, 1)
+        self.assertTokens(shop.name, 'access-1', 'refresh-1')
+        self.assertTokens(merchant.name, 'access-m', 'refresh-m')
+        self.assertFalse(frappe.db.exists('Shopee Token Management', {'merchant_id': SHOP_ID}))
+
+    def test_updates_existing_rows_and_inserts_the_rest(self):
+        bulk_upsert_tokens([token(SHOP_ID)], commit=False)
+        existing = self.get_row('shop_id', SHOP_ID)
+
+        bulk_upsert_tokens([token(SHOP_ID, suffix='2', expire_in=100), token(OTHER_SHOP_ID, suffix='3')], commit=False)
+
+        updated = self.get_row('shop_id', SHOP_ID)
+        self.assertEqual(updated.name, existing.name)
+        self.assertLess(updated.token_expiry, existing.token_expiry)
+        self.assertTokens(updated.name, 'access-2', 'refresh-2')
+        self.assertTokens(self.get_row('shop_id', OTHER_SHOP_ID).name, 'access-3', 'refresh-3')
+
+    def test_identifiers_are_normalized_and_later_entries_win(self):
+        bulk_upsert_tokens([token(int(SHOP_ID), suffix='1'), token(f"{SHOP_ID}.0", suffix='2')], commit=False)
+        bulk_upsert_tokens([token(f" {SHOP_ID} ", suffix='3')], commit=False)
+
+        self.assertTokens(self.get_row('shop_id', SHOP_ID).name, 'access-3', 'refresh-3')
+
+    def test_empty_list_is_a_no_op(self):
+        bulk_upsert_tokens([], commit=False)
+        self.assertFalse(frappe.db.exists('Shopee Token Management', {'shop_id': SHOP_ID}))
@@ -0,0 +1,38 @@
+from frappe.tests.utils import FrappeTestCase
+from shopee.controllers.utils import normalize_id, plan_uses_index
+
+
+class TestNormalizeId(FrappeTestCase):
+    def test_canonical_form(self):
+        for value in (123456, '123456', ' 123456 ', '123456.0', 123456.0, '0123456'):
+            self.assertEqual(normalize_id(value), '123456', value)
+
+    def test_none_and_empty(self):
+        self.assertIsNone(normalize_id(None))
+        self.assertEqual(normalize_id(''), '')
+
+    def test_large_ids_are_kept_exact(self):
+        # Shopee ids can exceed 32 bits
+        self.assertEqual(normalize_id(9876543210123), '9876543210123')
+
+    def test_non_numeric_values_are_only_stripped(self):
+        self.assertEqual(normalize_id(' abc-1 '), 'abc-1')
+        self.assertEqual(normalize_id('-5'), '-5')
+
+
+class TestPlanUsesIndex(FrappeTestCase):
+    def test_index_lookups(self):
+        self.assertTrue(plan_uses_index([{'type': 'ref', 'key': 'shop_id', 'Extra': 'Using where'}]))
+        self.assertTrue(plan_uses_index([{'type': 'range', 'key': 'shopee_order_sn', 'Extra': None}]))
+
+    def test_unique_lookup_of_a_missing_value_counts_as_indexed(self):
+        self.assertTrue(plan_uses_index([{'type': None, 'key': None,
+                                          'Extra': 'Impossible WHERE noticed after reading const tables'}]))
+        self.assertTrue(plan_uses_index([{'type': 'const', 'key': None, 'Extra': None}]))
+        self.assertTrue(plan_uses_index([{'type': 'system', 'key': None, 'Extra': 'const row not found'}]))
+
+    def test_scans(self):
+        self.assertFalse(plan_uses_index([{'type': 'ALL', 'key': None, 'Extra': 'Using where'}]))
+        self.assertFalse(plan_uses_index([{'type': 'ref', 'key': 'a'}, {'type': 'ALL', 'key': None}]))
+        # a constant-false condition without any index is still a scan
+        self.assertFalse(plan_uses_index([{'type': None, 'key': None, 'Extra': 'Impossible WHERE'}]))
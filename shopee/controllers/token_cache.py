@@ -0,0 +1,140 @@
+import time
+import frappe
+from frappe.utils import cint
+from frappe.utils.password import get_decrypted_password, decrypt
+from .utils import normalize_id
+from .metrics import incr
+
+# Tokens are treated as expired this many seconds before `token_expiry`,
+# which is also the window in which ensure_valid_access_token refreshes them.
+SAFETY_MARGIN = 300
+
+# Upper bound for the in-process tier. Other workers can only be invalidated
+# through Redis, so a local entry is re-checked against Redis at least this often.
+LOCAL_TTL = 60
+
+# v2: entries hold the encrypted access token only; v1 entries expire with their TTL
+CACHE_PREFIX = "shopee:token:v2:"
+
+# (site, cache key) -> (local expiry, entry)
+_local_cache = {}
+
+
+def _cache_key(identifier_field, identifier_value):
+    return f"{CACHE_PREFIX}{identifier_field}:{normalize_id(identifier_value)}"
+
+
+def get_token_entry(identifier_field, identifier_value):
+    """
+    Return the cached token entry for a shop_id/merchant_id, loading it from the database on a miss.
+
+    The entry is a dict with `name`, `access_token`, `token_expiry` and `active`.
+    Redis only holds the encrypted access token (decrypted on read); the refresh token is never
+    cached, read it with get_refresh_token. Entries expire `SAFETY_MARGIN` seconds before the
+    stored `token_expiry`. Returns None if no token exists for the identifier.
+    """
+    key = _cache_key(identifier_field, identifier_value)
+    local_key = (frappe.local.site, key)
+    now = int(time.time())
+
+    # 1. 进程内缓存
+    cached = _local_cache.get(local_key)
+    if cached and cached[0] > now:
+        incr('token_cache_lookups', labels={'tier': 'local'})
+        return cached[1]
+
+    # 2. Redis 缓存（加密的 access_token）
+    stored = frappe.cache().get_value(key)
+    if stored and stored['token_expiry'] - SAFETY_MARGIN > now:
+        incr('token_cache_lookups', labels={'tier': 'redis'})
+    else:
+        # 3. 数据库
+        incr('token_cache_lookups', labels={'tier': 'db'})
+        stored = load_token_entry(identifier_field, identifier_value)
+        if not stored:
+            _local_cache.pop(local_key, None)
+            return None
+        ttl = stored['token_expiry'] - SAFETY_MARGIN - now
+        if ttl <= 0:
+            # About to expire: let the caller refresh it instead of caching it.
+            _local_cache.pop(local_key, None)
+            return decrypt_entry(stored)
+        frappe.cache().set_value(key, stored, expires_in_sec=ttl)
+
+    entry = decrypt_entry(stored)
+    local_expiry = min(entry['token_expiry'] - SAFETY_MARGIN, now + LOCAL_TTL)
+    _local_cache[local_key] = (local_expiry, entry)
+    return entry
+
+
+def load_token_entry(identifier_field, identifier_value):
+    """
+    Read a token entry straight from Shopee Token Management, with the access token still encrypted.
+    """
+    rows = frappe.get_all('Shopee Token Management', filters={identifier_field: normalize_id(identifier_value)},
+                          fields=['name', 'token_expiry', 'active'], limit=1)
+    if not rows:
+        return None
+
+    name = rows[0].name
+    return {
+        'name': name,
+        'access_token': get_encrypted_tokens([name], 'access_token').get(name),
+        'token_expiry': cint(rows[0].token_expiry),
+        'active': cint(rows[0].active)
+    }
+
+
+def decrypt_entry(stored):
+    return dict(stored, access_token=decrypt(stored['access_token']) if stored['access_token'] else None)
+
+
+def get_refresh_token(name):
+    """
+    Decrypted refresh token of one Shopee Token Management row, always read from the database.
+    """
+    return get_decrypted_password('Shopee Token Management', name, 'refresh_token', raise_exception=False)
+
+
+def get_encrypted_tokens(names, fieldname):
+    """
+    Encrypted values of one Password field (`access_token`/`refresh_token`) for many rows in one query.
+    Returns {name: value}.
+    """
+    if not names:
+        return {}
+    Auth = frappe.qb.Table("__Auth")
+    rows = (
+        frappe.qb.from_(Auth)
+        .select(Auth.name, Auth.password)
+        .where((Auth.doctype == 'Shopee Token Management') & (Auth.fieldname == fieldname) & Auth.name.isin(names))
+    ).run(as_dict=True)
+    return {row.name: row.password for row in rows}
+
+
+def get_decrypted_tokens(names, fieldname):
+    """
+    Decrypt one Password field (`access_token`/`refresh_token`) for many rows with a single query.
+    Returns {name: value}.
+    """
+    return {name: decrypt(value) for name, value in get_encrypted_tokens(names, fieldname).items()}
+
+
+def invalidate_token(identifier_field, identifier_value):
+    """
+    Drop the cached entry for a shop_id/merchant_id from both cache tiers.
+    Call this after the token row has been written and committed.
+    """
+    key = _cache_key(identifier_field, identifier_value)
+    _local_cache.pop((frappe.local.site, key), None)
+    frappe.cache().delete_value(key)
+
+
+def clear_token_cache():
+    """
+    Drop every cached token entry for the current site.
+    """
+    site = frappe.local.site
+    for local_key in [k for k in _local_cache if k[0] == site]:
+        _local_cache.pop(local_key, None)
+    frappe.cache().delete_keys(CACHE_PREFIX)
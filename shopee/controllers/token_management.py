@@ -1,92 +1,164 @@
 import frappe
-import requests
 import time
 from frappe import _
-from .utils import generate_signature
-from urllib.parse import urlencode
-from datetime import datetime
-from .shopee_integration import fetch_merchant_info, fetch_shop_info 
-from shopee.config import SHOPEE_URL, get_partner_id, get_partner_key
+from frappe.utils import cint, now_datetime
+from frappe.utils.password import encrypt
+from pypika.terms import Values
+from .client import get_client, ShopeeAPIError, ShopeeHTTPError
+from .token_cache import get_token_entry, get_refresh_token, invalidate_token, SAFETY_MARGIN
+from .locks import distributed_lock
+from .metrics import incr
+from .audit import log_sync_event
+from .utils import normalize_id
+from .shopee_integration import fetch_entities_info
 
-# 常量配置
-PARTNER_ID = get_partner_id()
-PARTNER_KEY = get_partner_key()
+# 刷新锁：持有上限（需覆盖一次完整的 HTTP 调用）与等待上限，单位秒
+REFRESH_LOCK_TIMEOUT = 30
+REFRESH_LOCK_WAIT = 10
+
+# Shopee 未返回 expire_in 时，access_token 的默认有效期（4 小时）
+DEFAULT_EXPIRE_IN = 14400
 
 def get_tokens(auth_code, main_account_id, is_merchant=False):
     """
     使用授权码获取access_token和refresh_token。
     """
-    timestamp = int(time.time())
+    client = get_client()
     path = "/api/v2/auth/token/get"
-    
-    # 使用外部模块生成签名
-    signature = generate_signature(PARTNER_ID, path, timestamp, PARTNER_KEY)
 
-    # 构建带有签名的完整URL
-    url = f"{SHOPEE_URL}{path}?partner_id={PARTNER_ID}&timestamp={timestamp}&sign={signature}"
-    
     # 构建JSON请求体
     body = {
         "code": auth_code,
         "main_account_id": main_account_id,  # 加入 main_account_id 参数
-        "partner_id": PARTNER_ID
+        "partner_id": client.partner_id
     }
 
-    headers = {"Content-Type": "application/json"}
-    response = requests.post(url, json=body, headers=headers)
-
-    if response.ok:
-        result = response.json()
-        print(result)
+    # 签名和带签名的完整URL由 client 生成
+    try:
+        result = client.post(path, body=body)
+    except ShopeeAPIError as e:
         # 检查是否有错误信息
-        if result.get('error'):
-            error_msg = result.get('message', 'No additional error message provided.')
-            if error_msg:
-                frappe.log_error(f"Shopee API error: {error_msg}", 'Shopee Token Retrieval Error')
-                frappe.throw(_("Failed to obtain tokens: ") + error_msg)
-
-        # 检查是否包含必要的令牌信息
-        if 'access_token' in result and 'refresh_token' in result:
-            # 处理可能的ID列表
-            merchant_ids = result.get('merchant_id_list', [])
-            shop_ids = result.get('shop_id_list', [])
-            # 如果需要，这里可以添加供应商ID的处理逻辑
-
-            # 保存令牌信息
-            for merchant_id in merchant_ids:
-                save_tokens(result['access_token'], result['refresh_token'], result['expire_in'], merchant_id, is_merchant=True)
-                fetch_merchant_info(merchant_id)  # 自动保存商户信息
-            for shop_id in shop_ids:
-                save_tokens(result['access_token'], result['refresh_token'], result['expire_in'], shop_id, is_merchant=False)
-                fetch_shop_info(shop_id)  # 自动保存商店信息
-
-            return result
-        else:
-            frappe.throw(_("Failed to obtain tokens: Detailed API response: ") + response.text)
+        error_msg = e.message or 'No additional error message provided.'
+        frappe.log_error(f"Shopee API error: {error_msg}", 'Shopee Token Retrieval Error')
+        frappe.throw(_("Failed to obtain tokens: ") + error_msg)
+    except ShopeeHTTPError as e:
+        frappe.throw(_("Failed to communicate with Shopee API. Detailed response: ") + (e.response_text or str(e)))
+
+    # 检查是否包含必要的令牌信息
+    if 'access_token' in result and 'refresh_token' in result:
+        # 处理可能的ID列表
+        merchant_ids = result.get('merchant_id_list', [])
+        shop_ids = result.get('shop_id_list', [])
+        # 如果需要，这里可以添加供应商ID的处理逻辑
+
+        # 一次性批量保存所有商户和店铺的令牌信息
+        bulk_upsert_tokens(
+            [{'identifier': merchant_id, 'is_merchant': True, 'access_token': result['access_token'],
+              'refresh_token': result['refresh_token'], 'expire_in': result['expire_in']} for merchant_id in merchant_ids]
+            + [{'identifier': shop_id, 'is_merchant': False, 'access_token': result['access_token'],
+                'refresh_token': result['refresh_token'], 'expire_in': result['expire_in']} for shop_id in shop_ids]
+        )
+
+        # 并发拉取并自动保存商户和商店信息
+        fetch_entities_info(merchant_ids, shop_ids, result['access_token'])
+
+        return result
     else:
-        frappe.throw(_("Failed to communicate with Shopee API. Detailed response: ") + response.text)
+        frappe.throw(_("Failed to obtain tokens: Detailed API response: ") + frappe.as_json(result))
 
-def save_tokens(access_token, refresh_token, expire_in, identifier, is_merchant):
+def save_tokens(access_token, refresh_token, expire_in, identifier, is_merchant, commit=True):
     """
     Save or update the token information in Shopee Token Management doctype.
+    With commit=False the caller owns the transaction and must call invalidate_token after committing.
     """
-    existing_doc = frappe.get_all('Shopee Token Management', filters={('merchant_id' if is_merchant else 'shop_id'): identifier}, fields=['name'])
-    if existing_doc:
-        doc = frappe.get_doc('Shopee Token Management', existing_doc[0]['name'])
-    else:
-        doc = frappe.new_doc('Shopee Token Management')
-        if is_merchant:
-            doc.merchant_id = identifier
+    bulk_upsert_tokens([{
+        'identifier': identifier,
+        'is_merchant': is_merchant,
+        'access_token': access_token,
+        'refresh_token': refresh_token,
+        'expire_in': expire_in
+    }], commit=commit)
+
+def bulk_upsert_tokens(tokens, commit=True):
+    """
+    Insert or update many Shopee Token Management rows with a fixed number of queries.
+
+    `tokens` is a list of dicts with `identifier`, `is_merchant`, `access_token`, `refresh_token`
+    and `expire_in`. Existing rows are resolved in one query, updated with one bulk UPDATE,
+    new rows are added with one bulk INSERT and the encrypted tokens are upserted into __Auth
+    in one statement. With commit=True the transaction is committed and the token cache invalidated.
+    """
+    if not tokens:
+        return
+
+    now = now_datetime()
+    token_expiry_base = int(time.time())
+    rows = {}
+    for token in tokens:
+        id_type = 'merchant_id' if token['is_merchant'] else 'shop_id'
+        rows[(id_type, normalize_id(token['identifier']))] = token  # later entries win
+
+    # 1. 一次查询解析已存在的记录
+    existing = {}
+    for id_type in ('shop_id', 'merchant_id'):
+        ids = [id_value for (t, id_value) in rows if t == id_type]
+        if ids:
+            for row in frappe.get_all('Shopee Token Management', filters={id_type: ['in', ids]}, fields=['name', id_type]):
+                existing[(id_type, normalize_id(row[id_type]))] = row.name
+
+    updates = {}
+    inserts = []
+    passwords = []
+    for key, token in rows.items():
+        id_type, id_value = key
+        values = {
+            'access_token': '*' * len(token['access_token']),
+            'refresh_token': '*' * len(token['refresh_token']),
+            'token_expiry': token_expiry_base + (cint(token.get('expire_in')) or DEFAULT_EXPIRE_IN),
+            'last_refreshed': now,
+            'active': 1
+        }
+        name = existing.get(key)
+        if name:
+            updates[name] = values
         else:
-            doc.shop_id = identifier
+            name = frappe.generate_hash(length=10)
+            inserts.append((
+                name, now, now, frappe.session.user, frappe.session.user, 0,
+                id_value if id_type == 'shop_id' else None,
+                id_value if id_type == 'merchant_id' else None,
+                values['access_token'], values['refresh_token'], values['token_expiry'], now, 1
+            ))
+        passwords.append((name, 'access_token', token['access_token']))
+        passwords.append((name, 'refresh_token', token['refresh_token']))
+
+    # 2. 批量更新 / 批量插入
+    if updates:
+        frappe.db.bulk_update('Shopee Token Management', updates)
+        incr('db_rows_written', len(updates), {'doctype': 'Shopee Token Management', 'op': 'update'})
+    if inserts:
+        incr('db_rows_written', len(inserts), {'doctype': 'Shopee Token Management', 'op': 'insert'})
+        frappe.db.bulk_insert('Shopee Token Management',
+                              ['name', 'creation', 'modified', 'owner', 'modified_by', 'docstatus',
+                               'shop_id', 'merchant_id', 'access_token', 'refresh_token', 'token_expiry',
+                               'last_refreshed', 'active'],
+                              inserts)
 
-    doc.access_token = access_token
-    doc.refresh_token = refresh_token
-    doc.token_expiry = int(time.time()) + int(expire_in)
-    doc.last_refreshed = datetime.now()
-    doc.active = 1
-    doc.save(ignore_permissions=True)
-    frappe.db.commit()
+    # 3. Password 字段实际存放在 __Auth 表中（与 frappe.utils.password.set_encrypted_password 相同）
+    Auth = frappe.qb.Table("__Auth")
+    query = frappe.qb.into(Auth).columns(Auth.doctype, Auth.name, Auth.fieldname, Auth.password, Auth.encrypted)
+    for name, fieldname, value in passwords:
+        query = query.insert('Shopee Token Management', name, fieldname, encrypt(value), 1)
+    if frappe.db.db_type == "mariadb":
+        query = query.on_duplicate_key_update(Auth.password, Values(Auth.password))
+    elif frappe.db.db_type == "postgres":
+        query = query.on_conflict(Auth.doctype, Auth.name, Auth.fieldname).do_update(Auth.password)
+    query.run()
+
+    if commit:
+        frappe.db.commit()
+        for id_type, id_value in rows:
+            invalidate_token(id_type, id_value)
 
 def ensure_valid_access_token(shop_id=None, merchant_id=None):
     """
@@ -95,28 +167,51 @@ def ensure_valid_access_token(shop_id=None, merchant_id=None):
     """
     identifier_field = 'shop_id' if shop_id else 'merchant_id'
     identifier_value = shop_id if shop_id else merchant_id
-    
-    token_doc = frappe.get_all('Shopee Token Management', filters={identifier_field: identifier_value},
-                               fields=['name', 'access_token', 'refresh_token', 'token_expiry'], limit=1)
+
+    # 先查缓存，未命中时才访问数据库
+    token_doc = get_token_entry(identifier_field, identifier_value)
     if not token_doc:
         frappe.throw(_('No token found for the given identifier.'))
 
-    token_doc = frappe.get_doc('Shopee Token Management', token_doc[0].name)
     now = int(time.time())
-    
+
     # Check if the token is about to expire or has already expired
-    if token_doc.token_expiry - now <= 300:  # Consider refreshing if less than 5 minutes left
-        new_access_token, new_refresh_token = refresh_token(identifier_field, identifier_value, token_doc.refresh_token)
-        print("refreshing")
+    if token_doc['token_expiry'] - now <= SAFETY_MARGIN:  # Consider refreshing if less than 5 minutes left
+        return refresh_access_token_once(identifier_field, identifier_value, token_doc)
+
+    return token_doc['access_token']
+
+def refresh_access_token_once(identifier_field, identifier_value, token_doc):
+    """
+    Refresh the token for one shop/merchant with single-flight semantics across workers.
+
+    Shopee rotates the refresh_token on every refresh, so only the lock holder calls
+    refresh_token; everyone else waits for the lock and then reads the fresh token
+    from the cache that the holder repopulated.
+    """
+    with distributed_lock(f"token_refresh:{identifier_field}:{identifier_value}",
+                          timeout=REFRESH_LOCK_TIMEOUT, blocking_timeout=REFRESH_LOCK_WAIT,
+                          metric='token_refresh_lock') as acquired:
+        # 等待期间其他 worker 可能已经完成刷新
+        latest = get_token_entry(identifier_field, identifier_value) or token_doc
+        if latest['token_expiry'] - int(time.time()) > SAFETY_MARGIN:
+            return latest['access_token']
+
+        if not acquired:
+            # The holder is still refreshing; the current token is usable until it actually expires.
+            if latest['token_expiry'] > int(time.time()):
+                return latest['access_token']
+            frappe.throw(_('Access token refresh is already in progress. Please try again.'))
+
+        # refresh_token persists the new tokens via save_tokens, which also invalidates the cache
+        new_access_token, new_refresh_token = refresh_token(identifier_field, identifier_value,
+                                                             get_refresh_token(latest['name']))
         if new_access_token and new_refresh_token:
-            token_doc.access_token = new_access_token
-            token_doc.refresh_token = new_refresh_token
-            token_doc.token_expiry = now + 14400  # Assuming the new access token lasts for 4 hours
-            token_doc.last_refreshed = datetime.now()
-            token_doc.save(ignore_permissions=True)
-            frappe.db.commit()
-    
-    return token_doc.access_token
+            # Repopulate the cache before releasing the lock so waiters never hit the database
+            get_token_entry(identifier_field, identifier_value)
+            return new_access_token
+
+        return latest['access_token']
 
 def refresh_token(id_type, id_value, current_refresh_token):
     """
@@ -130,30 +225,33 @@ def refresh_token(id_type, id_value, current_refresh_token):
     Returns:
     tuple: (new_access_token, new_refresh_token) if successful, otherwise None
     """
-    timest = int(time.time())
-    host = "https://openplatform.shopee.cn"
-    path = "/api/v2/auth/access_token/get"
-    body = {id_type: id_value, "refresh_token": current_refresh_token, "partner_id": PARTNER_ID}
-    
-    signature = generate_signature(PARTNER_ID, path, timest, PARTNER_KEY)
-    url = f"{host}{path}?partner_id={PARTNER_ID}&timestamp={timest}&sign={signature}"
-
-    headers = {"Content-Type": "application/json"}
-    response = requests.post(url, json=body, headers=headers)
-    
-    if response.status_code == 200:
-        ret = response.json()
-        new_access_token = ret.get("access_token")
-        new_refresh_token = ret.get("refresh_token")
-
-        # Call save_tokens to update the tokens in the database
-        if new_access_token and new_refresh_token:
-            save_tokens(new_access_token, new_refresh_token, ret.get('expire_in'), id_value, id_type == 'merchant_id')
-            return new_access_token, new_refresh_token
-        else:
-            frappe.log_error(_("Failed to obtain new tokens."), 'Token Refresh Error')
-            return None, None
+    try:
+        ret = request_token_refresh(get_client(), id_type, id_value, current_refresh_token)
+    except (ShopeeAPIError, ShopeeHTTPError) as e:
+        incr('token_refresh', labels={'trigger': 'on_demand', 'result': 'failure'})
+        frappe.log_error(str(e), 'Refresh Token Error')
+        return None, None
+
+    new_access_token = ret.get("access_token")
+    new_refresh_token = ret.get("refresh_token")
+
+    # Call save_tokens to update the tokens in the database
+    if new_access_token and new_refresh_token:
+        save_tokens(new_access_token, new_refresh_token, ret.get('expire_in'), id_value, id_type == 'merchant_id')
+        incr('token_refresh', labels={'trigger': 'on_demand', 'result': 'success'})
+        log_sync_event('token_refreshed', id_value, id_type)
+        return new_access_token, new_refresh_token
     else:
-        error = response.json()
-        frappe.log_error(str(error), 'Refresh Token Error')
-        return None, None
\ No newline at end of file
+        incr('token_refresh', labels={'trigger': 'on_demand', 'result': 'failure'})
+        frappe.log_error(_("Failed to obtain new tokens."), 'Token Refresh Error')
+        return None, None
+
+def request_token_refresh(client, id_type, id_value, current_refresh_token):
+    """
+    Call Shopee's access_token/get for one shop or merchant and return the raw response.
+    Does not touch the database, so it is safe to run from worker threads.
+    """
+    path = "/api/v2/auth/access_token/get"
+    body = {id_type: id_value, "refresh_token": current_refresh_token, "partner_id": client.partner_id}
+    # 刷新请求发往店铺/商户所在区域的域名
+    return client.post(path, body=body, host=client.host_for(**{id_type: id_value}))
@@ -1,6 +1,7 @@
 import hmac
 import hashlib
 import frappe
+from concurrent.futures import ThreadPoolExecutor
 
 def generate_signature(partner_id, path, timestamp, partner_key, access_token=None, shop_id=None, merchant_id=None):
     """
@@ -24,6 +25,36 @@ def generate_signature(partner_id, path, timestamp, partner_key, access_token=No
     signature = hmac.new(partner_key.encode(), message.encode(), hashlib.sha256).hexdigest()
     return signature
 
+def normalize_id(value):
+    """
+    Canonical string form of a Shopee shop_id/merchant_id, so ids are always stored and
+    looked up the same way whether they arrive as int, float-like or padded strings.
+    """
+    if value is None:
+        return None
+    value = str(value).strip()
+    if value.endswith('.0'):
+        value = value[:-2]
+    return str(int(value)) if value.isdigit() else value
+
+def map_concurrently(func, items, max_workers):
+    """
+    Call `func(item)` for every item on a bounded thread pool.
+    Returns a list of (item, result, exception) in input order; exceptions are captured, not raised.
+    Worker threads have no Frappe site context, so `func` must only do I/O (e.g. Shopee HTTP calls).
+    """
+    def call(item):
+        try:
+            return item, func(item), None
+        except Exception as e:
+            return item, None, e
+
+    items = list(items)
+    if not items:
+        return []
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(items)))) as executor:
+        return list(executor.map(call, items))
+
 def print_shopee_token_management():
     documents = frappe.get_all('Shopee Token Management', fields=['*'])
     for doc in documents:
@@ -43,4 +74,69 @@ def delete_all_shopee_token_management_records():
 
     frappe.db.commit()  # 确保提交数据库操作
 
+    from .token_cache import clear_token_cache
+    clear_token_cache()
+
     print(f"Deleted {len(records)} records from Shopee Token Management.")
+
+# 应用中所有热点查询，用于检查执行计划是否命中索引
+HOT_PATH_LOOKUPS = {
+    'token by shop_id': ("select name, token_expiry, active from `tabShopee Token Management` where shop_id = %s", ['0']),
+    'token by merchant_id': ("select name, token_expiry, active from `tabShopee Token Management` where merchant_id = %s", ['0']),
+    'encrypted tokens': ("select name, password from `__Auth` where doctype = %s and name = %s and fieldname = %s",
+                         ['Shopee Token Management', '0', 'access_token']),
+    'company by entity_id': ("select name from `tabCompany` where entity_id = %s", ['0']),
+    'company subtree by path': ("select name from `tabCompany` where shopee_hierarchy_path like %s", ['0/%']),
+    'sales order by order_sn': ("select name, shopee_update_time from `tabSales Order` where shopee_order_sn in (%s, %s)", ['0', '1']),
+    'sync cursor by name': ("select `cursor` from `tabShopee Sync Cursor` where name = %s", ['orders-0']),
+    'ready orders by shop and status': ("select name from `tabSales Order` where shopee_order_status = %s and docstatus != 2 "
+                                        "and shopee_shop_id in (%s, %s)", ['READY_TO_SHIP', '0', '1']),
+    'item by shopee ids': ("select name from `tabItem` where shopee_item_id = %s and shopee_model_id = %s", ['0', '0']),
+    'item prices by price list': ("select name, item_code, price_list_rate from `tabItem Price` where price_list = %s "
+                                  "and item_code in (%s, %s)", ['Standard Selling', '0', '1']),
+    'stock by item_code': ("select item_code, sum(actual_qty - reserved_qty) from `tabBin` where item_code in (%s, %s) "
+                           "group by item_code", ['0', '1']),
+    'pending stock deltas': ("select name from `tabShopee Stock Delta` where pending = %s and changed_at <= %s "
+                             "order by changed_at asc limit 1000", [1, '2000-01-01']),
+    'escrow by order_sn': ("select order_sn from `tabShopee Escrow` where order_sn in (%s, %s)", ['0', '1']),
+    'unposted escrow by shop': ("select name from `tabShopee Escrow` where shop_id = %s and journal_entry is null "
+                                "order by release_time asc limit 100", ['0']),
+}
+
+# 以下访问类型本身就是通过主键/唯一索引定位（或读取常量表）得到的
+CONST_ACCESS_TYPES = ('const', 'system')
+# 常量值在唯一索引中不存在时 MariaDB 不再给出 key，而是在 Extra 中给出这些提示
+CONST_LOOKUP_NOTES = ('Impossible WHERE noticed after reading const tables', 'no matching row in const table',
+                      'const row not found')
+
+def plan_uses_index(plan):
+    """
+    True if every row of an EXPLAIN result reads through an index. A primary/unique key lookup
+    of a value that does not exist has no `key` but a const access type or an Extra note.
+    """
+    for row in plan:
+        if row.get('type') in CONST_ACCESS_TYPES or any(note in (row.get('Extra') or '') for note in CONST_LOOKUP_NOTES):
+            continue
+        if not row.get('key') or row.get('type') == 'ALL':
+            return False
+    return True
+
+def check_query_plans():
+    """
+    EXPLAIN every hot-path lookup and report those that do not use an index.
+    Run with: bench --site <site> execute shopee.controllers.utils.check_query_plans
+    """
+    if frappe.db.db_type != 'mariadb':
+        print("Query plan check is only implemented for MariaDB.")
+        return []
+
+    unindexed = []
+    for label, (query, values) in HOT_PATH_LOOKUPS.items():
+        plan = frappe.db.sql(f"explain {query}", values, as_dict=True)
+        if not plan_uses_index(plan):
+            unindexed.append(label)
+            print(f"NO INDEX  {label}: {plan}")
+        else:
+            print(f"ok        {label}: key={', '.join(row.get('key') or row.get('type') or 'const' for row in plan)}")
+
+    return unindexed
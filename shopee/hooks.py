@@ -17,7 +17,25 @@ doc_events = {
         "get_auth_link": "shopee.api.get_auth_link",
     },
     "Company": {
-        "after_insert": "shopee.controllers.shopee_integration.sync_shopee_merchant_info"
+        "after_insert": [
+            "shopee.controllers.company_hierarchy.update_hierarchy_path",
+            "shopee.controllers.region.invalidate_region_cache"
+        ],
+        "on_update": [
+            "shopee.controllers.company_hierarchy.update_hierarchy_path",
+            "shopee.controllers.region.invalidate_region_cache"
+        ],
+        "on_trash": [
+            "shopee.controllers.company_hierarchy.invalidate_hierarchy_cache",
+            "shopee.controllers.region.invalidate_region_cache"
+        ]
+    },
+    "Stock Ledger Entry": {
+        "on_submit": "shopee.controllers.stock_sync.capture_stock_change",
+        "on_cancel": "shopee.controllers.stock_sync.capture_stock_change"
+    },
+    "Bin": {
+        "on_update": "shopee.controllers.stock_sync.capture_stock_change"
     }
 }
 # include js, css files in header of desk.html
@@ -79,7 +97,7 @@ doc_events = {
 # ------------
 
 # before_install = "shopee.install.before_install"
-# after_install = "shopee.install.after_install"
+after_install = "shopee.install.after_install"
 
 # Uninstallation
 # ------------
@@ -144,8 +162,25 @@ doc_events = {
 # Scheduled Tasks
 # ---------------
 scheduler_events = {
+    "all": [
+        "shopee.api.webhook_queue.drain_events",
+        "shopee.api.order_event_batcher.flush_order_events",
+        "shopee.controllers.stock_sync.schedule_flush",
+        "shopee.controllers.shipping_document.retry_ready_documents"
+    ],
+    "cron": {
+        "*/15 * * * *": [
+            "shopee.controllers.order_sync.sync_all_shops"
+        ]
+    },
+    "hourly_long": [
+        "shopee.controllers.item_sync.sync_all_shops"
+    ],
+    "daily_long": [
+        "shopee.controllers.escrow_sync.sync_all_shops"
+    ],
     "weekly": [
-        "shopee.shopee.tasks.refresh_all_tokens"
+        "shopee.tasks.refresh_all_tokens"
     ]
 }
 
@@ -199,11 +234,13 @@ scheduler_events = {
 # ----------------
 # before_request = ["shopee.utils.before_request"]
 # after_request = ["shopee.utils.after_request"]
+after_request = ["shopee.controllers.metrics.flush"]
 
 # Job Events
 # ----------
 # before_job = ["shopee.utils.before_job"]
 # after_job = ["shopee.utils.after_job"]
+after_job = ["shopee.controllers.metrics.flush"]
 
 # User Data Protection
 # --------------------
@@ -242,4 +279,7 @@ scheduler_events = {
 # default_log_clearing_doctypes = {
 # 	"Logging DocType Name": 30  # days to retain logs
 # }
+default_log_clearing_doctypes = {
+    "Shopee Sync Log": 30
+}
 
@@ -1,7 +1,61 @@
 import frappe
+from frappe.custom.doctype.custom_field.custom_field import create_custom_fields
+
+COMPANY_STATUS_OPTIONS = 'Cross-Border\nCNSC\nKRSC\nUNUPGRADED\nSIP\nPure-FBS\nPure-3PF\nPFF-FBS\nPFF-3PF\nOthers\nUnknown'
+
+# 本应用在标准 DocType 上添加的全部自定义字段。after_install 与各个补丁共用这一份定义，
+# 因此全新安装（补丁会被直接标记为已完成）与升级后的站点字段一致。
+SALES_ORDER_FIELD_DEFAULTS = {'read_only': 1, 'allow_on_submit': 1, 'no_copy': 1}
+CUSTOM_FIELDS = {
+    'Company': [
+        {'fieldname': 'entity_name', 'label': 'Entity Name', 'fieldtype': 'Data', 'insert_after': 'country',
+         'in_list_view': 1, 'no_copy': 1},
+        {'fieldname': 'entity_id', 'label': 'Entity ID', 'fieldtype': 'Data', 'insert_after': 'entity_name',
+         'search_index': 1, 'in_list_view': 1, 'no_copy': 1},
+        {'fieldname': 'status', 'label': 'Status', 'fieldtype': 'MultiSelect', 'options': COMPANY_STATUS_OPTIONS,
+         'insert_after': 'entity_id', 'in_list_view': 1, 'no_copy': 1},
+        {'fieldname': 'authorization_time', 'label': 'Authorization Time', 'fieldtype': 'Datetime',
+         'insert_after': 'status', 'in_list_view': 1, 'no_copy': 1},
+        {'fieldname': 'authorization_expiry_time', 'label': 'Authorization Expiry Time', 'fieldtype': 'Datetime',
+         'insert_after': 'authorization_time', 'in_list_view': 1, 'no_copy': 1},
+        {'fieldname': 'is_authorized', 'label': 'Is Authorized', 'fieldtype': 'Check',
+         'insert_after': 'authorization_expiry_time', 'in_list_view': 1, 'no_copy': 1},
+        {'fieldname': 'shopee_hierarchy_path', 'label': 'Shopee Hierarchy Path', 'fieldtype': 'Data', 'length': 700,
+         'insert_after': 'is_authorized', 'read_only': 1, 'hidden': 1, 'search_index': 1, 'no_copy': 1},
+    ],
+    'Sales Order': [
+        dict(SALES_ORDER_FIELD_DEFAULTS, **field) for field in [
+            {'fieldname': 'shopee_order_sn', 'label': 'Shopee Order SN', 'fieldtype': 'Data', 'insert_after': 'po_no', 'unique': 1},
+            {'fieldname': 'shopee_shop_id', 'label': 'Shopee Shop ID', 'fieldtype': 'Data', 'insert_after': 'shopee_order_sn', 'search_index': 1},
+            {'fieldname': 'shopee_order_status', 'label': 'Shopee Order Status', 'fieldtype': 'Data', 'insert_after': 'shopee_shop_id', 'search_index': 1},
+            {'fieldname': 'shopee_update_time', 'label': 'Shopee Update Time', 'fieldtype': 'Int', 'insert_after': 'shopee_order_status'},
+            {'fieldname': 'shopee_tracking_number', 'label': 'Shopee Tracking Number', 'fieldtype': 'Data', 'insert_after': 'shopee_update_time'},
+            {'fieldname': 'shopee_package_number', 'label': 'Shopee Package Number', 'fieldtype': 'Data', 'insert_after': 'shopee_tracking_number'},
+            {'fieldname': 'shopee_logistics_channel_id', 'label': 'Shopee Logistics Channel', 'fieldtype': 'Data', 'insert_after': 'shopee_package_number'},
+            {'fieldname': 'shopee_document_status', 'label': 'Shopee Shipping Document Status', 'fieldtype': 'Data', 'insert_after': 'shopee_logistics_channel_id'},
+            {'fieldname': 'shopee_shipping_document', 'label': 'Shopee Shipping Document', 'fieldtype': 'Attach', 'insert_after': 'shopee_document_status'},
+            {'fieldname': 'shopee_ship_error', 'label': 'Shopee Ship Error', 'fieldtype': 'Small Text', 'insert_after': 'shopee_shipping_document'},
+        ]
+    ],
+    'Item': [
+        {'fieldname': 'shopee_item_id', 'label': 'Shopee Item ID', 'fieldtype': 'Data', 'insert_after': 'item_group',
+         'search_index': 1, 'read_only': 1, 'no_copy': 1},
+        {'fieldname': 'shopee_model_id', 'label': 'Shopee Model ID', 'fieldtype': 'Data', 'insert_after': 'shopee_item_id',
+         'read_only': 1, 'no_copy': 1},
+        {'fieldname': 'shopee_shop_id', 'label': 'Shopee Shop ID', 'fieldtype': 'Data', 'insert_after': 'shopee_model_id',
+         'read_only': 1, 'no_copy': 1},
+    ],
+}
 
 def after_install():
     create_shopee_token_management_doctype()
+    create_shopee_custom_fields()
+
+def create_shopee_custom_fields():
+    """
+    Create (or update) every custom field in CUSTOM_FIELDS. Idempotent; used by after_install and the patches.
+    """
+    create_custom_fields(CUSTOM_FIELDS, update=True)
 
 def create_shopee_token_management_doctype():
     # Check if the Doctype already exists
@@ -14,8 +68,8 @@ def create_shopee_token_management_doctype():
             'custom': 1,
             'is_submittable': 0,
             'fields': [
-                {'label': 'Merchant ID', 'fieldname': 'merchant_id', 'fieldtype': 'Data'},
-                {'label': 'Shop ID', 'fieldname': 'shop_id', 'fieldtype': 'Data'},
+                {'label': 'Merchant ID', 'fieldname': 'merchant_id', 'fieldtype': 'Data', 'unique': 1},
+                {'label': 'Shop ID', 'fieldname': 'shop_id', 'fieldtype': 'Data', 'unique': 1},
                 {'label': 'Access Token', 'fieldname': 'access_token', 'fieldtype': 'Password'},
                 {'label': 'Refresh Token', 'fieldname': 'refresh_token', 'fieldtype': 'Password'},
                 {'label': 'Token Expiry', 'fieldname': 'token_expiry', 'fieldtype': 'Int'},
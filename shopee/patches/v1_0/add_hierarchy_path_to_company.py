@@ -0,0 +1,27 @@
+import frappe
+from shopee.controllers.company_hierarchy import PATH_FIELD, CACHE_KEY, path_segment, join_path
+
+def execute():
+    # shopee_hierarchy_path is created by create_shopee_custom_fields, which runs first
+    backfill_hierarchy_paths()
+
+def backfill_hierarchy_paths():
+    """
+    Compute the materialized path of every existing Company in memory and write them in bulk.
+    """
+    parents = {row.name: row.parent_company for row in frappe.get_all('Company', fields=['name', 'parent_company'])}
+    paths = {}
+
+    def path_of(name, seen=()):
+        if name not in paths:
+            parent = parents.get(name)
+            if parent and parent in parents and parent not in seen:
+                paths[name] = join_path(path_of(parent, seen + (name,)), name)
+            else:
+                paths[name] = path_segment(name)
+        return paths[name]
+
+    updates = {name: {PATH_FIELD: path_of(name)} for name in parents}
+    if updates:
+        frappe.db.bulk_update('Company', updates, update_modified=False)
+    frappe.cache().delete_value(CACHE_KEY)
@@ -0,0 +1,64 @@
+import frappe
+from shopee.controllers.utils import normalize_id
+from shopee.install import create_shopee_custom_fields
+
+def execute():
+    """
+    Runs before model sync: normalize stored shop/merchant ids and remove duplicate token rows,
+    so the unique constraints declared on Shopee Token Management can be created, then index
+    Company.entity_id through its custom field (search_index in install.CUSTOM_FIELDS).
+    """
+    if frappe.db.table_exists('Shopee Token Management'):
+        normalize_token_identifiers()
+        remove_duplicate_tokens()
+
+    if frappe.db.has_column('Company', 'entity_id'):
+        normalize_company_entity_ids()
+        create_shopee_custom_fields()
+
+def normalize_token_identifiers():
+    updates = {}
+    for row in frappe.get_all('Shopee Token Management', fields=['name', 'shop_id', 'merchant_id']):
+        values = {}
+        for field in ('shop_id', 'merchant_id'):
+            normalized = normalize_id(row[field]) or None
+            if normalized != row[field]:
+                values[field] = normalized
+        if values:
+            updates[row.name] = values
+    if updates:
+        frappe.db.bulk_update('Shopee Token Management', updates, update_modified=False)
+        print(f"Normalized identifiers of {len(updates)} Shopee Token Management records")
+
+def remove_duplicate_tokens():
+    """
+    Keep only the most recently refreshed token row per shop_id/merchant_id.
+    """
+    duplicates = []
+    for field in ('shop_id', 'merchant_id'):
+        seen = set()
+        rows = frappe.get_all('Shopee Token Management', filters={field: ['is', 'set']},
+                              fields=['name', field], order_by='last_refreshed desc, modified desc')
+        for row in rows:
+            if row[field] in seen:
+                duplicates.append(row.name)
+            seen.add(row[field])
+
+    if duplicates:
+        Token = frappe.qb.DocType('Shopee Token Management')
+        frappe.qb.from_(Token).delete().where(Token.name.isin(duplicates)).run()
+        Auth = frappe.qb.Table('__Auth')
+        frappe.qb.from_(Auth).delete().where(
+            (Auth.doctype == 'Shopee Token Management') & Auth.name.isin(duplicates)
+        ).run()
+        print(f"Removed {len(duplicates)} duplicate Shopee Token Management records")
+
+def normalize_company_entity_ids():
+    updates = {}
+    for row in frappe.get_all('Company', filters={'entity_id': ['is', 'set']}, fields=['name', 'entity_id']):
+        normalized = normalize_id(row.entity_id)
+        if normalized != row.entity_id:
+            updates[row.name] = {'entity_id': normalized}
+    if updates:
+        frappe.db.bulk_update('Company', updates, update_modified=False)
+        print(f"Normalized entity_id of {len(updates)} Company records")
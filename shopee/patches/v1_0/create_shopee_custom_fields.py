@@ -0,0 +1,8 @@
+from shopee.install import create_shopee_custom_fields
+
+def execute():
+    """
+    Create or update every custom field in install.CUSTOM_FIELDS (Company, Sales Order, Item).
+    Fresh installs get the same fields from after_install.
+    """
+    create_shopee_custom_fields()
@@ -0,0 +1,11 @@
+import frappe
+from frappe.model.document import Document
+
+class ShopeeSyncLog(Document):
+    @staticmethod
+    def clear_old_logs(days=30):
+        """
+        Called by Log Settings (see default_log_clearing_doctypes in hooks.py).
+        """
+        from shopee.controllers.audit import prune_sync_log
+        prune_sync_log(days=days)
@@ -1,25 +1,129 @@
+import time
 import frappe
+from contextlib import ExitStack
 from datetime import datetime, timedelta
-from .controllers.token_management import refresh_token  # 确保导入路径正确
+from frappe.utils import cint
+from .controllers.client import get_client
+from .controllers.locks import distributed_lock
+from .controllers.metrics import incr, observe, HANDLER_BUCKETS
+from .controllers.audit import log_sync_event
+from .controllers.token_cache import get_decrypted_tokens
+from .controllers.token_management import request_token_refresh, bulk_upsert_tokens
+from .controllers.utils import map_concurrently
 
-PARTNER_ID = frappe.local.conf.get('shopee_partner_id', '')
-PARTNER_KEY = frappe.local.conf.get('shopee_partner_key', '')
+# 并发刷新的默认线程数，可通过 site_config 的 shopee_refresh_workers 覆盖
+DEFAULT_REFRESH_WORKERS = 8
+# 每批持有锁并在一个事务中写入的令牌数
+REFRESH_CHUNK_SIZE = 200
+# 一批刷新期间持有 token_refresh 锁的上限（秒）
+REFRESH_CHUNK_LOCK_TIMEOUT = 300
 
-def refresh_all_tokens():
+def refresh_all_tokens(max_workers=None):
     """
     每周检查并刷新即将过期的所有 refresh_tokens。
+
+    HTTP 刷新在有界线程池中并发执行，结果按批在单个事务中写回。
+    Returns a summary dict with the number of refreshed/failed/skipped tokens and the elapsed time.
     """
+    start = time.monotonic()
+    max_workers = cint(max_workers or frappe.local.conf.get('shopee_refresh_workers')) or DEFAULT_REFRESH_WORKERS
+
     tokens = frappe.get_all('Shopee Token Management',
                             fields=['name', 'shop_id', 'merchant_id', 'refresh_token', 'last_refreshed', 'active'],
                             filters={'active': 1})
-    
+
     one_week_from_now = datetime.now() + timedelta(days=7)  # 计算从现在起一周后的时间
-    for token in tokens:
-        # 计算 refresh_token 的实际过期时间
-        refresh_token_expiry = token['last_refreshed'] + timedelta(days=30)
-        
-        if refresh_token_expiry < one_week_from_now:
-            print("Need to refresh")
+    # 计算 refresh_token 的实际过期时间
+    due = [token for token in tokens
+           if not token['last_refreshed'] or token['last_refreshed'] + timedelta(days=30) < one_week_from_now]
+
+    summary = {'total': len(due), 'refreshed': 0, 'failed': 0, 'skipped': 0}
+    if due:
+        # 在主线程中解析凭据，线程池中的请求不依赖站点上下文
+        client = get_client()
+        for i in range(0, len(due), REFRESH_CHUNK_SIZE):
+            chunk_summary = refresh_token_chunk(client, due[i:i + REFRESH_CHUNK_SIZE], max_workers)
+            for key, value in chunk_summary.items():
+                summary[key] += value
+
+    summary['elapsed'] = round(time.monotonic() - start, 3)
+    incr('token_refresh', summary['refreshed'], {'trigger': 'scheduled', 'result': 'success'})
+    incr('token_refresh', summary['failed'], {'trigger': 'scheduled', 'result': 'failure'})
+    observe('job_seconds', summary['elapsed'], {'job': 'refresh_all_tokens'}, HANDLER_BUCKETS)
+    frappe.logger("shopee").info(f"refresh_all_tokens: {summary}")
+    log_sync_event('scheduled_token_refresh', message=str(summary))
+    return summary
+
+def refresh_token_chunk(client, tokens, max_workers):
+    """
+    Refresh one chunk of tokens concurrently and write every successful result in one transaction.
+
+    Each token's refresh lock is taken without waiting; tokens currently being refreshed by
+    ensure_valid_access_token are skipped rather than refreshed twice.
+    """
+    summary = {'refreshed': 0, 'failed': 0, 'skipped': 0}
+    with ExitStack() as stack:
+        locked = []
+        for token in tokens:
             id_type = 'shop_id' if token['shop_id'] else 'merchant_id'
             id_value = token['shop_id'] if token['shop_id'] else token['merchant_id']
-            refresh_token(id_type, id_value, token['refresh_token'])
+            acquired = stack.enter_context(distributed_lock(f"token_refresh:{id_type}:{id_value}",
+                                                            timeout=REFRESH_CHUNK_LOCK_TIMEOUT, blocking_timeout=0,
+                                                            metric='token_refresh_lock'))
+            if acquired:
+                locked.append((token['name'], id_type, id_value))
+            else:
+                summary['skipped'] += 1
+
+        # 持锁后再读取最新的 refresh_token（一次查询）
+        refresh_tokens = get_decrypted_tokens([name for name, _, _ in locked], 'refresh_token')
+        jobs = [job for job in locked if refresh_tokens.get(job[0])]
+        summary['failed'] += len(locked) - len(jobs)
+
+        results = map_concurrently(
+            lambda job: request_token_refresh(client, job[1], job[2], refresh_tokens[job[0]]),
+            jobs, max_workers)
+
+        errors = []
+        refreshed = []
+        for (name, id_type, id_value), ret, error in results:
+            if error or not (ret.get('access_token') and ret.get('refresh_token')):
+                errors.append(f"{id_type} {id_value}: {error or ret}")
+                continue
+            refreshed.append({'identifier': id_value, 'is_merchant': id_type == 'merchant_id',
+                              'access_token': ret['access_token'], 'refresh_token': ret['refresh_token'],
+                              'expire_in': ret.get('expire_in')})
+
+        # 单个事务批量写回（同时提交并使缓存失效）；仍持有锁
+        lost = persist_refreshed_tokens(refreshed)
+        errors.extend(lost)
+
+        summary['refreshed'] += len(refreshed) - len(lost)
+        summary['failed'] += len(errors)
+        if errors:
+            frappe.log_error("\n".join(errors), 'Refresh Token Error')
+
+    return summary
+
+def persist_refreshed_tokens(refreshed):
+    """
+    Write tokens Shopee has already rotated: one bulk upsert, falling back to one commit per
+    token if the bulk write fails, so a single bad row cannot lose the whole chunk.
+    Returns an error line for every token that could not be saved.
+    """
+    try:
+        bulk_upsert_tokens(refreshed)
+        return []
+    except Exception:
+        frappe.db.rollback()
+        frappe.log_error(frappe.get_traceback(), 'Refresh Token Error')
+
+    lost = []
+    for token in refreshed:
+        try:
+            bulk_upsert_tokens([token])
+        except Exception as e:
+            frappe.db.rollback()
+            id_type = 'merchant_id' if token['is_merchant'] else 'shop_id'
+            lost.append(f"{id_type} {token['identifier']}: refreshed but not saved, re-authorization needed ({e})")
+    return lost